@@ -0,0 +1,355 @@
+"""
+Pluggable inference backends
+The plate detector and text recognizer are selected by name, so the
+PyTorch/Paddle stacks are only imported when their backend is used:
+
+    detector:   'ultralytics' (YOLO .pt), 'onnx' (ONNX Runtime) or 'stub'
+    recognizer: 'paddle' (PaddleOCR), 'onnx' (ONNX Runtime) or 'stub'
+
+ONNX models are produced by export_models.py; quantized=True loads the
+INT8 variants written by its --quantize option. The stub backends need no
+model files and read the synthetic plates drawn by benchmark.py
+"""
+
+import math
+import os
+
+import cv2
+import numpy as np
+
+
+# Module each backend imports on construction, for startup timing
+DETECTOR_MODULES = {
+    'ultralytics': 'ultralytics',
+    'onnx': 'onnxruntime',
+    'stub': 'cv2'
+}
+
+RECOGNIZER_MODULES = {
+    'paddle': 'paddleocr',
+    'onnx': 'onnxruntime',
+    'stub': 'cv2'
+}
+
+# Synthetic plates are filled with STUB_PLATE_LEVEL + STUB_LEVEL_STEP * k
+# for plate k, which StubRecognizer reads back as f"STUB{k}"
+STUB_PLATE_LEVEL = 190
+STUB_LEVEL_STEP = 6
+
+
+def cached_model_path(model_path, cache_dir, runtime_version):
+    """Cache file of a model's optimized graph, keyed by source file and runtime version"""
+    stat = os.stat(model_path)
+    name = os.path.splitext(os.path.basename(model_path))[0]
+    return os.path.join(cache_dir, f"{name}-{stat.st_size}-{int(stat.st_mtime)}-ort{runtime_version}.onnx")
+
+
+def create_session(model_path, intra_op_threads=0, inter_op_threads=0, providers=None, cache_dir=None):
+    """ONNX Runtime session; 0 threads lets the runtime decide
+
+    providers defaults to CPU; pass ['OpenVINOExecutionProvider'] to run on
+    an onnxruntime-openvino build. With a cache_dir the optimized graph is
+    saved on first load and reused on later launches without re-optimizing.
+    """
+    import onnxruntime as ort
+
+    def session(path, level, optimized_path=None):
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = intra_op_threads
+        options.inter_op_num_threads = inter_op_threads
+        options.graph_optimization_level = level
+        if optimized_path:
+            options.optimized_model_filepath = optimized_path
+        return ort.InferenceSession(path, sess_options=options, providers=providers or ['CPUExecutionProvider'])
+
+    if cache_dir:
+        cached = cached_model_path(model_path, cache_dir, ort.__version__)
+        if os.path.exists(cached):
+            try:
+                return session(cached, ort.GraphOptimizationLevel.ORT_ENABLE_ALL)
+            except Exception:
+                # Truncated or stale cache entry, rebuild it below
+                os.remove(cached)
+        # Only hardware-independent passes are saved; layout passes rerun on load
+        os.makedirs(cache_dir, exist_ok=True)
+        session(model_path, ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED, cached)
+        model_path = cached
+    return session(model_path, ort.GraphOptimizationLevel.ORT_ENABLE_ALL)
+
+
+def quantized_path(model_path):
+    """Where export_models.py --quantize writes the INT8 variant of a model"""
+    return os.path.splitext(model_path)[0] + '.int8.onnx'
+
+
+def letterbox(image, size, pad_value=114):
+    """Resize keeping aspect ratio and pad to size x size, returns (image, scale, (pad_x, pad_y))"""
+    h, w = image.shape[:2]
+    scale = min(size / h, size / w)
+    new_w, new_h = int(round(w * scale)), int(round(h * scale))
+    pad_x, pad_y = (size - new_w) // 2, (size - new_h) // 2
+    canvas = np.full((size, size, 3), pad_value, dtype=np.uint8)
+    canvas[pad_y:pad_y + new_h, pad_x:pad_x + new_w] = cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    return canvas, scale, (pad_x, pad_y)
+
+
+def clip_boxes(boxes, shape):
+    """xyxy boxes clipped to an image of shape, as ultralytics does"""
+    height, width = shape[:2]
+    boxes[:, 0::2] = boxes[:, 0::2].clip(0, width)
+    boxes[:, 1::2] = boxes[:, 1::2].clip(0, height)
+    return boxes
+
+
+class UltralyticsDetector:
+    """YOLOv8 plate detector run through ultralytics/PyTorch"""
+
+    def __init__(self, model_path="license_plate_detector.pt"):
+        from ultralytics import YOLO
+
+        self.model = YOLO(model_path)
+
+    def detect(self, images, imgsz):
+        """(N, 4) float xyxy boxes per image"""
+        results = self.model(images, imgsz=imgsz, verbose=False)
+        return [
+            result.boxes.xyxy.cpu().numpy() if result.boxes is not None else np.zeros((0, 4))
+            for result in results
+        ]
+
+
+class OnnxDetector:
+    """YOLOv8 plate detector exported to ONNX, run with ONNX Runtime
+
+    Applies the same letterbox preprocessing, confidence filter and NMS
+    as ultralytics so boxes agree with UltralyticsDetector.
+    """
+
+    def __init__(self, model_path="license_plate_detector.onnx", conf_threshold=0.25, iou_threshold=0.7,
+                 intra_op_threads=0, inter_op_threads=0, providers=None, quantized=False, cache_dir=None):
+        if quantized:
+            model_path = quantized_path(model_path)
+        self.session = create_session(model_path, intra_op_threads, inter_op_threads, providers, cache_dir)
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        self.dynamic_batch = not isinstance(model_input.shape[0], int)
+        self.fixed_size = model_input.shape[2] if isinstance(model_input.shape[2], int) else None
+        self.conf_threshold = conf_threshold
+        self.iou_threshold = iou_threshold
+
+    def detect(self, images, imgsz):
+        """(N, 4) float xyxy boxes per image"""
+        blob, prepared = self.preprocess(images, imgsz)
+        if self.dynamic_batch:
+            outputs = self.session.run(None, {self.input_name: blob})[0]
+        else:
+            outputs = np.concatenate([self.session.run(None, {self.input_name: blob[i:i + 1]})[0]
+                                      for i in range(len(blob))])
+        return [self._postprocess(output, scale, pad, image.shape)
+                for output, (scale, pad), image in zip(outputs, prepared, images)]
+
+    def preprocess(self, images, imgsz):
+        """NCHW float RGB blob and the (scale, pad) of each image"""
+        size = self.fixed_size or imgsz
+        prepared = [letterbox(image, size) for image in images]
+        blob = np.stack([canvas for canvas, _, _ in prepared])
+        blob = np.ascontiguousarray(blob[..., ::-1].transpose(0, 3, 1, 2), dtype=np.float32) / 255.0
+        return blob, [(scale, pad) for _, scale, pad in prepared]
+
+    def _postprocess(self, output, scale, pad, shape):
+        # YOLOv8 heads emit (4 + classes, anchors) with centre-size boxes
+        predictions = output.T
+        scores = predictions[:, 4:].max(axis=1)
+        keep = scores > self.conf_threshold
+        predictions, scores = predictions[keep], scores[keep]
+        if not len(predictions):
+            return np.zeros((0, 4))
+
+        cx, cy, w, h = predictions[:, 0], predictions[:, 1], predictions[:, 2], predictions[:, 3]
+        indices = cv2.dnn.NMSBoxes(
+            np.stack([cx - w / 2, cy - h / 2, w, h], axis=1).tolist(), scores.tolist(),
+            self.conf_threshold, self.iou_threshold
+        )
+        indices = np.asarray(indices, dtype=np.int64).reshape(-1)
+        boxes = np.stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], axis=1)[indices]
+        return clip_boxes((boxes - (pad[0], pad[1], pad[0], pad[1])) / scale, shape)
+
+
+class PaddleRecognizer:
+    """PaddleOCR angle classifier + text recognizer
+
+    recognize() reads crops with the classifier and recognizer only.
+    Crops narrower than det_max_aspect times their height may hold two
+    text lines or padding around the plate; needs_detection() flags them
+    so they are read() with PaddleOCR's text detection pass as well, and
+    its first line is kept as the per-crop ocr() path did. None never
+    runs detection.
+    """
+
+    def __init__(self, batch_size=8, det_max_aspect=2.0):
+        from paddleocr import PaddleOCR
+
+        self.ocr = PaddleOCR(use_angle_cls=True, lang='en', rec_batch_num=batch_size)
+        self.det_max_aspect = det_max_aspect
+
+    def needs_detection(self, image):
+        """Whether a full-size crop should go through read() instead of recognize()"""
+        h, w = image.shape[:2]
+        return self.det_max_aspect is not None and w < self.det_max_aspect * h
+
+    def read(self, image):
+        """(text, confidence) of the first line PaddleOCR.ocr() finds in one crop"""
+        result = self.ocr.ocr(image, cls=True)
+        if result and result[0]:
+            text, confidence = result[0][0][1]
+            return text, float(confidence)
+        return '', 0.0
+
+    def recognize(self, images):
+        """(text, confidence) per plate image"""
+        if self.ocr.use_angle_cls:
+            images, _, _ = self.ocr.text_classifier(images)
+        rec_res, _ = self.ocr.text_recognizer(images)
+        return [(text, float(confidence)) for text, confidence in rec_res]
+
+
+class OnnxRecognizer:
+    """PP-OCR text recognizer exported to ONNX, run with ONNX Runtime
+
+    Reproduces PaddleOCR's resize/normalize preprocessing and CTC greedy
+    decoding. The angle classifier is not run: plate crops come from an
+    upright camera, so it only adds cost.
+    """
+
+    def __init__(self, model_path="plate_recognizer.onnx", dict_path="plate_recognizer_dict.txt",
+                 use_space_char=True, image_height=48, min_width=320,
+                 intra_op_threads=0, inter_op_threads=0, providers=None, quantized=False, cache_dir=None):
+        if quantized:
+            model_path = quantized_path(model_path)
+        self.session = create_session(model_path, intra_op_threads, inter_op_threads, providers, cache_dir)
+        self.input_name = self.session.get_inputs()[0].name
+        with open(dict_path, encoding='utf-8') as f:
+            characters = [line.rstrip('\r\n') for line in f]
+        if use_space_char:
+            characters.append(' ')
+        # CTC blank is index 0
+        self.characters = [''] + characters
+        self.image_height = image_height
+        self.min_width = min_width
+
+    def recognize(self, images):
+        """(text, confidence) per plate image"""
+        if not images:
+            return []
+        probs = self.session.run(None, {self.input_name: self.preprocess(images)})[0]
+        return [self._decode(sequence) for sequence in probs]
+
+    def preprocess(self, images):
+        """Height-normalized, right-padded NCHW batch as PaddleOCR builds it"""
+        ratios = [image.shape[1] / image.shape[0] for image in images]
+        width = max(self.min_width, int(math.ceil(self.image_height * max(ratios))))
+        batch = np.zeros((len(images), 3, self.image_height, width), dtype=np.float32)
+        for index, (image, ratio) in enumerate(zip(images, ratios)):
+            resized_w = min(width, int(math.ceil(self.image_height * ratio)))
+            resized = cv2.resize(image, (resized_w, self.image_height)).astype(np.float32)
+            batch[index, :, :, :resized_w] = ((resized / 255.0 - 0.5) / 0.5).transpose(2, 0, 1)
+        return batch
+
+    def _decode(self, sequence):
+        indices = sequence.argmax(axis=1)
+        scores = sequence.max(axis=1)
+        keep = indices != 0
+        keep[1:] &= indices[1:] != indices[:-1]
+        if not keep.any():
+            return '', 0.0
+        text = ''.join(self.characters[index] for index in indices[keep] if index < len(self.characters))
+        return text, float(scores[keep].mean())
+
+
+class StubDetector:
+    """Model-free detector of bright plate-shaped boxes, for benchmarks on CPU
+
+    Letterboxes and normalizes the batch like OnnxDetector, runs layers
+    3x3 convolutions over it in place of a network, then thresholds the
+    letterboxed image and keeps boxes with a plate-like aspect ratio.
+    Deterministic, so runs on the same machine are comparable.
+    """
+
+    def __init__(self, threshold=STUB_PLATE_LEVEL - STUB_LEVEL_STEP // 2, min_width=12, layers=4):
+        self.threshold = threshold
+        self.min_width = min_width
+        self.layers = layers
+        self.kernel = np.full((3, 3), 1.0 / 9.0, dtype=np.float32)
+
+    def detect(self, images, imgsz):
+        """(N, 4) float xyxy boxes per image"""
+        results = []
+        for image in images:
+            canvas, scale, (pad_x, pad_y) = letterbox(image, imgsz)
+            features = canvas.astype(np.float32) / 255.0
+            for _ in range(self.layers):
+                features = cv2.filter2D(features, -1, self.kernel)
+            gray = cv2.cvtColor(canvas, cv2.COLOR_BGR2GRAY)
+            _, mask = cv2.threshold(gray, self.threshold, 255, cv2.THRESH_BINARY)
+            contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+            boxes = []
+            for contour in contours:
+                x, y, w, h = cv2.boundingRect(contour)
+                if w >= self.min_width and 1.5 <= w / h <= 8.0:
+                    boxes.append([x, y, x + w, y + h])
+            boxes = np.array(boxes, dtype=np.float64).reshape(-1, 4)
+            results.append(clip_boxes((boxes - (pad_x, pad_y, pad_x, pad_y)) / scale, image.shape))
+        return results
+
+
+class StubRecognizer:
+    """Model-free recognizer of the synthetic plates drawn by benchmark.py
+
+    Builds the same normalized batch as OnnxRecognizer, then reads plate
+    k from the median brightness of its crop.
+    """
+
+    def __init__(self, image_height=48, min_width=320):
+        self.image_height = image_height
+        self.min_width = min_width
+
+    def recognize(self, images):
+        """(text, confidence) per plate image"""
+        if not images:
+            return []
+        width = max(self.min_width, max(int(math.ceil(self.image_height * image.shape[1] / image.shape[0]))
+                                        for image in images))
+        batch = np.zeros((len(images), self.image_height, width, 3), dtype=np.float32)
+        results = []
+        for index, image in enumerate(images):
+            resized_w = min(width, int(math.ceil(self.image_height * image.shape[1] / image.shape[0])))
+            batch[index, :, :resized_w] = cv2.resize(image, (resized_w, self.image_height)) / 127.5 - 1.0
+            level = (np.median(batch[index, :, :resized_w]) + 1.0) * 127.5
+            plate = int(round((level - STUB_PLATE_LEVEL) / STUB_LEVEL_STEP))
+            results.append((f"STUB{plate}", 0.9) if plate >= 0 else ('', 0.0))
+        return results
+
+
+DETECTOR_BACKENDS = {
+    'ultralytics': UltralyticsDetector,
+    'onnx': OnnxDetector,
+    'stub': StubDetector
+}
+
+RECOGNIZER_BACKENDS = {
+    'paddle': PaddleRecognizer,
+    'onnx': OnnxRecognizer,
+    'stub': StubRecognizer
+}
+
+
+def create_detector(name, **options):
+    if name not in DETECTOR_BACKENDS:
+        raise ValueError(f"Unknown detector backend: {name}")
+    return DETECTOR_BACKENDS[name](**options)
+
+
+def create_recognizer(name, **options):
+    if name not in RECOGNIZER_BACKENDS:
+        raise ValueError(f"Unknown recognizer backend: {name}")
+    return RECOGNIZER_BACKENDS[name](**options)
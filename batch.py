@@ -0,0 +1,552 @@
+"""
+Offline batch processing
+Runs detection, tracking and OCR over recorded videos and image folders
+without the UI, as fast as the machine allows:
+
+    python batch.py recordings/ --output plates.csv
+    python batch.py day1.mp4 day2.mp4 --output plates.parquet --detector-backend onnx --recognizer-backend onnx
+    python batch.py stills/ --output plates.jsonl --decoders 2
+
+Progress is checkpointed next to the output, so running the same command
+again after an interruption continues where it stopped
+"""
+
+import argparse
+import collections
+import csv
+import importlib.util
+import json
+import os
+import queue
+import sys
+import threading
+import time
+
+import cv2
+
+from backends import DETECTOR_MODULES, RECOGNIZER_MODULES
+from detector import LicensePlateDetector
+from metrics import pipeline_metrics
+from ocr_scheduler import OcrScheduler
+from pipeline import BoundedQueue, BLOCK
+from tracker import PlateTracker
+
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mkv', '.mov', '.m4v', '.ts', '.webm', '.flv')
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp', '.tif', '.tiff')
+
+FIELDS = ('source', 'frame', 'time', 'track_id', 'text', 'confidence', 'x', 'y', 'w', 'h',
+          'first_seen', 'last_seen')
+
+# Stages reported at the end, in pipeline order
+REPORT_STAGES = ('decode', 'wait', 'detect', 'track', 'crop', 'ocr', 'write')
+
+Frame = collections.namedtuple('Frame', ['source', 'index', 'time', 'image'])
+SourceEnd = collections.namedtuple('SourceEnd', ['source', 'error'])
+
+
+class Source:
+    """A video file, or the sorted images of one folder
+
+    Frames of a video are numbered from 0 and timed from its frame rate;
+    images are numbered by their position in the folder and untimed.
+    """
+
+    def __init__(self, name, images=None):
+        self.name = name
+        self.images = images
+
+    @property
+    def is_video(self):
+        return self.images is None
+
+
+def find_sources(inputs):
+    """Videos and image folders under the given files and directories"""
+    sources = []
+    for path in inputs:
+        if not os.path.isdir(path):
+            if path.lower().endswith(IMAGE_EXTENSIONS):
+                sources.append(Source(path, [path]))
+            else:
+                sources.append(Source(path))
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            files.sort()
+            sources.extend(Source(os.path.join(root, name)) for name in files
+                           if name.lower().endswith(VIDEO_EXTENSIONS))
+            images = [os.path.join(root, name) for name in files if name.lower().endswith(IMAGE_EXTENSIONS)]
+            if images:
+                sources.append(Source(root, images))
+    return sources
+
+
+class BatchProgress:
+    """Checkpoint of a batch run, saved atomically as JSON
+
+    Records, per source, the next frame to process and whether it is
+    done, plus how many bytes of the output belong to processed frames;
+    rows written after the last checkpoint are truncated on resume. The
+    tracks open at the checkpoint are saved with it, per video.
+    """
+
+    def __init__(self, path, resume=True):
+        self.path = path
+        self.offset = 0
+        self.sources = {}
+        self.tracks = {}
+        if resume and os.path.exists(path):
+            with open(path) as f:
+                state = json.load(f)
+            self.offset = state.get('offset', 0)
+            self.sources = state.get('sources', {})
+            self.tracks = state.get('tracks', {})
+
+    def done(self, name):
+        return self.sources.get(name, {}).get('done', False)
+
+    def next_frame(self, name):
+        return self.sources.get(name, {}).get('next_frame', 0)
+
+    def update(self, name, next_frame=None, done=False, error=None):
+        entry = self.sources.setdefault(name, {'next_frame': 0, 'done': False})
+        if next_frame is not None:
+            entry['next_frame'] = next_frame
+        if done:
+            entry['done'] = True
+        if error:
+            entry['error'] = error
+
+    def save(self, offset, tracks=None):
+        self.offset = offset
+        if tracks is not None:
+            self.tracks = tracks
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump({'offset': offset, 'sources': self.sources, 'tracks': self.tracks}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.path)
+
+
+class CsvWriter:
+    """Detection rows appended to a CSV file from a byte offset on"""
+
+    def __init__(self, path, offset=0):
+        self.path = path
+        self.file = _open_at(path, offset)
+        self.writer = csv.DictWriter(self.file, FIELDS)
+        if offset == 0:
+            self.writer.writeheader()
+
+    def write(self, rows):
+        self.writer.writerows(rows)
+
+    def flush(self):
+        """Make the rows durable, returns the output size to checkpoint"""
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        return os.fstat(self.file.fileno()).st_size
+
+    def close(self):
+        offset = self.flush()
+        self.file.close()
+        return offset
+
+
+class JsonlWriter(CsvWriter):
+    """Detection rows as one JSON object per line"""
+
+    def __init__(self, path, offset=0):
+        self.path = path
+        self.file = _open_at(path, offset)
+
+    def write(self, rows):
+        for row in rows:
+            self.file.write(json.dumps(row) + '\n')
+
+
+class ParquetWriter(JsonlWriter):
+    """Detection rows staged as JSON lines and converted to Parquet when the run completes
+
+    Parquet files cannot be appended to, so an interrupted run keeps the
+    staging file and resumes it. Needs pyarrow.
+    """
+
+    def __init__(self, path, offset=0):
+        # Fail before processing anything
+        if importlib.util.find_spec('pyarrow') is None:
+            raise ImportError("Parquet output needs pyarrow")
+        super().__init__(path + '.partial.jsonl', offset)
+        self.parquet_path = path
+
+    def finish(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        schema = pa.schema([
+            ('source', pa.string()), ('frame', pa.int64()), ('time', pa.float64()), ('track_id', pa.int64()),
+            ('text', pa.string()), ('confidence', pa.float64()),
+            ('x', pa.int64()), ('y', pa.int64()), ('w', pa.int64()), ('h', pa.int64()),
+            ('first_seen', pa.float64()), ('last_seen', pa.float64())
+        ])
+        with open(self.path) as f:
+            rows = [json.loads(line) for line in f]
+        pq.write_table(pa.Table.from_pylist(rows, schema=schema), self.parquet_path)
+        os.remove(self.path)
+
+
+WRITERS = {
+    'csv': CsvWriter,
+    'jsonl': JsonlWriter,
+    'parquet': ParquetWriter
+}
+
+
+def _open_at(path, offset):
+    """Open path for appending after dropping everything past offset"""
+    if os.path.exists(path):
+        os.truncate(path, offset)
+    return open(path, 'a', newline='', encoding='utf-8')
+
+
+def decode_source(source, start, stride, frames, is_running):
+    """Queue the frames of one source from frame start on, then a SourceEnd
+
+    Only every stride-th frame (by frame number) is decoded, the others
+    are grabbed and skipped, so a resumed source keeps the same frames.
+    """
+    error = None
+    try:
+        if source.is_video:
+            cap = cv2.VideoCapture(source.name)
+            if not cap.isOpened():
+                raise IOError(f"Cannot open {source.name}")
+            try:
+                fps = cap.get(cv2.CAP_PROP_FPS) or 25.0
+                if start:
+                    cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+                index = start
+                while is_running():
+                    started = time.monotonic()
+                    if index % stride:
+                        if not cap.grab():
+                            break
+                        index += 1
+                        continue
+                    ret, image = cap.read()
+                    if not ret:
+                        break
+                    pipeline_metrics.observe('decode', time.monotonic() - started)
+                    frames.put(Frame(source, index, index / fps, image))
+                    index += 1
+            finally:
+                cap.release()
+        else:
+            for index in range(start + -start % stride, len(source.images), stride):
+                if not is_running():
+                    break
+                started = time.monotonic()
+                image = cv2.imread(source.images[index])
+                if image is None:
+                    pipeline_metrics.count('unreadable_images')
+                    continue
+                pipeline_metrics.observe('decode', time.monotonic() - started)
+                frames.put(Frame(source, index, None, image))
+    except Exception as e:
+        error = str(e)
+    frames.put(SourceEnd(source, error))
+
+
+def run_decoders(sources, progress, stride, frames, count, is_running):
+    """Start count threads that decode the sources in order, returns the threads"""
+    pending = queue.Queue()
+    for source in sources:
+        pending.put(source)
+
+    def decoder():
+        while is_running():
+            try:
+                source = pending.get_nowait()
+            except queue.Empty:
+                return
+            decode_source(source, progress.next_frame(source.name), stride, frames, is_running)
+
+    threads = [threading.Thread(target=decoder, daemon=True) for _ in range(max(1, count))]
+    for thread in threads:
+        thread.start()
+    return threads
+
+
+class BatchRun:
+    """Detects plates in the frames of several sources with one detector
+
+    Video sources are tracked, so each vehicle is reported once with the
+    video time it was first and last seen; image folders report every
+    read. The tracks of unfinished videos are checkpointed with
+    track_state() and continued on resume, so an interrupted run reports
+    the same vehicles as one that was not.
+    """
+
+    def __init__(self, detector, writer, progress, tracked=True, ocr_reread_interval=5):
+        self.detector = detector
+        self.writer = writer
+        self.progress = progress
+        self.tracked = tracked
+        self.ocr_reread_interval = ocr_reread_interval
+        self.schedulers = {}
+        self.frame_count = 0
+        self.row_count = 0
+        self.finished_count = 0
+        self.failed = []
+
+    def scheduler(self, source):
+        if not (self.tracked and source.is_video):
+            return None
+        if source.name not in self.schedulers:
+            scheduler = OcrScheduler(PlateTracker(), reread_interval=self.ocr_reread_interval)
+            if source.name in self.progress.tracks:
+                scheduler.restore(self.progress.tracks[source.name])
+            self.schedulers[source.name] = scheduler
+        return self.schedulers[source.name]
+
+    def track_state(self):
+        """Open tracks of every unfinished video, to checkpoint with progress"""
+        tracks = dict(self.progress.tracks)
+        tracks.update((name, scheduler.state()) for name, scheduler in self.schedulers.items())
+        return tracks
+
+    def process(self, batch):
+        schedulers = [self.scheduler(frame.source) for frame in batch]
+        results = self.detector.detect_and_recognize_batch(
+            [frame.image for frame in batch],
+            schedulers=schedulers,
+            timestamp=[frame.time for frame in batch]
+        )
+
+        rows = []
+        for frame, scheduler, plates in zip(batch, schedulers, results):
+            if scheduler is None:
+                rows.extend(plate_row(frame, plate) for plate in plates)
+            else:
+                rows.extend(event_row(frame, event) for event in scheduler.tracker.pop_events())
+        self._write(rows)
+        # Only frames whose rows are written count as processed
+        for frame in batch:
+            self.progress.update(frame.source.name, next_frame=frame.index + 1)
+        self.frame_count += len(batch)
+
+    def finish(self, end):
+        """Report the vehicles still tracked at the end of a source and mark it done"""
+        scheduler = self.schedulers.pop(end.source.name, None)
+        self.progress.tracks.pop(end.source.name, None)
+        if scheduler:
+            scheduler.tracker.flush()
+            last_frame = Frame(end.source, self.progress.next_frame(end.source.name) - 1, None, None)
+            self._write([event_row(last_frame, event) for event in scheduler.tracker.pop_events()])
+        if end.error:
+            self.failed.append((end.source.name, end.error))
+            self.progress.update(end.source.name, error=end.error)
+        else:
+            self.progress.update(end.source.name, done=True)
+        self.finished_count += 1
+
+    def _write(self, rows):
+        if not rows:
+            return
+        started = time.monotonic()
+        self.writer.write(rows)
+        pipeline_metrics.observe('write', time.monotonic() - started)
+        self.row_count += len(rows)
+
+
+def plate_row(frame, plate):
+    row = dict.fromkeys(FIELDS)
+    row.update(source=frame.source.name, frame=frame.index, time=frame.time, track_id=plate.get('track_id'),
+               text=plate['text'], confidence=float(plate['confidence']))
+    row['x'], row['y'], row['w'], row['h'] = (int(value) for value in plate['bbox'])
+    return row
+
+
+def event_row(frame, event):
+    row = dict.fromkeys(FIELDS)
+    row.update(source=frame.source.name, frame=frame.index, time=event['last_seen'], track_id=event['track_id'],
+               text=event['text'], confidence=event['confidence'],
+               first_seen=event['first_seen'], last_seen=event['last_seen'])
+    return row
+
+
+def next_batch(frames, batch_size, max_wait, decoders):
+    """(frames, end): up to batch_size frames and the SourceEnd that cut them short
+
+    A SourceEnd always comes after the frames it was queued behind.
+    Returns None once every decoder has finished and the queue is empty.
+    """
+    batch = []
+    deadline = None
+    while len(batch) < batch_size:
+        try:
+            if deadline is None:
+                started = time.monotonic()
+                item = frames.get(timeout=0.5)
+                pipeline_metrics.observe('wait', time.monotonic() - started)
+            else:
+                item = frames.get(timeout=max(0.0, deadline - time.monotonic()))
+        except queue.Empty:
+            if deadline is not None:
+                break
+            if not any(thread.is_alive() for thread in decoders) and not len(frames):
+                return None
+            continue
+        if isinstance(item, SourceEnd):
+            return batch, item
+        batch.append(item)
+        if deadline is None:
+            deadline = time.monotonic() + max_wait
+    return batch, None
+
+
+def print_report(run, elapsed):
+    snapshot = pipeline_metrics.snapshot()
+    print(f"{run.finished_count} sources, {run.frame_count} frames in {elapsed:.1f}s: "
+          f"{run.frame_count / max(elapsed, 1e-9):.1f} frames/s, {run.row_count} rows written")
+    print(f"{'stage':>8} {'count':>8} {'total s':>9} {'busy':>6} {'mean ms':>8} {'p50 ms':>8} {'p99 ms':>8}")
+    for stage in REPORT_STAGES:
+        summary = snapshot['stages'].get(stage, {}).get('')
+        if not summary:
+            continue
+        total = summary['mean'] * summary['count']
+        print(f"{stage:>8} {summary['count']:>8} {total:>9.2f} {total / max(elapsed, 1e-9):>6.0%} "
+              f"{summary['mean'] * 1000:>8.2f} {summary['p50'] * 1000:>8.2f} {summary['p99'] * 1000:>8.2f}")
+    counters = snapshot['counters']
+    read = counters.get('ocr_crops', {}).get('', 0)
+    rejected = counters.get('ocr_rejected', {}).get('', 0)
+    if rejected:
+        print(f"OCR: {read} crops read, {rejected} rejected by the quality gate "
+              f"({rejected / (read + rejected):.0%} of OCR calls avoided)")
+    for name, error in run.failed:
+        print(f"failed: {name}: {error}")
+
+
+def build_detector(args):
+    detector_options = {'model_path': args.model} if args.model else {}
+    recognizer_options = {}
+    if args.detector_backend == 'onnx':
+        detector_options['intra_op_threads'] = args.threads
+    if args.recognizer_backend == 'onnx':
+        recognizer_options = {'model_path': args.onnx_recognizer, 'dict_path': args.dict,
+                              'intra_op_threads': args.threads}
+    return LicensePlateDetector(
+        ocr_batch_size=args.ocr_batch,
+        inference_size=args.imgsz,
+        detector_backend=args.detector_backend,
+        recognizer_backend=args.recognizer_backend,
+        detector_options=detector_options,
+        recognizer_options=recognizer_options,
+        quantized=args.quantized,
+        cache_dir=args.cache_dir,
+        crop_quality=crop_quality_options(args)
+    )
+
+
+def crop_quality_options(args):
+    if not args.quality_gate:
+        return None
+    return {'min_sharpness': args.min_sharpness, 'top_k': args.top_k or None, 'deskew': args.deskew}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('inputs', nargs='+', help='Video files, images or directories of them')
+    parser.add_argument('--output', required=True, help='Detections file (.csv, .jsonl or .parquet)')
+    parser.add_argument('--format', choices=sorted(WRITERS), help='Output format (default: from the extension)')
+    parser.add_argument('--progress', help='Checkpoint file (default: <output>.progress.json)')
+    parser.add_argument('--restart', action='store_true', help='Ignore an existing checkpoint and start over')
+    parser.add_argument('--checkpoint-interval', type=float, default=10.0, help='Seconds between checkpoints')
+    parser.add_argument('--decoders', type=int, default=max(1, min(4, (os.cpu_count() or 2) // 2)),
+                        help='Sources decoded in parallel')
+    parser.add_argument('--batch-size', type=int, default=8)
+    parser.add_argument('--max-wait-ms', type=float, default=20.0, help='Wait for a fuller batch at most this long')
+    parser.add_argument('--stride', type=int, default=1, help='Process every Nth frame of each video')
+    parser.add_argument('--no-track', action='store_true', help='Report every read instead of one row per vehicle')
+    parser.add_argument('--ocr-reread-interval', type=int, default=5)
+    parser.add_argument('--detector-backend', default='ultralytics', choices=sorted(DETECTOR_MODULES))
+    parser.add_argument('--recognizer-backend', default='paddle', choices=sorted(RECOGNIZER_MODULES))
+    parser.add_argument('--model', help='Detector model (default: the backend default)')
+    parser.add_argument('--onnx-recognizer', default='plate_recognizer.onnx')
+    parser.add_argument('--dict', default='plate_recognizer_dict.txt')
+    parser.add_argument('--quantized', action='store_true', help='INT8 models of the onnx backends')
+    parser.add_argument('--cache-dir', help='Optimized-graph cache of the onnx backends')
+    parser.add_argument('--threads', type=int, default=0, help='ONNX Runtime intra-op threads')
+    parser.add_argument('--imgsz', type=int, default=640)
+    parser.add_argument('--ocr-batch', type=int, default=8)
+    parser.add_argument('--quality-gate', action='store_true', help='Skip OCR of small, skewed or blurred crops')
+    parser.add_argument('--min-sharpness', type=float, default=30.0, help='Quality gate sharpness threshold')
+    parser.add_argument('--top-k', type=int, default=3,
+                        help='Quality gate reads per vehicle, then only sharper crops; 0 for no limit')
+    parser.add_argument('--deskew', action='store_true', help='Straighten crops before OCR (with --quality-gate)')
+    args = parser.parse_args()
+
+    output_format = args.format or os.path.splitext(args.output)[1].lstrip('.').lower()
+    if output_format not in WRITERS:
+        parser.error(f"Unknown output format: {output_format}")
+    progress = BatchProgress(args.progress or args.output + '.progress.json', resume=not args.restart)
+    sources = [source for source in find_sources(args.inputs) if not progress.done(source.name)]
+    if not sources:
+        print("Nothing to process; use --restart to process everything again")
+        return
+    writer = WRITERS[output_format](args.output, progress.offset)
+
+    detector = build_detector(args)
+    detector.warm_up()
+    pipeline_metrics.reset()
+
+    run = BatchRun(detector, writer, progress, tracked=not args.no_track,
+                   ocr_reread_interval=args.ocr_reread_interval)
+    frames = BoundedQueue(args.batch_size * 4, BLOCK, name='frames')
+    stopping = threading.Event()
+    decoders = run_decoders(sources, progress, max(1, args.stride), frames, args.decoders,
+                            lambda: not stopping.is_set())
+    started = last_checkpoint = time.monotonic()
+    interrupted = False
+    in_batch = False
+    try:
+        while True:
+            result = next_batch(frames, args.batch_size, args.max_wait_ms / 1000.0, decoders)
+            if result is None:
+                break
+            batch, end = result
+            in_batch = True
+            if batch:
+                run.process(batch)
+            if end:
+                run.finish(end)
+            in_batch = False
+            if time.monotonic() - last_checkpoint >= args.checkpoint_interval:
+                progress.save(writer.flush(), run.track_state())
+                last_checkpoint = time.monotonic()
+    except KeyboardInterrupt:
+        interrupted = True
+        stopping.set()
+        # Unblock decoders waiting for room in the queue
+        while any(thread.is_alive() for thread in decoders):
+            try:
+                frames.get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+    elapsed = time.monotonic() - started
+    offset = writer.close()
+    # A batch cut short has tracked frames it did not record, resume from the last checkpoint instead
+    if not in_batch:
+        progress.save(offset, run.track_state())
+    if not interrupted and not run.failed and isinstance(writer, ParquetWriter):
+        writer.finish()
+    print_report(run, elapsed)
+    if interrupted:
+        print("Interrupted; run the same command again to resume")
+        sys.exit(130)
+    sys.exit(1 if run.failed else 0)
+
+
+if __name__ == '__main__':
+    main()
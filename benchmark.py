@@ -0,0 +1,1148 @@
+"""
+Performance benchmarks for the ANPR pipeline
+Runs headless on CPU without network access:
+
+    python benchmark.py tracker
+    python benchmark.py roi --video gate.mp4 --rect 400 300 1100 700
+    python benchmark.py buffers --video gate.mp4
+    python benchmark.py backends --video gate.mp4 --threads 4
+    python benchmark.py ocr-parity --crops plate_crops/
+    python benchmark.py quantization --test-set testset/ --report quantization.json
+    python benchmark.py startup --detector-backend onnx --recognizer-backend onnx --cache-dir model_cache
+    python benchmark.py ingest --url gate.mp4 --seconds 30
+    python benchmark.py dual --main gate-main.mp4 --sub gate-sub.mp4
+    python benchmark.py suite --output results.json --baseline baseline.json
+    python benchmark.py watchlist --entries 100000
+    python benchmark.py sessions --open 1000 10000 50000
+    python benchmark.py quality --video gate.mp4 --plates AB123CD XY987ZW
+"""
+
+import argparse
+import csv
+import importlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+from backends import (DETECTOR_MODULES, RECOGNIZER_MODULES, STUB_LEVEL_STEP, STUB_PLATE_LEVEL,
+                      create_detector, create_recognizer)
+from buffers import FramePool
+from detector import LicensePlateDetector
+from inference import InferenceService
+from ingest import MainStreamGrabber, StreamIngest
+from metrics import pipeline_metrics
+from ocr_scheduler import CropQualityGate, OcrScheduler
+from roi import DetectionRegion
+from sampling import AdaptiveSampler
+from sessions import SessionCorrelator
+from tracker import PlateTracker, iou_matrix, normalize_plate
+from watchlist import CONFUSIONS, DENY, LISTS, PlateIndex, VerdictCache
+
+
+def time_call(fn, repeat):
+    """Median wall time of fn() in milliseconds"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000.0)
+    return float(np.median(samples))
+
+
+def synthetic_rects(rng, count, width=1920, height=1080):
+    """Non-overlapping-ish plate boxes scattered over a frame"""
+    x = rng.integers(0, width - 120, count)
+    y = rng.integers(0, height - 40, count)
+    return np.stack([x, y, np.full(count, 120), np.full(count, 40)], axis=1)
+
+
+def bench_tracker(args):
+    """PlateTracker.update cost as tracks x detections grows"""
+    rng = np.random.default_rng(args.seed)
+    modes = [
+        ('greedy', 'centroid'),
+        ('optimal', 'centroid'),
+        ('greedy', 'iou'),
+        ('optimal', 'iou')
+    ]
+    print(f"{'size':>9}" + ''.join(f"{matching + '/' + cost:>18}" for matching, cost in modes))
+    for size in args.sizes:
+        rects = synthetic_rects(rng, size)
+        texts = [''] * size
+        row = f"{size:>4}x{size:<4}"
+        for matching, cost in modes:
+            tracker = PlateTracker(matching=matching, cost=cost, max_distance=200)
+            tracker.update(rects, texts)
+            # Jitter every detection a few pixels so all tracks stay matched
+            moved = rects + np.concatenate([rng.integers(-5, 6, (size, 2)), np.zeros((size, 2), dtype=int)], axis=1)
+            elapsed = time_call(lambda: tracker.update(moved, texts), args.repeat)
+            row += f"{elapsed:>15.3f} ms"
+        print(row)
+
+
+def read_frames(path, limit):
+    """Up to limit decoded frames of a recorded video"""
+    cap = cv2.VideoCapture(path)
+    frames = []
+    while len(frames) < limit:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+    if not frames:
+        raise SystemExit(f"Could not read frames from {path}")
+    return frames
+
+
+def bench_roi(args):
+    """Full-frame detection against ROI + downscaled detection on a recording"""
+    from ultralytics import YOLO
+
+    model = YOLO(args.model)
+    frames = read_frames(args.video, args.frames)
+    region = DetectionRegion(rect=args.rect) if args.rect else DetectionRegion(polygon=np.reshape(args.polygon, (-1, 2)))
+
+    def detect_full(frame):
+        result = model(frame, verbose=False)[0]
+        boxes = result.boxes.xyxy.cpu().numpy() if result.boxes is not None else np.zeros((0, 4))
+        return [(int(x1), int(y1), int(x2 - x1), int(y2 - y1)) for x1, y1, x2, y2 in boxes]
+
+    def detect_roi(frame):
+        image, transform = region.prepare(frame, args.imgsz)
+        result = model(image, imgsz=args.imgsz, verbose=False)[0]
+        boxes = result.boxes.xyxy.cpu().numpy() if result.boxes is not None else np.zeros((0, 4))
+        return region.map_boxes(boxes, transform, frame.shape)
+
+    # Warm up both paths before timing
+    detect_full(frames[0])
+    detect_roi(frames[0])
+
+    timings = {}
+    outputs = {}
+    for name, detect in (('full frame', detect_full), ('roi', detect_roi)):
+        start = time.perf_counter()
+        outputs[name] = [detect(frame) for frame in frames]
+        timings[name] = (time.perf_counter() - start) * 1000.0 / len(frames)
+
+    # Full-frame boxes inside the region are the reference
+    x, y, w, h = region.rect
+    reference = [[box for box in boxes if x <= box[0] + box[2] / 2 <= x + w and y <= box[1] + box[3] / 2 <= y + h]
+                 for boxes in outputs['full frame']]
+    matched = 0
+    total = sum(len(boxes) for boxes in reference)
+    for expected, found in zip(reference, outputs['roi']):
+        if expected and found:
+            matched += int((iou_matrix(expected, found).max(axis=1) >= 0.5).sum())
+
+    print(f"{len(frames)} frames, region {region.rect}, imgsz {args.imgsz}")
+    for name, elapsed in timings.items():
+        print(f"{name:>12}: {elapsed:8.2f} ms/frame  {1000.0 / elapsed:7.1f} fps")
+    print(f"{'recall':>12}: {matched}/{total} full-frame plates in the region found by the roi path")
+
+
+def bench_buffers(args):
+    """Frame decode with fresh arrays against decode into pooled buffers"""
+    for name in ('fresh', 'pooled'):
+        cap = cv2.VideoCapture(args.video)
+        pool = FramePool(4)
+        held = []
+        frames = 0
+        tracemalloc.start()
+        start = time.perf_counter()
+        while frames < args.frames:
+            if name == 'fresh':
+                ret, item = cap.read()
+            else:
+                ret, item = pool.read(cap)
+            if not ret:
+                break
+            frames += 1
+            # Keep two frames in flight like the inference queue would
+            held.append(item)
+            if len(held) > 2:
+                stale = held.pop(0)
+                if name == 'pooled':
+                    stale.release()
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        cap.release()
+        # Every plain cap.read() returns a newly allocated array
+        allocations = frames if name == 'fresh' else pool.allocated_count
+        print(f"{name:>7}: {frames} frames, {elapsed * 1000.0 / max(frames, 1):6.2f} ms/frame, "
+              f"{allocations} frame allocations, peak traced {peak / 1e6:7.1f} MB")
+
+
+def xyxy_to_xywh(boxes):
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    return np.concatenate([boxes[:, :2], boxes[:, 2:] - boxes[:, :2]], axis=1)
+
+
+def bench_backends(args):
+    """Parity and throughput of the ONNX Runtime backends against ultralytics/PaddleOCR"""
+    frames = read_frames(args.video, args.frames)
+    batches = [frames[i:i + args.batch] for i in range(0, len(frames), args.batch)]
+    onnx_options = {'intra_op_threads': args.threads, 'inter_op_threads': args.inter_threads}
+    detectors = {
+        'ultralytics': create_detector('ultralytics', model_path=args.model),
+        'onnx': create_detector('onnx', model_path=args.onnx_model, **onnx_options)
+    }
+    recognizers = {
+        'paddle': create_recognizer('paddle', batch_size=args.batch),
+        'onnx': create_recognizer('onnx', model_path=args.onnx_recognizer, dict_path=args.dict, **onnx_options)
+    }
+
+    boxes = {}
+    for name, detector in detectors.items():
+        detector.detect(batches[0], args.imgsz)
+        start = time.perf_counter()
+        boxes[name] = [xyxy for batch in batches for xyxy in detector.detect(batch, args.imgsz)]
+        elapsed = (time.perf_counter() - start) * 1000.0 / len(frames)
+        print(f"{name:>12} detect: {elapsed:8.2f} ms/frame  {1000.0 / elapsed:7.1f} fps")
+
+    # Both recognizers read the same reference crops
+    crops = []
+    for frame, xyxy in zip(frames, boxes['ultralytics']):
+        for x1, y1, x2, y2 in xyxy.astype(np.int64):
+            crop = frame[max(0, y1):y2, max(0, x1):x2]
+            if crop.size:
+                crops.append(crop)
+    texts = {}
+    for name, recognizer in recognizers.items():
+        if not crops:
+            break
+        recognizer.recognize(crops[:args.batch])
+        start = time.perf_counter()
+        texts[name] = [read for i in range(0, len(crops), args.batch) for read in recognizer.recognize(crops[i:i + args.batch])]
+        elapsed = (time.perf_counter() - start) * 1000.0 / len(crops)
+        print(f"{name:>12} ocr:    {elapsed:8.2f} ms/crop   {1000.0 / elapsed:7.1f} crops/s")
+
+    expected = sum(len(xyxy) for xyxy in boxes['ultralytics'])
+    matched = 0
+    for reference, candidate in zip(boxes['ultralytics'], boxes['onnx']):
+        if len(reference) and len(candidate):
+            matched += int((iou_matrix(xyxy_to_xywh(reference), xyxy_to_xywh(candidate)).max(axis=1) >= args.iou).sum())
+    box_parity = matched / expected if expected else 1.0
+    print(f"{'boxes':>12}: {matched}/{expected} reference boxes matched at IoU >= {args.iou}")
+
+    text_parity = 1.0
+    if crops:
+        agree = sum(a[0] == b[0] for a, b in zip(texts['paddle'], texts['onnx']))
+        confidence_gap = max(abs(a[1] - b[1]) for a, b in zip(texts['paddle'], texts['onnx']))
+        text_parity = agree / len(crops)
+        print(f"{'text':>12}: {agree}/{len(crops)} reads identical, max confidence gap {confidence_gap:.3f}")
+
+    if box_parity < args.min_parity or text_parity < args.min_parity:
+        raise SystemExit(f"Parity below {args.min_parity:.0%}: boxes {box_parity:.1%}, text {text_parity:.1%}")
+    print(f"Parity OK (>= {args.min_parity:.0%})")
+
+
+def bench_ocr_parity(args):
+    """Reads of the batched PaddleOCR path against the per-crop ocr() path on sample crops"""
+    if args.crops:
+        names = sorted(name for name in os.listdir(args.crops)
+                       if os.path.splitext(name)[1].lower() in ('.png', '.jpg', '.jpeg', '.bmp'))
+        crops = [cv2.imread(os.path.join(args.crops, name)) for name in names]
+        crops = [crop for crop in crops if crop is not None and crop.size]
+    else:
+        frames = read_frames(args.video, args.frames)
+        detector = create_detector('ultralytics', model_path=args.model)
+        crops = []
+        for frame, xyxy in zip(frames, detector.detect(frames, args.imgsz)):
+            for x1, y1, x2, y2 in xyxy.astype(np.int64):
+                crop = frame[max(0, y1):y2, max(0, x1):x2]
+                if crop.size:
+                    crops.append(crop)
+    if not crops:
+        raise SystemExit("No plate crops to compare")
+
+    # The per-crop ocr() path is the reference both batched variants are held to
+    reference_reader = create_recognizer('paddle', batch_size=args.batch)
+    reference = [reference_reader.read(crop) for crop in crops]
+    mismatch_rates = {}
+    for label, det_max_aspect in (('batched', None), ('batched+det', args.det_max_aspect)):
+        detector = LicensePlateDetector(detector_backend='stub', recognizer_backend='paddle', ocr_batch_size=args.batch,
+                                        recognizer_options={'det_max_aspect': det_max_aspect})
+        start = time.perf_counter()
+        reads = detector.recognize_batch(crops)
+        elapsed = (time.perf_counter() - start) * 1000.0 / len(crops)
+        routed = sum(detector.recognizer.needs_detection(crop) for crop in crops)
+        # Only reads that pass the confidence filter reach the plates list
+        mismatches = sum((a[0] if a[1] > 0.5 else '') != (b[0] if b[1] > 0.5 else '') for a, b in zip(reference, reads))
+        mismatch_rates[label] = mismatches / len(crops)
+        print(f"{label:>12}: {mismatches}/{len(crops)} plates differ ({mismatch_rates[label]:.1%}), "
+              f"{routed} crops with text detection, {elapsed:.2f} ms/crop")
+
+    if mismatch_rates['batched+det'] > args.max_mismatch:
+        raise SystemExit(f"Mismatch rate {mismatch_rates['batched+det']:.1%} above {args.max_mismatch:.1%}")
+    print(f"Parity OK (<= {args.max_mismatch:.1%} mismatched)")
+
+
+def read_labels(path):
+    """labels.csv rows of (image, plate) as {image: set of normalized plates}
+
+    An image without plates is listed once with an empty plate column.
+    """
+    labels = {}
+    with open(path, newline='') as f:
+        for row in csv.DictReader(f):
+            plates = labels.setdefault(row['image'], set())
+            if row['plate'].strip():
+                plates.add(normalize_plate(row['plate']))
+    return labels
+
+
+def read_plates(detector, recognizer, frame, imgsz, min_confidence=0.5):
+    """Normalized plate texts of one frame and the (detect, ocr) time in ms"""
+    start = time.perf_counter()
+    xyxy = detector.detect([frame], imgsz)[0].astype(np.int64)
+    detected = time.perf_counter()
+    crops = [frame[max(0, y1):y2, max(0, x1):x2] for x1, y1, x2, y2 in xyxy]
+    crops = [crop for crop in crops if crop.size]
+    reads = recognizer.recognize(crops) if crops else []
+    finished = time.perf_counter()
+    plates = {normalize_plate(text) for text, confidence in reads if text and confidence > min_confidence}
+    return plates, ((detected - start) * 1000.0, (finished - detected) * 1000.0)
+
+
+def bench_quantization(args):
+    """Plate accuracy and throughput of the INT8 models against FP32 on a labelled test set"""
+    labels = read_labels(os.path.join(args.test_set, 'labels.csv'))
+    frames = {name: cv2.imread(os.path.join(args.test_set, name)) for name in labels}
+    missing = [name for name, frame in frames.items() if frame is None]
+    if missing:
+        raise SystemExit(f"Could not read {len(missing)} test images, e.g. {missing[0]}")
+    options = {'intra_op_threads': args.threads, 'inter_op_threads': args.inter_threads}
+
+    report = {'test_set': args.test_set, 'images': len(frames),
+              'plates': sum(len(plates) for plates in labels.values()), 'results': {}}
+    for precision in ('fp32', 'int8'):
+        quantized = precision == 'int8'
+        detector = create_detector('onnx', model_path=args.onnx_model, quantized=quantized, **options)
+        recognizer = create_recognizer('onnx', model_path=args.onnx_recognizer, dict_path=args.dict,
+                                       quantized=quantized, **options)
+        read_plates(detector, recognizer, next(iter(frames.values())), args.imgsz)
+
+        correct = predicted = exact_frames = 0
+        detect_ms = ocr_ms = 0.0
+        for name, frame in frames.items():
+            plates, (detect_time, ocr_time) = read_plates(detector, recognizer, frame, args.imgsz)
+            detect_ms += detect_time
+            ocr_ms += ocr_time
+            correct += len(plates & labels[name])
+            predicted += len(plates)
+            exact_frames += plates == labels[name]
+
+        total_ms = detect_ms + ocr_ms
+        report['results'][precision] = {
+            'fps': 1000.0 * len(frames) / total_ms,
+            'detect_ms': detect_ms / len(frames),
+            'ocr_ms': ocr_ms / len(frames),
+            'recall': correct / report['plates'] if report['plates'] else 1.0,
+            'precision': correct / predicted if predicted else 1.0,
+            'frame_accuracy': exact_frames / len(frames)
+        }
+
+    fp32, int8 = report['results']['fp32'], report['results']['int8']
+    report['speedup'] = int8['fps'] / fp32['fps']
+    report['recall_delta'] = int8['recall'] - fp32['recall']
+
+    print(f"{len(frames)} images, {report['plates']} labelled plates")
+    print(f"{'':>6}{'fps':>9}{'detect ms':>11}{'ocr ms':>9}{'recall':>9}{'precision':>11}{'frames ok':>11}")
+    for precision, row in report['results'].items():
+        print(f"{precision:>6}{row['fps']:>9.1f}{row['detect_ms']:>11.2f}{row['ocr_ms']:>9.2f}"
+              f"{row['recall']:>9.1%}{row['precision']:>11.1%}{row['frame_accuracy']:>11.1%}")
+    print(f"INT8 is {report['speedup']:.2f}x the FP32 frame rate, recall {report['recall_delta']:+.1%}")
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.report}")
+
+
+def measure_startup(args):
+    """Import, load, first and second inference time in ms of this process
+
+    Loads and warms up a LicensePlateDetector the way the app does at
+    startup; steady_inference is a second warm_up() on warm models.
+    """
+    timings = {}
+    start = time.perf_counter()
+    for module in {DETECTOR_MODULES[args.detector_backend], RECOGNIZER_MODULES[args.recognizer_backend]}:
+        importlib.import_module(module)
+    timings['import'] = (time.perf_counter() - start) * 1000.0
+
+    detector_options = {'model_path': args.model} if args.model else {}
+    recognizer_options = {}
+    if args.recognizer_backend == 'onnx':
+        recognizer_options = {'model_path': args.onnx_recognizer, 'dict_path': args.dict}
+
+    start = time.perf_counter()
+    detector = LicensePlateDetector(
+        inference_size=args.imgsz,
+        detector_backend=args.detector_backend,
+        recognizer_backend=args.recognizer_backend,
+        detector_options=detector_options,
+        recognizer_options=recognizer_options,
+        cache_dir=args.cache_dir
+    )
+    timings['load'] = (time.perf_counter() - start) * 1000.0
+
+    for name in ('first_inference', 'steady_inference'):
+        start = time.perf_counter()
+        detector.warm_up()
+        timings[name] = (time.perf_counter() - start) * 1000.0
+    return timings
+
+
+def bench_startup(args):
+    """Import, model load and first-inference time, each run in a fresh process"""
+    if args.child:
+        print(json.dumps(measure_startup(args)))
+        return
+
+    command = [sys.executable, os.path.abspath(__file__), 'startup', '--child',
+               '--detector-backend', args.detector_backend, '--recognizer-backend', args.recognizer_backend,
+               '--onnx-recognizer', args.onnx_recognizer, '--dict', args.dict, '--imgsz', str(args.imgsz)]
+    if args.model:
+        command += ['--model', args.model]
+    if args.cache_dir:
+        command += ['--cache-dir', args.cache_dir]
+
+    columns = ('import', 'load', 'first_inference', 'steady_inference')
+    print(f"{args.detector_backend}/{args.recognizer_backend}" + (f", cache {args.cache_dir}" if args.cache_dir else ''))
+    print(f"{'run':>4}" + ''.join(f"{name:>18}" for name in columns))
+    for run in range(args.runs):
+        output = subprocess.run(command, capture_output=True, text=True, check=True).stdout
+        # Model libraries may log to stdout; the timings are the last line
+        timings = json.loads(output.strip().splitlines()[-1])
+        print(f"{run + 1:>4}" + ''.join(f"{timings[name]:>15.1f} ms" for name in columns))
+
+
+def bench_ingest(args):
+    """Reconnecting ingest of a URL or local file, sampled as an idle camera would be"""
+    for mode in ('decode all', 'sampled'):
+        pool = FramePool(4)
+        sampler = AdaptiveSampler(motion_hold=0.0)
+        ingest = StreamIngest(args.url, name=args.url, transport=args.transport, stall_timeout=args.stall_timeout,
+                              reconnect_delay=args.reconnect_delay, log=print if args.verbose else None)
+        deadline = time.monotonic() + args.seconds
+        running = lambda: time.monotonic() < deadline
+        cpu_start = time.process_time()
+        while running():
+            decode = mode == 'decode all' or sampler.wants_frame()
+            ret, buffer = ingest.read(pool, running, decode=decode)
+            if not ret:
+                continue
+            sampler.should_process(buffer.array if buffer else None)
+            if buffer:
+                buffer.release()
+        cpu = time.process_time() - cpu_start
+        ingest.release()
+        stats = ingest.stats()
+        print(f"{mode:>10}: {stats['frames']} frames ({stats['grab_only']} grab-only), "
+              f"{cpu * 1000.0 / max(stats['frames'], 1):5.2f} ms CPU/frame, {stats['decode_fps']:6.1f} fps, "
+              f"{stats['reconnects']} reconnects, {stats['stalls']} stalls, uptime {stats['uptime_ratio']:.0%}")
+
+
+def bench_dual(args):
+    """Decode CPU of detecting on a sub stream and cropping from the main stream
+
+    Runs the shipped StreamIngest / MainStreamGrabber pair as run_capture
+    does while tracks need reads: every --sample-every sub frame requests
+    its main frame and every --read-every request is converted, as if
+    OCR read one of its crops. Both URLs should be live streams of one
+    camera; the grabber does not pace local files.
+    """
+    results = {}
+    for mode in ('main only', 'sub + main', 'sub only'):
+        pool = FramePool(4)
+        ingest = StreamIngest(args.main if mode == 'main only' else args.sub, reconnect_delay=0.1)
+        main = MainStreamGrabber(args.main, reconnect_delay=0.1) if mode == 'sub + main' else None
+        if main:
+            main.start()
+        deadline = time.monotonic() + args.seconds
+        running = lambda: time.monotonic() < deadline
+        frames = requested = 0
+        skews = []
+        cpu_start = time.process_time()
+        while running():
+            ret, buffer = ingest.read(pool, running)
+            if not ret:
+                continue
+            frames += 1
+            buffer.release()
+            if not main:
+                continue
+            main.wake()
+            if frames % args.sample_every:
+                continue
+            request = main.request(ingest.frame_time())
+            if request is None:
+                continue
+            requested += 1
+            if requested % args.read_every == 0:
+                request()
+                if request.skew is not None:
+                    skews.append(abs(request.skew) * 1000.0)
+            request.release()
+        cpu = time.process_time() - cpu_start
+        ingest.release()
+        if main:
+            main.stop()
+        results[mode] = cpu / args.seconds
+        saved = 1.0 - results[mode] / results['main only']
+        print(f"{mode:>10}: {frames} frames, {results[mode]:6.1%} of a core, "
+              f"{cpu * 1000.0 / max(frames, 1):6.2f} ms CPU/frame, {saved:6.1%} decode CPU saved")
+        if main:
+            stats = main.stats()
+            skew = f", median skew {np.median(skews):.1f} ms" if skews else ''
+            print(f"{'':>10}  {requested} main frames requested, {stats['retrieved']} converted, "
+                  f"{stats['missed']} refused or timed out{skew}")
+
+    # The main stream is only open while tracks still need reads
+    blended = args.active_fraction * results['sub + main'] + (1 - args.active_fraction) * results['sub only']
+    print(f"{args.active_fraction:.0%} reading: {blended:6.1%} of a core, "
+          f"{1.0 - blended / results['main only']:6.1%} decode CPU saved against main only")
+
+
+def synthetic_frames(count, width=1280, height=720, plates=3, seed=0):
+    """Frames of plates crossing a noisy scene, readable by the stub backends
+
+    Plate k drives along its own lane at its own speed and is filled with
+    the brightness StubRecognizer reads back as STUB{k}; dark strokes give
+    its crops edges to score.
+    """
+    rng = np.random.default_rng(seed)
+    background = rng.integers(0, 90, (height, width, 3), dtype=np.uint8)
+    plate_w, plate_h = width // 10, width // 30
+    frames = []
+    for t in range(count):
+        frame = background.copy()
+        for k in range(plates):
+            x = int((t * width / count * (1 + k / 2) + k * width / plates) % (width - plate_w))
+            y = height * (k + 1) // (plates + 1) - plate_h // 2
+            frame[y:y + plate_h, x:x + plate_w] = STUB_PLATE_LEVEL + STUB_LEVEL_STEP * k
+            for stroke in range(1, 7):
+                stroke_x = x + plate_w * stroke // 7
+                frame[y + plate_h // 4:y + plate_h * 3 // 4, stroke_x:stroke_x + max(1, plate_w // 40)] = 30
+        frames.append(frame)
+    return frames
+
+
+def capture_order(frame_count, streams, per_stream):
+    """(stream, frame index) in arrival order; streams start at different points of the sequence"""
+    offsets = [stream * frame_count // streams for stream in range(streams)]
+    return [(stream, (offsets[stream] + t) % frame_count) for t in range(per_stream) for stream in range(streams)]
+
+
+def latency_summary(samples_ms, frames, elapsed):
+    samples = np.asarray(samples_ms, dtype=np.float64)
+    summary = {'fps': frames / elapsed if elapsed else 0.0, 'samples': len(samples)}
+    for percent in (50, 95, 99):
+        summary[f'p{percent}_ms'] = float(np.percentile(samples, percent)) if len(samples) else 0.0
+    return summary
+
+
+def suite_detector(detector, frames, boxes, streams, args):
+    """detect_batch calls over batches of frames from different streams"""
+    order = capture_order(len(frames), streams, args.frames)
+    batch_size = min(streams, args.batch)
+    samples = []
+    start = time.perf_counter()
+    for i in range(0, len(order), batch_size):
+        batch = [frames[index] for _, index in order[i:i + batch_size]]
+        call_start = time.perf_counter()
+        detector.detect_batch(batch)
+        samples.append((time.perf_counter() - call_start) * 1000.0)
+    return latency_summary(samples, len(order), time.perf_counter() - start)
+
+
+def suite_ocr(detector, frames, boxes, streams, args):
+    """recognize_batch calls over the plate crops of a batch of frames"""
+    order = capture_order(len(frames), streams, args.frames)
+    batch_size = min(streams, args.batch)
+    samples = []
+    start = time.perf_counter()
+    for i in range(0, len(order), batch_size):
+        crops = [frames[index][y:y + h, x:x + w] for _, index in order[i:i + batch_size] for x, y, w, h in boxes[index]]
+        call_start = time.perf_counter()
+        detector.recognize_batch(crops)
+        samples.append((time.perf_counter() - call_start) * 1000.0)
+    return latency_summary(samples, len(order), time.perf_counter() - start)
+
+
+def suite_tracker(detector, frames, boxes, streams, args):
+    """PlateTracker.update_boxes per frame, one tracker per stream"""
+    order = capture_order(len(frames), streams, args.frames)
+    trackers = [PlateTracker() for _ in range(streams)]
+    samples = []
+    start = time.perf_counter()
+    for step, (stream, index) in enumerate(order):
+        call_start = time.perf_counter()
+        trackers[stream].update_boxes(boxes[index], step / 25.0)
+        samples.append((time.perf_counter() - call_start) * 1000.0)
+    return latency_summary(samples, len(order), time.perf_counter() - start)
+
+
+def suite_e2e(detector, frames, boxes, streams, args):
+    """Streams paced at --stream-fps through InferenceService with tracking and OCR scheduling
+
+    Latency runs from submit to the result callback; fps counts results,
+    so it stays at streams x --stream-fps until the pipeline saturates
+    and starts dropping frames.
+    """
+    inference = InferenceService(detector, max_batch_size=args.batch, queue_size=max(8, 2 * streams))
+    schedulers = [OcrScheduler(PlateTracker()) for _ in range(streams)]
+    samples = []
+    lock = threading.Lock()
+
+    def on_result(stream_id, plates, captured_at, error=None):
+        with lock:
+            samples.append((time.monotonic() - captured_at) * 1000.0)
+
+    def feed(stream):
+        offset = stream * len(frames) // streams
+        interval = 1.0 / args.stream_fps
+        next_frame = time.monotonic()
+        for t in range(int(args.e2e_seconds * args.stream_fps)):
+            inference.submit(stream, frames[(offset + t) % len(frames)], on_result, time.monotonic(),
+                             scheduler=schedulers[stream])
+            next_frame += interval
+            time.sleep(max(0.0, next_frame - time.monotonic()))
+
+    inference.start()
+    feeders = [threading.Thread(target=feed, args=(stream,)) for stream in range(streams)]
+    start = time.perf_counter()
+    for thread in feeders:
+        thread.start()
+    for thread in feeders:
+        thread.join()
+    submitted = int(args.e2e_seconds * args.stream_fps) * streams
+    deadline = time.monotonic() + 30.0
+    while len(samples) + inference.requests.dropped_count < submitted and time.monotonic() < deadline:
+        time.sleep(0.005)
+    elapsed = time.perf_counter() - start
+    inference.stop()
+    summary = latency_summary(samples, len(samples), elapsed)
+    summary['dropped'] = inference.requests.dropped_count
+    return summary
+
+
+SUITE_STAGES = {
+    'detector': suite_detector,
+    'ocr': suite_ocr,
+    'tracker': suite_tracker,
+    'e2e': suite_e2e
+}
+
+# Compared against the baseline: (metric, whether higher is better)
+SUITE_CHECKS = (('fps', True), ('p95_ms', False))
+
+
+def compare_to_baseline(results, baseline, threshold, min_delta_ms):
+    """Print the change of every checked metric, returns the regressions beyond threshold
+
+    Latency changes smaller than min_delta_ms are never regressions, so
+    jitter on sub-millisecond stages does not fail the run.
+    """
+    regressions = []
+    for stage, by_streams in baseline['results'].items():
+        for streams, expected in by_streams.items():
+            current = results['results'].get(stage, {}).get(streams)
+            if current is None:
+                continue
+            for metric, higher_is_better in SUITE_CHECKS:
+                if not expected.get(metric):
+                    continue
+                change = current[metric] / expected[metric] - 1.0
+                worse = -change if higher_is_better else change
+                regressed = worse > threshold and (
+                    higher_is_better or current[metric] - expected[metric] >= min_delta_ms)
+                print(f"{stage:>9} x{streams:<3} {metric:>7}: {expected[metric]:9.2f} -> {current[metric]:9.2f} "
+                      f"({change:+6.1%}) {'REGRESSION' if regressed else ''}")
+                if regressed:
+                    regressions.append(f"{stage} x{streams} {metric} {change:+.1%}")
+    return regressions
+
+
+def detector_from_args(args):
+    """LicensePlateDetector of the --detector-backend / --recognizer-backend options, warmed up"""
+    detector_options = {'model_path': args.model} if args.model else {}
+    recognizer_options = {}
+    if args.recognizer_backend == 'onnx':
+        recognizer_options = {'model_path': args.onnx_recognizer, 'dict_path': args.dict}
+    if args.threads:
+        if args.detector_backend == 'onnx':
+            detector_options['intra_op_threads'] = args.threads
+        if args.recognizer_backend == 'onnx':
+            recognizer_options['intra_op_threads'] = args.threads
+    detector = LicensePlateDetector(
+        inference_size=args.imgsz,
+        detector_backend=args.detector_backend,
+        recognizer_backend=args.recognizer_backend,
+        detector_options=detector_options,
+        recognizer_options=recognizer_options
+    )
+    detector.warm_up()
+    return detector
+
+
+def bench_suite(args):
+    """Detector, OCR, tracker and end-to-end fps and latency percentiles for 1-16 streams"""
+    detector = detector_from_args(args)
+
+    frames = read_frames(args.video, args.frames) if args.video else synthetic_frames(args.frames, seed=args.seed)
+    # Boxes of every frame, for the stages that start after detection
+    boxes = [plates for batch in range(0, len(frames), args.batch)
+             for plates in detector.detect_batch(frames[batch:batch + args.batch])]
+
+    results = {
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'numpy': np.__version__,
+            'opencv': cv2.__version__
+        },
+        'config': {
+            'detector_backend': args.detector_backend,
+            'recognizer_backend': args.recognizer_backend,
+            'imgsz': args.imgsz,
+            'batch': args.batch,
+            'frames': args.frames,
+            'rounds': args.rounds,
+            'video': args.video,
+            'seed': args.seed,
+            'stream_fps': args.stream_fps,
+            'e2e_seconds': args.e2e_seconds
+        },
+        'results': {}
+    }
+    print(f"{'stage':>9} {'streams':>7} {'fps':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for stage in args.stages:
+        for streams in args.streams:
+            # The round with the median fps; e2e runs are long enough on their own
+            rounds = [SUITE_STAGES[stage](detector, frames, boxes, streams, args)
+                      for _ in range(1 if stage == 'e2e' else args.rounds)]
+            summary = sorted(rounds, key=lambda summary: summary['fps'])[len(rounds) // 2]
+            results['results'].setdefault(stage, {})[str(streams)] = summary
+            print(f"{stage:>9} {streams:>7} {summary['fps']:>9.1f} {summary['p50_ms']:>8.2f} "
+                  f"{summary['p95_ms']:>8.2f} {summary['p99_ms']:>8.2f}"
+                  + (f"  dropped {summary['dropped']}" if summary.get('dropped') else ''))
+
+    for path in filter(None, (args.output, args.save_baseline)):
+        with open(path, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get('config') != results['config']:
+            print("Warning: baseline was recorded with a different configuration")
+        regressions = compare_to_baseline(results, baseline, args.threshold, args.min_delta_ms)
+        if regressions:
+            raise SystemExit(f"{len(regressions)} regressions beyond {args.threshold:.0%}: " + ', '.join(regressions))
+        print(f"No regressions beyond {args.threshold:.0%}")
+
+
+def motion_blur(frame, length):
+    """frame smeared horizontally over length pixels, like a fast vehicle at a long shutter"""
+    kernel = np.full((1, length), 1.0 / length, dtype=np.float32)
+    return cv2.filter2D(frame, -1, kernel)
+
+
+def quality_run(detector, frames, tracked, gate):
+    """Normalized texts reported for a sequence, OCR calls, crops rejected and seconds taken
+
+    Tracked runs report one text per vehicle event, untracked runs one per read.
+    """
+    detector.crop_quality = gate
+    pipeline_metrics.reset()
+    scheduler = OcrScheduler(PlateTracker()) if tracked else None
+    texts = []
+    start = time.perf_counter()
+    for index, frame in enumerate(frames):
+        plates = detector.detect_and_recognize_batch([frame], schedulers=[scheduler], timestamp=index / 25.0)[0]
+        if scheduler:
+            texts.extend(event['text'] for event in scheduler.tracker.pop_events())
+        else:
+            texts.extend(plate['text'] for plate in plates)
+    if scheduler:
+        scheduler.tracker.flush()
+        texts.extend(event['text'] for event in scheduler.tracker.pop_events())
+    elapsed = time.perf_counter() - start
+    counters = pipeline_metrics.collect()[1]
+    return ([normalize_plate(text) for text in texts], counters.get(('ocr_crops', ''), 0),
+            counters.get(('ocr_rejected', ''), 0), elapsed)
+
+
+def bench_quality(args):
+    """OCR calls avoided by the crop quality gate and its effect on plate accuracy
+
+    Runs a labelled image set (--test-set, untracked), a recorded video
+    with the plates that appear in it (--video and --plates, tracked) or,
+    by default, synthetic frames for the stub backends with motion blur
+    on --blur-fraction of them. Synthetic plates are much sharper than
+    camera crops, so they are gated at a higher sharpness by default.
+    """
+    synthetic = not (args.test_set or args.video)
+    min_sharpness = args.min_sharpness if args.min_sharpness is not None else 500.0 if synthetic else 30.0
+    gate_options = {'min_sharpness': min_sharpness, 'top_k': args.top_k or None}
+    configs = [('every crop', False, None), ('gated', False, gate_options)]
+    if args.test_set:
+        labels = read_labels(os.path.join(args.test_set, 'labels.csv'))
+        sequences = []
+        for name, plates in labels.items():
+            frame = cv2.imread(os.path.join(args.test_set, name))
+            if frame is None:
+                raise SystemExit(f"Could not read test image {name}")
+            sequences.append(([frame], plates))
+    else:
+        if args.video:
+            if not args.plates:
+                raise SystemExit("--video needs the --plates that appear in it")
+            frames = read_frames(args.video, args.frames)
+            plates = {normalize_plate(plate) for plate in args.plates}
+        else:
+            rng = np.random.default_rng(args.seed)
+            frames = [motion_blur(frame, args.blur_length) if rng.random() < args.blur_fraction else frame
+                      for frame in synthetic_frames(args.frames, seed=args.seed)]
+            plates = {f"STUB{k}" for k in range(3)}
+        sequences = [(frames, plates)]
+        configs += [('scheduled', True, None), ('sched+gated', True, gate_options)]
+    if args.deskew:
+        configs.append(('gated+deskew', configs[-1][1], dict(gate_options, deskew=True)))
+
+    detector = detector_from_args(args)
+    labelled = sum(len(plates) for _, plates in sequences)
+    print(f"{len(sequences)} sequences, {sum(len(frames) for frames, _ in sequences)} frames, "
+          f"{labelled} labelled plates")
+    print(f"{'':>13}{'ocr calls':>10}{'rejected':>10}{'avoided':>9}{'recall':>8}{'precision':>11}{'ms/frame':>10}")
+    baseline_calls = None
+    report = {}
+    for name, tracked, options in configs:
+        calls = rejected = found = reported = correct = 0
+        elapsed = 0.0
+        gate = CropQualityGate(**options) if options is not None else None
+        for frames, plates in sequences:
+            texts, sequence_calls, sequence_rejected, sequence_elapsed = quality_run(detector, frames, tracked, gate)
+            calls += sequence_calls
+            rejected += sequence_rejected
+            elapsed += sequence_elapsed
+            found += len(plates & set(texts))
+            reported += len(texts)
+            correct += sum(text in plates for text in texts)
+        if baseline_calls is None:
+            baseline_calls = calls
+        report[name] = {
+            'ocr_calls': calls,
+            'rejected': rejected,
+            'avoided': 1.0 - calls / baseline_calls if baseline_calls else 0.0,
+            'recall': found / labelled if labelled else 1.0,
+            'precision': correct / reported if reported else 1.0,
+            'ms_per_frame': elapsed * 1000.0 / sum(len(frames) for frames, _ in sequences),
+            'rejected_by': gate.stats() if gate else {}
+        }
+        row = report[name]
+        print(f"{name:>13}{calls:>10}{rejected:>10}{row['avoided']:>9.1%}{row['recall']:>8.1%}"
+              f"{row['precision']:>11.1%}{row['ms_per_frame']:>10.2f}")
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.report}")
+
+
+def random_plates(rng, count):
+    """Distinct plates shaped like AB123CD"""
+    letters = np.array(list('ABCDEFGHJKLMNPRSTUVWXYZ'))
+    digits = np.array(list('0123456789'))
+    plates = set()
+    while len(plates) < count:
+        n = count - len(plates)
+        parts = [letters[rng.integers(0, len(letters), (n, 2))], digits[rng.integers(0, 10, (n, 3))],
+                 letters[rng.integers(0, len(letters), (n, 2))]]
+        plates.update(''.join(row) for row in np.concatenate(parts, axis=1))
+    return sorted(plates)[:count]
+
+
+def misread(rng, plate, kind):
+    """plate with one OCR-style error: a confusion, substitution, insertion or deletion"""
+    position = int(rng.integers(0, len(plate)))
+    if kind == 'confusion':
+        swaps = {value: key for key, value in CONFUSIONS.items()}
+        swaps.update(CONFUSIONS)
+        positions = [i for i, char in enumerate(plate) if char in swaps] or [position]
+        position = positions[int(rng.integers(0, len(positions)))]
+        return plate[:position] + swaps.get(plate[position], 'X') + plate[position + 1:]
+    char = 'Y' if plate[position] != 'Y' else 'W'
+    if kind == 'substitution':
+        return plate[:position] + char + plate[position + 1:]
+    if kind == 'insertion':
+        return plate[:position] + char + plate[position:]
+    return plate[:position] + plate[position + 1:]
+
+
+def bench_watchlist(args):
+    """Watchlist index build time, memory and lookup latency per match kind"""
+    rng = np.random.default_rng(args.seed)
+    plates = random_plates(rng, args.entries + args.lookups)
+    listed, unlisted = plates[:args.entries], plates[args.entries:]
+
+    def load():
+        index = PlateIndex()
+        for i, plate in enumerate(listed):
+            index.add(plate, LISTS[i % len(LISTS)])
+        return index
+
+    start = time.perf_counter()
+    index = load()
+    added = time.perf_counter()
+    index.build()
+    built = time.perf_counter()
+    # Memory in a second pass, tracing slows the timed one down several times
+    tracemalloc.start()
+    load().build()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{len(index)} plates: add {(added - start) * 1000:.0f} ms, build {(built - added) * 1000:.0f} ms, "
+          f"peak traced {peak / 1e6:.1f} MB")
+
+    picks = rng.integers(0, len(listed), args.lookups)
+    queries = {
+        'exact': [listed[i] for i in picks],
+        'confusion': [misread(rng, listed[i], 'confusion') for i in picks],
+        'substitution': [misread(rng, listed[i], 'substitution') for i in picks],
+        'insertion': [misread(rng, listed[i], 'insertion') for i in picks],
+        'deletion': [misread(rng, listed[i], 'deletion') for i in picks],
+        'unknown': unlisted
+    }
+    print(f"{'query':>13}{'p50 us':>9}{'p99 us':>9}{'max us':>9}{'matched':>9}{'same':>7}")
+    for name, texts in queries.items():
+        samples = []
+        matched = same = 0
+        for text, i in zip(texts, picks):
+            started = time.perf_counter()
+            match = index.lookup(text)
+            samples.append((time.perf_counter() - started) * 1e6)
+            if match:
+                matched += 1
+                same += match.plate == listed[i]
+        samples = np.asarray(samples)
+        print(f"{name:>13}{np.percentile(samples, 50):9.1f}{np.percentile(samples, 99):9.1f}{samples.max():9.1f}"
+              f"{matched / len(texts):9.1%}{same / max(matched, 1):7.1%}")
+
+    cache = VerdictCache(capacity=args.entries // 10)
+    for plate in listed[:cache.capacity]:
+        cache.put(plate, DENY)
+    samples = []
+    for i in picks:
+        started = time.perf_counter()
+        cache.get(listed[i])
+        samples.append((time.perf_counter() - started) * 1e6)
+    print(f"{'cache get':>13}{np.percentile(samples, 50):9.1f}{np.percentile(samples, 99):9.1f}"
+          f"{max(samples):9.1f}{cache.stats()['hits'] / len(picks):9.1%}")
+
+
+def bench_sessions(args):
+    """Exit matching and snapshot cost as the number of open entry sessions grows"""
+    rng = np.random.default_rng(args.seed)
+    kinds = ('exact', 'confusion', 'substitution', 'deletion')
+    snapshot_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_sessions.json')
+    print(f"{'open':>7}{'entry us':>10}{'exit us':>9}{'p99 us':>8}{'paired':>8}{'snapshot ms':>13}{'restore ms':>12}")
+    for count in args.open:
+        plates = random_plates(rng, count)
+        correlator = SessionCorrelator(max_sessions=count)
+        now = time.time()
+        start = time.perf_counter()
+        for i, plate in enumerate(plates):
+            correlator.observe('in', plate, 'in', now + i * 0.01)
+        entry = (time.perf_counter() - start) * 1e6 / count
+
+        start = time.perf_counter()
+        correlator.snapshot(snapshot_path)
+        snapshot = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        SessionCorrelator(max_sessions=count).restore(snapshot_path)
+        restore = (time.perf_counter() - start) * 1000
+        os.remove(snapshot_path)
+
+        exits = rng.choice(count, min(count, args.exits), replace=False)
+        samples = []
+        paired = 0
+        for n, i in enumerate(exits):
+            text = plates[i] if n % len(kinds) == 0 else misread(rng, plates[i], kinds[n % len(kinds)])
+            started = time.perf_counter()
+            events = correlator.observe('out', text, 'out', now + count)
+            samples.append((time.perf_counter() - started) * 1e6)
+            paired += any(event['event_type'] == 'session' and event['plate_number'] == plates[i] for event in events)
+        print(f"{count:>7}{entry:10.1f}{np.mean(samples):9.1f}{np.percentile(samples, 99):8.1f}"
+              f"{paired / len(exits):8.1%}{snapshot:13.1f}{restore:12.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=20)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    tracker_parser = subparsers.add_parser('tracker', help=bench_tracker.__doc__)
+    tracker_parser.add_argument('--sizes', type=int, nargs='+', default=[1, 5, 10, 25, 50, 100, 200])
+    tracker_parser.set_defaults(func=bench_tracker)
+
+    roi_parser = subparsers.add_parser('roi', help=bench_roi.__doc__)
+    roi_parser.add_argument('--video', required=True)
+    roi_parser.add_argument('--model', default='license_plate_detector.pt')
+    roi_parser.add_argument('--frames', type=int, default=200)
+    roi_parser.add_argument('--imgsz', type=int, default=640)
+    roi_area = roi_parser.add_mutually_exclusive_group(required=True)
+    roi_area.add_argument('--rect', type=int, nargs=4, metavar=('X', 'Y', 'W', 'H'))
+    roi_area.add_argument('--polygon', type=int, nargs='+', metavar='XY')
+    roi_parser.set_defaults(func=bench_roi)
+
+    buffers_parser = subparsers.add_parser('buffers', help=bench_buffers.__doc__)
+    buffers_parser.add_argument('--video', required=True)
+    buffers_parser.add_argument('--frames', type=int, default=500)
+    buffers_parser.set_defaults(func=bench_buffers)
+
+    backends_parser = subparsers.add_parser('backends', help=bench_backends.__doc__)
+    backends_parser.add_argument('--video', required=True)
+    backends_parser.add_argument('--frames', type=int, default=200)
+    backends_parser.add_argument('--batch', type=int, default=4)
+    backends_parser.add_argument('--imgsz', type=int, default=640)
+    backends_parser.add_argument('--model', default='license_plate_detector.pt')
+    backends_parser.add_argument('--onnx-model', default='license_plate_detector.onnx')
+    backends_parser.add_argument('--onnx-recognizer', default='plate_recognizer.onnx')
+    backends_parser.add_argument('--dict', default='plate_recognizer_dict.txt')
+    backends_parser.add_argument('--threads', type=int, default=0, help='ONNX Runtime intra-op threads')
+    backends_parser.add_argument('--inter-threads', type=int, default=0, help='ONNX Runtime inter-op threads')
+    backends_parser.add_argument('--iou', type=float, default=0.9)
+    backends_parser.add_argument('--min-parity', type=float, default=0.95)
+    backends_parser.set_defaults(func=bench_backends)
+
+    parity_parser = subparsers.add_parser('ocr-parity', help=bench_ocr_parity.__doc__)
+    parity_source = parity_parser.add_mutually_exclusive_group(required=True)
+    parity_source.add_argument('--crops', help='Folder of plate crop images')
+    parity_source.add_argument('--video', help='Recorded video, cropped with the ultralytics detector')
+    parity_parser.add_argument('--frames', type=int, default=200)
+    parity_parser.add_argument('--imgsz', type=int, default=640)
+    parity_parser.add_argument('--model', default='license_plate_detector.pt')
+    parity_parser.add_argument('--batch', type=int, default=8)
+    parity_parser.add_argument('--det-max-aspect', type=float, default=2.0,
+                               help='Crops narrower than this width/height ratio get text detection')
+    parity_parser.add_argument('--max-mismatch', type=float, default=0.01)
+    parity_parser.set_defaults(func=bench_ocr_parity)
+
+    quantization_parser = subparsers.add_parser('quantization', help=bench_quantization.__doc__)
+    quantization_parser.add_argument('--test-set', required=True, help='Folder of images with a labels.csv (image,plate)')
+    quantization_parser.add_argument('--imgsz', type=int, default=640)
+    quantization_parser.add_argument('--onnx-model', default='license_plate_detector.onnx')
+    quantization_parser.add_argument('--onnx-recognizer', default='plate_recognizer.onnx')
+    quantization_parser.add_argument('--dict', default='plate_recognizer_dict.txt')
+    quantization_parser.add_argument('--threads', type=int, default=0)
+    quantization_parser.add_argument('--inter-threads', type=int, default=0)
+    quantization_parser.add_argument('--report', help='Write the comparison as JSON')
+    quantization_parser.set_defaults(func=bench_quantization)
+
+    startup_parser = subparsers.add_parser('startup', help=bench_startup.__doc__)
+    startup_parser.add_argument('--detector-backend', default='ultralytics', choices=sorted(DETECTOR_MODULES))
+    startup_parser.add_argument('--recognizer-backend', default='paddle', choices=sorted(RECOGNIZER_MODULES))
+    startup_parser.add_argument('--model', help='Detector model (default: the backend default)')
+    startup_parser.add_argument('--onnx-recognizer', default='plate_recognizer.onnx')
+    startup_parser.add_argument('--dict', default='plate_recognizer_dict.txt')
+    startup_parser.add_argument('--imgsz', type=int, default=640)
+    startup_parser.add_argument('--cache-dir', help='Optimized-graph cache of the onnx backends')
+    startup_parser.add_argument('--runs', type=int, default=3, help='Fresh processes to time; the first fills the cache')
+    startup_parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    startup_parser.set_defaults(func=bench_startup)
+
+    ingest_parser = subparsers.add_parser('ingest', help=bench_ingest.__doc__)
+    ingest_parser.add_argument('--url', required=True, help='RTSP URL or a local video, which reconnects at its end')
+    ingest_parser.add_argument('--seconds', type=float, default=20.0)
+    ingest_parser.add_argument('--transport', choices=['tcp', 'udp'], default='tcp')
+    ingest_parser.add_argument('--stall-timeout', type=float, default=10.0)
+    ingest_parser.add_argument('--reconnect-delay', type=float, default=0.5)
+    ingest_parser.add_argument('--verbose', action='store_true', help='Print connection changes')
+    ingest_parser.set_defaults(func=bench_ingest)
+
+    dual_parser = subparsers.add_parser('dual', help=bench_dual.__doc__.splitlines()[0])
+    dual_parser.add_argument('--main', required=True, help='Full-resolution stream of a camera')
+    dual_parser.add_argument('--sub', required=True, help='Low-resolution stream of the same camera')
+    dual_parser.add_argument('--seconds', type=float, default=10.0)
+    dual_parser.add_argument('--sample-every', type=int, default=2,
+                             help='Sub frames per main frame requested while tracks need reads')
+    dual_parser.add_argument('--read-every', type=int, default=3,
+                             help='Requests per main frame converted for an OCR crop')
+    dual_parser.add_argument('--active-fraction', type=float, default=0.2,
+                             help='Share of the time tracks need reads')
+    dual_parser.set_defaults(func=bench_dual)
+
+    suite_parser = subparsers.add_parser('suite', help=bench_suite.__doc__)
+    suite_parser.add_argument('--stages', nargs='+', choices=list(SUITE_STAGES), default=list(SUITE_STAGES))
+    suite_parser.add_argument('--streams', type=int, nargs='+', default=[1, 2, 8, 16])
+    suite_parser.add_argument('--frames', type=int, default=24, help='Frames per stream in each measurement')
+    suite_parser.add_argument('--rounds', type=int, default=3, help='Measurements per stage, the median is kept')
+    suite_parser.add_argument('--video', help='Recorded frames instead of synthetic ones')
+    suite_parser.add_argument('--batch', type=int, default=4, help='Inference batch size')
+    suite_parser.add_argument('--imgsz', type=int, default=640)
+    suite_parser.add_argument('--stream-fps', type=float, default=10.0, help='Frames per second of each e2e stream')
+    suite_parser.add_argument('--e2e-seconds', type=float, default=3.0)
+    suite_parser.add_argument('--detector-backend', default='stub', choices=sorted(DETECTOR_MODULES))
+    suite_parser.add_argument('--recognizer-backend', default='stub', choices=sorted(RECOGNIZER_MODULES))
+    suite_parser.add_argument('--model', help='Detector model (default: the backend default)')
+    suite_parser.add_argument('--onnx-recognizer', default='plate_recognizer.onnx')
+    suite_parser.add_argument('--dict', default='plate_recognizer_dict.txt')
+    suite_parser.add_argument('--threads', type=int, default=0, help='ONNX Runtime intra-op threads')
+    suite_parser.add_argument('--output', help='Write the results as JSON')
+    suite_parser.add_argument('--baseline', help='Compare with results saved by --save-baseline')
+    suite_parser.add_argument('--save-baseline', help='Write the results as the new baseline')
+    suite_parser.add_argument('--threshold', type=float, default=0.15,
+                              help='Fail when fps drops or p95 latency grows by more than this fraction')
+    suite_parser.add_argument('--min-delta-ms', type=float, default=0.5,
+                              help='Ignore p95 latency growth smaller than this')
+    suite_parser.set_defaults(func=bench_suite)
+
+    watchlist_parser = subparsers.add_parser('watchlist', help=bench_watchlist.__doc__)
+    watchlist_parser.add_argument('--entries', type=int, default=100000)
+    watchlist_parser.add_argument('--lookups', type=int, default=10000, help='Lookups per query kind')
+    watchlist_parser.set_defaults(func=bench_watchlist)
+
+    quality_parser = subparsers.add_parser('quality', help=bench_quality.__doc__.splitlines()[0])
+    quality_parser.add_argument('--test-set', help='Folder of images with a labels.csv (image,plate)')
+    quality_parser.add_argument('--video', help='Recorded video, tracked like a camera')
+    quality_parser.add_argument('--plates', nargs='+', help='Plates that appear in --video')
+    quality_parser.add_argument('--frames', type=int, default=300)
+    quality_parser.add_argument('--blur-fraction', type=float, default=0.3, help='Synthetic frames with motion blur')
+    quality_parser.add_argument('--blur-length', type=int, default=9, help='Motion blur length in pixels')
+    quality_parser.add_argument('--min-sharpness', type=float,
+                                help='Gate threshold (default: 30, 500 for synthetic frames)')
+    quality_parser.add_argument('--top-k', type=int, default=3, help='Reads per vehicle, then only sharper crops; 0 for no limit')
+    quality_parser.add_argument('--deskew', action='store_true', help='Also run the gate with deskew')
+    quality_parser.add_argument('--imgsz', type=int, default=640)
+    quality_parser.add_argument('--detector-backend', default='stub', choices=sorted(DETECTOR_MODULES))
+    quality_parser.add_argument('--recognizer-backend', default='stub', choices=sorted(RECOGNIZER_MODULES))
+    quality_parser.add_argument('--model', help='Detector model (default: the backend default)')
+    quality_parser.add_argument('--onnx-recognizer', default='plate_recognizer.onnx')
+    quality_parser.add_argument('--dict', default='plate_recognizer_dict.txt')
+    quality_parser.add_argument('--threads', type=int, default=0, help='ONNX Runtime intra-op threads')
+    quality_parser.add_argument('--report', help='Write the comparison as JSON')
+    quality_parser.set_defaults(func=bench_quality)
+
+    sessions_parser = subparsers.add_parser('sessions', help=bench_sessions.__doc__)
+    sessions_parser.add_argument('--open', type=int, nargs='+', default=[1000, 10000, 50000])
+    sessions_parser.add_argument('--exits', type=int, default=5000, help='Exits matched at each size')
+    sessions_parser.set_defaults(func=bench_sessions)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
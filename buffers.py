@@ -0,0 +1,88 @@
+"""
+Reusable frame buffers
+Decoded frames are read into pooled arrays and handed back to the pool
+once every pipeline stage holding them has released them
+"""
+
+import threading
+
+
+class FrameBuffer:
+    """Pooled frame array with a reference count"""
+
+    __slots__ = ('array', 'pool', 'refs')
+
+    def __init__(self, pool, array=None):
+        self.pool = pool
+        self.array = array
+        self.refs = 0
+
+    def retain(self):
+        with self.pool.lock:
+            self.refs += 1
+        return self
+
+    def release(self):
+        with self.pool.lock:
+            self.refs -= 1
+            if self.refs > 0:
+                return
+        self.pool.recycle(self)
+
+
+class FramePool:
+    """Free list of frame buffers for one stream
+
+    read() decodes with cap.read(image=...) into a free buffer so OpenCV
+    reuses its memory; a buffer whose shape no longer matches the stream
+    is replaced by the newly decoded array. At most size idle buffers are
+    kept, extra ones are left to the garbage collector.
+    """
+
+    def __init__(self, size=16):
+        self.size = size
+        self.lock = threading.Lock()
+        self.free = []
+        self.allocated_count = 0
+        self.reused_count = 0
+
+    def acquire(self):
+        with self.lock:
+            buffer = self.free.pop() if self.free else FrameBuffer(self)
+            buffer.refs = 1
+        return buffer
+
+    def recycle(self, buffer):
+        with self.lock:
+            if len(self.free) < self.size:
+                self.free.append(buffer)
+
+    def read(self, cap):
+        """Decode the next frame into a pooled buffer, returns (ret, buffer)"""
+        return self._decode(cap.read)
+
+    def retrieve(self, cap):
+        """Convert the last grabbed frame into a pooled buffer, returns (ret, buffer)"""
+        return self._decode(cap.retrieve)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'free': len(self.free),
+                'allocated': self.allocated_count,
+                'reused': self.reused_count
+            }
+
+    def _decode(self, decode):
+        buffer = self.acquire()
+        if buffer.array is None:
+            ret, frame = decode()
+        else:
+            ret, frame = decode(image=buffer.array)
+        if ret:
+            if frame is buffer.array:
+                self.reused_count += 1
+            else:
+                buffer.array = frame
+                self.allocated_count += 1
+        return ret, buffer
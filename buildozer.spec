@@ -20,7 +20,7 @@ version = 0.1
 
 # (list) Application requirements
 # comma separated e.g. requirements = sqlite3,kivy
-requirements = python3,kivy,opencv-python,numpy,ultralytics,torch,torchvision,pillow,paddlepaddle,paddleocr,plyer,requests
+requirements = python3,sqlite3,kivy,opencv-python,numpy,ultralytics,torch,torchvision,pillow,paddlepaddle,paddleocr,plyer,requests
 
 # (str) Supported orientation (one of landscape, sensorLandscape, portrait or all)
 orientation = portrait
@@ -0,0 +1,120 @@
+"""
+Camera registry
+The set of streams to process, loaded from a JSON config instead of the
+fixed IN/OUT pair
+"""
+
+import json
+
+
+class Camera:
+    """One RTSP stream
+
+    camera_id names the stream in logs and API events, direction is 'in'
+    or 'out' for the gate it watches, and region is an optional
+    DetectionRegion config ({'rect': ...} or {'polygon': ...}). ingest
+    overrides StreamIngest options such as transport for this camera.
+    With a sub_url, detection runs on that low-resolution stream and url
+    is only read for plate crops; region is then in sub-stream pixels.
+    """
+
+    def __init__(self, camera_id, url, direction=None, region=None, enabled=True, ingest=None, sub_url=None):
+        self.camera_id = camera_id
+        self.url = url
+        self.sub_url = sub_url
+        self.direction = direction
+        self.region = region
+        self.enabled = enabled
+        self.ingest = ingest or {}
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(
+            config['id'],
+            config['url'],
+            direction=config.get('direction'),
+            region=config.get('region'),
+            enabled=config.get('enabled', True),
+            ingest=config.get('ingest'),
+            sub_url=config.get('sub_url')
+        )
+
+    def to_config(self):
+        config = {'id': self.camera_id, 'url': self.url}
+        if self.sub_url:
+            config['sub_url'] = self.sub_url
+        if self.direction:
+            config['direction'] = self.direction
+        if self.region:
+            config['region'] = self.region
+        if not self.enabled:
+            config['enabled'] = False
+        if self.ingest:
+            config['ingest'] = self.ingest
+        return config
+
+
+class CameraRegistry:
+    """Ordered collection of cameras, keyed by camera_id
+
+    The config file looks like:
+
+        {"cameras": [
+            {"id": "gate1-in", "url": "rtsp://...streamType=main", "direction": "in",
+             "sub_url": "rtsp://...streamType=sub",
+             "region": {"rect": [130, 100, 370, 230]}},
+            {"id": "gate1-out", "url": "rtsp://...", "direction": "out",
+             "ingest": {"transport": "udp"}}
+        ]}
+    """
+
+    def __init__(self, cameras=()):
+        self.cameras = {}
+        for camera in cameras:
+            self.add(camera)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            config = json.load(f)
+        return cls(Camera.from_config(entry) for entry in config.get('cameras', []))
+
+    @classmethod
+    def from_urls(cls, urls, regions=None):
+        """Registry of {camera_id: url}; ids 'in' and 'out' double as directions"""
+        regions = regions or {}
+        return cls(
+            Camera(camera_id, url, direction=camera_id if camera_id in ('in', 'out') else None,
+                   region=regions.get(camera_id))
+            for camera_id, url in urls.items()
+        )
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump({'cameras': [camera.to_config() for camera in self.cameras.values()]}, f, indent=2)
+
+    def add(self, camera):
+        if camera.camera_id in self.cameras:
+            raise ValueError(f"Duplicate camera id: {camera.camera_id}")
+        self.cameras[camera.camera_id] = camera
+
+    def remove(self, camera_id):
+        return self.cameras.pop(camera_id, None)
+
+    def get(self, camera_id):
+        return self.cameras.get(camera_id)
+
+    def enabled(self):
+        return [camera for camera in self.cameras.values() if camera.enabled]
+
+    def shards(self, count):
+        """Enabled cameras dealt round-robin into at most count groups"""
+        cameras = self.enabled()
+        count = max(1, min(count, len(cameras)))
+        return [cameras[index::count] for index in range(count)] if cameras else []
+
+    def __iter__(self):
+        return iter(self.cameras.values())
+
+    def __len__(self):
+        return len(self.cameras)
@@ -0,0 +1,221 @@
+"""
+Background delivery of detection events to the API
+Events are queued without blocking the caller and posted in batches over
+a pooled keep-alive session, with exponential backoff and jitter on failure.
+With a spool attached, events are persisted first and replayed after outages
+"""
+
+import queue
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import pipeline_metrics
+from pipeline import BoundedQueue, DROP_OLDEST
+
+
+class EventDelivery:
+    """Posts queued events as {"events": [...]} batches from a worker thread
+
+    A batch is sent once batch_size events are waiting or flush_interval
+    seconds after its first event arrived. Failed posts are retried up to
+    max_retries times, sleeping a random time up to
+    min(backoff_max, backoff_base * 2 ** attempt) between attempts.
+    on_result(events, ok, detail) is called after every batch and
+    on_response(events, body) with the decoded JSON body of every
+    accepted one.
+
+    When a spool.EventSpool is given, events are appended to it instead
+    of the in-memory queue and a batch is only committed once it has been
+    accepted (or rejected with a non-retryable status). Failed batches stay
+    in the spool and are retried until the link comes back; a backlog
+    larger than one batch is then drained at no more than replay_rate
+    events per second. A spooled batch interrupted by stop() while waiting
+    to retry is neither counted nor reported as failed, it is sent again
+    on the next start.
+    """
+
+    def __init__(self, api_url, batch_size=20, flush_interval=1.0, queue_size=1000,
+                 max_retries=5, backoff_base=0.5, backoff_max=30.0, timeout=5, pool_size=2,
+                 spool=None, replay_rate=50.0, compact_interval=60.0, on_result=None, on_response=None):
+        self.api_url = api_url
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.on_result = on_result
+        self.on_response = on_response
+        self.spool = spool
+        self.replay_rate = replay_rate
+        self.compact_interval = compact_interval
+        self.queue = BoundedQueue(queue_size, DROP_OLDEST, name='delivery')
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self._lock = threading.Lock()
+        self.queued_count = 0
+        self.sent_count = 0
+        self.failed_count = 0
+        self.retry_count = 0
+
+        self._stop_event = threading.Event()
+        self.thread = None
+        pipeline_metrics.gauge('delivery_queue_depth', self.queue.__len__)
+
+    def start(self):
+        if self.thread:
+            return
+        self._stop_event.clear()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout=5.0):
+        """Stop the worker after it flushes what is already queued"""
+        self._stop_event.set()
+        thread = self.thread
+        if thread:
+            thread.join(timeout)
+            self.thread = None
+
+    def enqueue(self, event):
+        """Queue an event for delivery, never blocks on the network"""
+        with self._lock:
+            self.queued_count += 1
+        if self.spool:
+            self.spool.append(event)
+        else:
+            self.queue.put(event)
+
+    def stats(self):
+        with self._lock:
+            stats = {
+                'queued': self.queued_count,
+                'sent': self.sent_count,
+                'failed': self.failed_count,
+                'retries': self.retry_count,
+                'dropped': self.queue.dropped_count,
+                'pending': len(self.queue)
+            }
+        if self.spool:
+            stats['dropped'] = self.spool.expired_count
+            stats['pending'] = self.spool.pending()
+        return stats
+
+    def _next_batch(self):
+        try:
+            batch = [self.queue.get(timeout=0.5)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or self._stop_event.is_set():
+                remaining = 0
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        if self.spool:
+            self._run_spooled()
+            return
+        while not self._stop_event.is_set() or len(self.queue):
+            batch = self._next_batch()
+            if batch:
+                self._deliver(batch)
+
+    def _run_spooled(self):
+        last_compact = time.monotonic()
+        while not self._stop_event.is_set():
+            self.spool.flush()
+            records = self.spool.read(self.batch_size)
+            if not records:
+                self._stop_event.wait(self.flush_interval)
+                continue
+
+            # Give a partial batch until flush_interval after its oldest event to fill up
+            wait = self.flush_interval - (time.time() - records[0][1])
+            if len(records) < self.batch_size and wait > 0:
+                if not self._stop_event.wait(wait):
+                    self.spool.flush()
+                    records = self.spool.read(self.batch_size)
+
+            backlog = self.spool.pending() > self.batch_size
+            started = time.monotonic()
+            ok, retryable = self._deliver([event for _, _, event in records])
+            if ok or not retryable:
+                self.spool.commit(records[-1][0])
+            elif not self._stop_event.is_set():
+                # Link is down, keep the events and try again later
+                self._stop_event.wait(self.backoff_max)
+                continue
+
+            if backlog and self.replay_rate:
+                self._stop_event.wait(len(records) / self.replay_rate - (time.monotonic() - started))
+
+            if time.monotonic() - last_compact >= self.compact_interval:
+                self.spool.compact()
+                last_compact = time.monotonic()
+        self.spool.flush()
+
+    def _deliver(self, batch):
+        """Post a batch with retries, returns (ok, retryable)"""
+        detail = None
+        retryable = True
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                with self._lock:
+                    self.retry_count += 1
+                delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1)))
+                if self._stop_event.wait(delay):
+                    if self.spool:
+                        # Still in the spool, not a failure
+                        return False, True
+                    break
+            try:
+                started = time.monotonic()
+                response = self.session.post(self.api_url, json={'events': batch}, timeout=self.timeout)
+                pipeline_metrics.observe('deliver', time.monotonic() - started)
+                if response.status_code == 200:
+                    with self._lock:
+                        self.sent_count += len(batch)
+                    pipeline_metrics.count('events_sent', amount=len(batch))
+                    self._report(batch, True, response.status_code)
+                    self._respond(batch, response)
+                    return True, True
+                detail = f"status: {response.status_code}"
+                # Client errors will not succeed on retry
+                if 400 <= response.status_code < 500 and response.status_code != 429:
+                    retryable = False
+                    break
+            except requests.RequestException as e:
+                detail = str(e)
+
+        with self._lock:
+            self.failed_count += len(batch)
+        pipeline_metrics.count('events_failed', amount=len(batch))
+        self._report(batch, False, detail)
+        return False, retryable
+
+    def _report(self, batch, ok, detail):
+        if self.on_result:
+            self.on_result(batch, ok, detail)
+
+    def _respond(self, batch, response):
+        if not self.on_response:
+            return
+        try:
+            body = response.json()
+        except ValueError:
+            return
+        self.on_response(batch, body)
@@ -0,0 +1,215 @@
+"""
+License plate detector
+Runs plate detection and batched OCR through the configured backends and
+feeds the reads of tracked streams into their trackers
+"""
+
+import time
+
+import cv2
+import numpy as np
+
+from backends import create_detector, create_recognizer
+from metrics import pipeline_metrics
+from ocr_scheduler import CropQualityGate, crop_plate, deskew_plate
+
+
+class LicensePlateDetector:
+    # PP-OCR recognition models take 48px high inputs, so crops are
+    # normalized to that height before being batched together
+    OCR_HEIGHT = 48
+    OCR_MAX_WIDTH = 320
+
+    def __init__(self, model_path="license_plate_detector.pt", ocr_batch_size=8, inference_size=640,
+                 detector_backend='ultralytics', recognizer_backend='paddle',
+                 detector_options=None, recognizer_options=None, quantized=False, cache_dir=None,
+                 crop_quality=None):
+        """Backends are looked up in backends.py; options go to their constructors
+
+        quantized loads the INT8 models of the 'onnx' backends, and cache_dir
+        keeps their optimized graphs between launches. crop_quality holds
+        CropQualityGate options ({} for the defaults); without it every
+        crop is OCR'd.
+        """
+        detector_options = dict(detector_options or {})
+        recognizer_options = dict(recognizer_options or {})
+        if detector_backend == 'ultralytics':
+            detector_options.setdefault('model_path', model_path)
+        if recognizer_backend == 'paddle':
+            recognizer_options.setdefault('batch_size', ocr_batch_size)
+        if quantized:
+            if detector_backend != 'onnx' or recognizer_backend != 'onnx':
+                raise ValueError("Quantized models need the 'onnx' detector and recognizer backends")
+            detector_options['quantized'] = True
+            recognizer_options['quantized'] = True
+        if cache_dir:
+            if detector_backend == 'onnx':
+                detector_options.setdefault('cache_dir', cache_dir)
+            if recognizer_backend == 'onnx':
+                recognizer_options.setdefault('cache_dir', cache_dir)
+        self.detector = create_detector(detector_backend, **detector_options)
+        self.recognizer = create_recognizer(recognizer_backend, **recognizer_options)
+        self.inference_size = inference_size
+        self.ocr_batch_size = ocr_batch_size
+        self.crop_quality = CropQualityGate(**crop_quality) if crop_quality is not None else None
+        # Resized crops are written into this buffer instead of fresh arrays
+        self.ocr_batch = np.zeros((ocr_batch_size, self.OCR_HEIGHT, self.OCR_MAX_WIDTH, 3), dtype=np.uint8)
+
+    def warm_up(self):
+        """Run the detector and recognizer once on blank input, so the first frame does not pay for lazy setup"""
+        self.detect_batch([np.zeros((self.inference_size * 9 // 16, self.inference_size, 3), dtype=np.uint8)])
+        self.recognize_batch([np.zeros((self.OCR_HEIGHT, self.OCR_MAX_WIDTH // 2, 3), dtype=np.uint8)])
+
+    def detect_and_recognize(self, frame):
+        return self.detect_and_recognize_batch([frame])[0]
+
+    def detect_batch(self, frames, regions=None):
+        """Plate boxes as (x, y, w, h) per frame, from one detector call
+
+        Frames with a DetectionRegion are cropped to it and downscaled to
+        inference_size first; boxes are mapped back to full-resolution
+        coordinates so plate crops keep every pixel.
+        """
+        if regions is None:
+            regions = [None] * len(frames)
+        images = []
+        transforms = []
+        for frame, region in zip(frames, regions):
+            if region is None:
+                images.append(frame)
+                transforms.append(None)
+            else:
+                image, transform = region.prepare(frame, self.inference_size)
+                images.append(image)
+                transforms.append(transform)
+
+        outputs = self.detector.detect(images, self.inference_size)
+        detections = []
+
+        for frame, region, transform, xyxy in zip(frames, regions, transforms, outputs):
+            if region is None:
+                xyxy = xyxy.astype(np.int64)
+                boxes = [(int(x1), int(y1), int(x2-x1), int(y2-y1)) for x1, y1, x2, y2 in xyxy]
+            else:
+                boxes = region.map_boxes(xyxy, transform, frame.shape)
+            detections.append(boxes)
+
+        return detections
+
+    def detect_and_recognize_batch(self, frames, schedulers=None, timestamp=None, regions=None, crop_frames=None):
+        """Detect plates in several frames and OCR all of their crops in batches
+
+        When an OcrScheduler is given per frame, boxes are assigned to its
+        stream's tracks first, only the crops the scheduler picks are OCR'd
+        and their reads are voted into the tracks. A crop frame given for a
+        frame (its main-stream counterpart, or a callable returning it that
+        is only called when a crop is read) supplies the crops, while the
+        reported boxes stay in the coordinates of the detection frame.
+        Crops rejected by the crop quality gate are not OCR'd at all.
+        timestamp is the tracker time of the whole batch, or a list with
+        one per frame. Detect, track, crop and OCR times of the batch are
+        recorded in pipeline_metrics.
+        """
+        started = time.monotonic()
+        detections = self.detect_batch(frames, regions)
+        detected = time.monotonic()
+        if schedulers is None:
+            schedulers = [None] * len(frames)
+        if crop_frames is None:
+            crop_frames = [None] * len(frames)
+        if not isinstance(timestamp, (list, tuple)):
+            timestamp = [timestamp] * len(frames)
+        crops = []
+        owners = []
+        track_time = 0.0
+        quality = self.crop_quality
+        rejected = quality.rejected_count if quality else 0
+
+        for frame_index, (frame, boxes, scheduler, crop_frame) in enumerate(
+                zip(frames, detections, schedulers, crop_frames)):
+            if scheduler:
+                track_started = time.monotonic()
+                track_ids = scheduler.tracker.update_boxes(boxes, timestamp[frame_index])
+                track_time += time.monotonic() - track_started
+                for track_id, bbox, plate_img in scheduler.select(frame, boxes, track_ids, crop_frame, quality):
+                    crops.append(plate_img)
+                    owners.append((frame_index, bbox, track_id))
+                continue
+
+            if boxes and callable(crop_frame):
+                crop_frame = crop_frame()
+                if crop_frame is None:
+                    # The main frame was refused, sub-stream crops are not read
+                    continue
+            for bbox in boxes:
+                # Crop the license plate
+                plate_img = crop_plate(frame, bbox, crop_frame)
+                if plate_img.size == 0:
+                    continue
+                if quality and quality.check(plate_img)[0]:
+                    continue
+                crops.append(plate_img)
+                owners.append((frame_index, bbox, None))
+
+        if quality and quality.deskew:
+            crops = [deskew_plate(crop) for crop in crops]
+        cropped = time.monotonic()
+        texts = self.recognize_batch(crops)
+        recognized = time.monotonic()
+        pipeline_metrics.observe('detect', detected - started)
+        if track_time:
+            pipeline_metrics.observe('track', track_time)
+        pipeline_metrics.observe('crop', cropped - detected - track_time)
+        if crops:
+            pipeline_metrics.observe('ocr', recognized - cropped)
+            pipeline_metrics.count('ocr_crops', amount=len(crops))
+        if quality and quality.rejected_count > rejected:
+            pipeline_metrics.count('ocr_rejected', amount=quality.rejected_count - rejected)
+
+        plates = [[] for _ in frames]
+        for (frame_index, bbox, track_id), (text, confidence) in zip(owners, texts):
+            if text and confidence > 0.5:  # Filter low confidence results
+                plate = {
+                    'bbox': bbox,
+                    'text': text,
+                    'confidence': confidence
+                }
+                if track_id is not None:
+                    plate['track_id'] = track_id
+                    schedulers[frame_index].tracker.add_reading(track_id, text, confidence)
+                plates[frame_index].append(plate)
+
+        return plates
+
+    def recognize_batch(self, crops):
+        """OCR plate crops, at most ocr_batch_size crops per recognizer call
+
+        Crops the recognizer wants a text detection pass for (see
+        PaddleRecognizer.needs_detection) are read one at a time at full
+        size instead of being resized into the batch.
+        """
+        texts = [None] * len(crops)
+        needs_detection = getattr(self.recognizer, 'needs_detection', None)
+        batched = []
+        for index, crop in enumerate(crops):
+            if needs_detection and needs_detection(crop):
+                texts[index] = self.recognizer.read(crop)
+            else:
+                batched.append(index)
+        for start in range(0, len(batched), self.ocr_batch_size):
+            chunk = batched[start:start + self.ocr_batch_size]
+            batch = self._prepare_ocr_batch([crops[index] for index in chunk])
+            for index, read in zip(chunk, self.recognizer.recognize(batch)):
+                texts[index] = read
+        return texts
+
+    def _prepare_ocr_batch(self, crops):
+        """Resize crops to OCR_HEIGHT into views of the reusable batch buffer"""
+        views = []
+        for index, crop in enumerate(crops):
+            h, w = crop.shape[:2]
+            width = min(self.OCR_MAX_WIDTH, max(1, int(round(w * self.OCR_HEIGHT / h))))
+            view = self.ocr_batch[index, :, :width]
+            cv2.resize(crop, (width, self.OCR_HEIGHT), dst=view, interpolation=cv2.INTER_LINEAR)
+            views.append(view)
+        return views
@@ -0,0 +1,159 @@
+"""
+Export the plate detector and text recognizer to ONNX
+Produces the files the 'onnx' backends in backends.py load by default:
+
+    python export_models.py
+    python export_models.py --detector license_plate_detector.pt --imgsz 640 --output-dir models
+    python export_models.py --skip-detector --skip-recognizer --quantize --calibration-dir frames/
+
+--quantize calibrates static INT8 (QDQ) variants, *.int8.onnx, from sample
+frames of the site; the recognizer is calibrated on the plates the FP32
+detector finds in them
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+
+import cv2
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+def export_detector(model_path, output_dir, imgsz, opset):
+    """YOLOv8 .pt to ONNX with a dynamic batch axis"""
+    from ultralytics import YOLO
+
+    exported = YOLO(model_path).export(format='onnx', imgsz=imgsz, dynamic=True, simplify=True, opset=opset)
+    target = os.path.join(output_dir, os.path.splitext(os.path.basename(model_path))[0] + '.onnx')
+    if os.path.abspath(exported) != os.path.abspath(target):
+        shutil.move(exported, target)
+    return target
+
+
+def find_recognizer_model():
+    """Directory of the PP-OCR English recognizer PaddleOCR downloaded"""
+    from paddleocr import PaddleOCR
+
+    ocr = PaddleOCR(use_angle_cls=False, lang='en', show_log=False)
+    return ocr.args.rec_model_dir, ocr.args.rec_char_dict_path
+
+
+def export_recognizer(output_dir, opset, model_dir=None, dict_path=None):
+    """PP-OCR inference model to ONNX via paddle2onnx, plus its character dictionary"""
+    if model_dir is None or dict_path is None:
+        default_dir, default_dict = find_recognizer_model()
+        model_dir = model_dir or default_dir
+        dict_path = dict_path or default_dict
+
+    target = os.path.join(output_dir, 'plate_recognizer.onnx')
+    subprocess.run([
+        sys.executable, '-m', 'paddle2onnx.command',
+        '--model_dir', model_dir,
+        '--model_filename', 'inference.pdmodel',
+        '--params_filename', 'inference.pdiparams',
+        '--save_file', target,
+        '--opset_version', str(opset)
+    ], check=True)
+    shutil.copyfile(dict_path, os.path.join(output_dir, 'plate_recognizer_dict.txt'))
+    return target
+
+
+def list_images(folder, limit=None):
+    """Sorted image paths of a folder"""
+    paths = sorted(os.path.join(folder, name) for name in os.listdir(folder)
+                   if name.lower().endswith(IMAGE_EXTENSIONS))
+    return paths[:limit] if limit else paths
+
+
+class BlobCalibrationReader:
+    """CalibrationDataReader feeding precomputed model inputs one at a time"""
+
+    def __init__(self, input_name, blobs):
+        self.input_name = input_name
+        self.blobs = iter(blobs)
+
+    def get_next(self):
+        blob = next(self.blobs, None)
+        return None if blob is None else {self.input_name: blob}
+
+
+def quantize_model(model_path, reader):
+    """Static INT8 quantization with per-channel weights, written next to the FP32 model"""
+    from onnxruntime.quantization import QuantFormat, QuantType, quantize_static
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    from backends import quantized_path
+
+    target = quantized_path(model_path)
+    prepared = os.path.splitext(model_path)[0] + '.prep.onnx'
+    quant_pre_process(model_path, prepared)
+    try:
+        quantize_static(prepared, target, reader, quant_format=QuantFormat.QDQ, per_channel=True,
+                        activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8)
+    finally:
+        os.remove(prepared)
+    return target
+
+
+def quantize_models(output_dir, calibration_dir, imgsz, limit):
+    """INT8 detector and recognizer calibrated on the frames of calibration_dir"""
+    from backends import OnnxDetector, OnnxRecognizer
+
+    paths = list_images(calibration_dir, limit)
+    if not paths:
+        raise SystemExit(f"No calibration images in {calibration_dir}")
+    frames = [cv2.imread(path) for path in paths]
+    detector_path = os.path.join(output_dir, 'license_plate_detector.onnx')
+    recognizer_path = os.path.join(output_dir, 'plate_recognizer.onnx')
+
+    detector = OnnxDetector(detector_path)
+    crops = []
+    for frame in frames:
+        for x1, y1, x2, y2 in detector.detect([frame], imgsz)[0].astype(int):
+            crop = frame[max(0, y1):y2, max(0, x1):x2]
+            if crop.size:
+                crops.append(crop)
+    print(f"Calibrating on {len(frames)} frames and {len(crops)} plate crops")
+
+    blobs = (detector.preprocess([frame], imgsz)[0] for frame in frames)
+    print(f"Detector: {quantize_model(detector_path, BlobCalibrationReader(detector.input_name, blobs))}")
+    if crops:
+        recognizer = OnnxRecognizer(recognizer_path, os.path.join(output_dir, 'plate_recognizer_dict.txt'))
+        blobs = (recognizer.preprocess([crop]) for crop in crops)
+        print(f"Recognizer: {quantize_model(recognizer_path, BlobCalibrationReader(recognizer.input_name, blobs))}")
+    else:
+        print("Recognizer: skipped, no plates found in the calibration frames")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--detector', default='license_plate_detector.pt')
+    parser.add_argument('--imgsz', type=int, default=640)
+    parser.add_argument('--opset', type=int, default=12)
+    parser.add_argument('--output-dir', default='.')
+    parser.add_argument('--rec-model-dir', help='PP-OCR inference model directory (default: PaddleOCR English model)')
+    parser.add_argument('--rec-dict', help='Character dictionary of the recognizer')
+    parser.add_argument('--skip-detector', action='store_true')
+    parser.add_argument('--skip-recognizer', action='store_true')
+    parser.add_argument('--quantize', action='store_true', help='Also write INT8 models calibrated on --calibration-dir')
+    parser.add_argument('--calibration-dir', help='Folder of sample frames from the site')
+    parser.add_argument('--calibration-frames', type=int, default=300)
+    args = parser.parse_args()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    if not args.skip_detector:
+        print(f"Detector: {export_detector(args.detector, args.output_dir, args.imgsz, args.opset)}")
+    if not args.skip_recognizer:
+        print(f"Recognizer: {export_recognizer(args.output_dir, args.opset, args.rec_model_dir, args.rec_dict)}")
+    if args.quantize:
+        if not args.calibration_dir:
+            parser.error('--quantize needs --calibration-dir')
+        quantize_models(args.output_dir, args.calibration_dir, args.imgsz, args.calibration_frames)
+    print("Check parity with: python benchmark.py backends --video <recording>")
+
+
+if __name__ == '__main__':
+    main()
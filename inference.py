@@ -0,0 +1,163 @@
+"""
+Shared inference service
+A single worker owns the detector models and serves frames submitted by
+any number of streams, grouping them into micro-batches
+"""
+
+import collections
+import queue
+import threading
+import time
+
+from metrics import pipeline_metrics
+from pipeline import BoundedQueue, StageCounters, DROP_OLDEST
+
+
+InferenceRequest = collections.namedtuple(
+    'InferenceRequest',
+    ['stream_id', 'frame', 'callback', 'captured_at', 'scheduler', 'region', 'buffer', 'crop_source', 'session']
+)
+
+
+class InferenceService:
+    """Serializes model access for all streams and batches their frames
+
+    Streams call submit() with a callback; the worker collects up to
+    max_batch_size frames (waiting at most max_wait_ms after the first
+    one), runs the detector once for the whole batch and hands each
+    stream its own plates through callback(stream_id, plates, captured_at,
+    error=None); a failed batch reports an empty list and the exception.
+    A stream that passes its OcrScheduler has its boxes tracked and its
+    OCR scheduled in the same worker, so trackers are never touched from
+    two threads; a DetectionRegion limits detection to part of the frame.
+    A pooled FrameBuffer passed with the frame is released once the frame
+    has been processed or dropped from the queue. A crop_source (an
+    ingest.MainFrameRequest) supplies the same moment at a higher
+    resolution for plate crops; it is only called when a crop is read and
+    released with the frame.
+    Queue wait, read-to-result latency and dropped frames are recorded per
+    stream in pipeline_metrics.
+
+    stop() releases the buffers of requests still queued. Requests belong
+    to the start()/stop() session they were submitted in and are never
+    called back once it has ended, even if the service was restarted.
+    """
+
+    def __init__(self, detector, max_batch_size=4, max_wait_ms=20, queue_size=8, queue_policy=DROP_OLDEST):
+        self.detector = detector
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.requests = BoundedQueue(queue_size, queue_policy, name='inference_requests', on_drop=self._drop)
+        self.counters = StageCounters('inference')
+        self.batch_count = 0
+        self.session = 0
+        self.running = False
+        self.thread = None
+        pipeline_metrics.gauge('inference_queue_depth', self.requests.__len__)
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.session += 1
+        self.thread = threading.Thread(target=self._run, args=(self.session,), daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout=2.0):
+        self.running = False
+        self.session += 1
+        if self.thread:
+            self.thread.join(timeout)
+            self.thread = None
+        # Nothing will process the requests left behind, give their buffers back
+        while True:
+            try:
+                self._release(self.requests.get(timeout=0))
+            except queue.Empty:
+                break
+
+    def submit(self, stream_id, frame, callback, captured_at=None, scheduler=None, region=None, buffer=None,
+               crop_source=None):
+        """Queue a frame for detection, returns False if it was rejected"""
+        if captured_at is None:
+            captured_at = time.monotonic()
+        request = InferenceRequest(stream_id, frame, callback, captured_at, scheduler, region, buffer, crop_source,
+                                   self.session if self.running else None)
+        accepted = self.requests.put(request, timeout=self.max_wait)
+        pipeline_metrics.count('submitted', stream_id)
+        return accepted
+
+    def stats(self):
+        stats = self.counters.stats()
+        stats['batches'] = self.batch_count
+        stats['avg_batch_size'] = stats['processed'] / self.batch_count if self.batch_count else 0.0
+        stats['queue'] = self.requests.stats()
+        return stats
+
+    def _next_batch(self):
+        try:
+            batch = [self.requests.get(timeout=0.5)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.requests.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self, session):
+        while self.running and self.session == session:
+            batch = self._next_batch()
+            # Left over from an earlier session, or submitted while stopped
+            stale = [request for request in batch if request.session != session]
+            for request in stale:
+                self._release(request)
+            batch = [request for request in batch if request.session == session]
+            if not batch:
+                continue
+            started = time.monotonic()
+            for request in batch:
+                pipeline_metrics.observe('queue', started - request.captured_at, request.stream_id)
+
+            try:
+                results = self.detector.detect_and_recognize_batch(
+                    [request.frame for request in batch],
+                    schedulers=[request.scheduler for request in batch],
+                    timestamp=time.time(),
+                    regions=[request.region for request in batch],
+                    crop_frames=[request.crop_source for request in batch]
+                )
+            except Exception as e:
+                for request in batch:
+                    self._release(request)
+                    if self.session != session:
+                        continue
+                    self.counters.error()
+                    pipeline_metrics.count('inference_errors', request.stream_id)
+                    request.callback(request.stream_id, [], request.captured_at, error=e)
+                continue
+
+            self.batch_count += 1
+            for request, plates in zip(batch, results):
+                self._release(request)
+                if self.session != session:
+                    continue
+                latency = time.monotonic() - request.captured_at
+                self.counters.record(latency)
+                pipeline_metrics.observe('inference', latency, request.stream_id)
+                request.callback(request.stream_id, plates, request.captured_at)
+
+    def _drop(self, request):
+        pipeline_metrics.count('dropped_frames', request.stream_id)
+        self._release(request)
+
+    def _release(self, request):
+        if request.buffer is not None:
+            request.buffer.release()
+        if request.crop_source is not None:
+            request.crop_source.release()
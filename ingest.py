@@ -0,0 +1,465 @@
+"""
+Resilient stream ingest
+Opens a camera with transport and timeout options, reconnects with
+exponential backoff and reports uptime, reconnects and decode rate
+"""
+
+import collections
+import contextlib
+import os
+import random
+import threading
+import time
+
+import cv2
+
+from buffers import FramePool
+
+CAPTURE_OPTIONS_ENV = 'OPENCV_FFMPEG_CAPTURE_OPTIONS'
+
+
+class CaptureOptions:
+    """Hands OPENCV_FFMPEG_CAPTURE_OPTIONS to concurrent opens
+
+    OpenCV reads the variable while a capture opens, so opens that need
+    the same options may run together while others wait for them.
+    """
+
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.current = None
+        self.users = 0
+
+    @contextlib.contextmanager
+    def use(self, options):
+        with self.condition:
+            while self.users and self.current != options:
+                self.condition.wait()
+            if not self.users:
+                if options:
+                    os.environ[CAPTURE_OPTIONS_ENV] = options
+                else:
+                    os.environ.pop(CAPTURE_OPTIONS_ENV, None)
+                self.current = options
+            self.users += 1
+        try:
+            yield
+        finally:
+            with self.condition:
+                self.users -= 1
+                if not self.users:
+                    self.condition.notify_all()
+
+
+capture_options = CaptureOptions()
+
+
+class StreamIngest:
+    """Frame source for one camera that survives dropouts
+
+    transport selects RTSP over 'tcp' or 'udp' (None keeps FFmpeg's
+    default), buffer_size bounds OpenCV's internal frame queue so reads
+    return recent frames, and hw_acceleration asks for hardware decode
+    where the build supports it. A failed open or read, or a stream whose
+    frame timestamps stop advancing for stall_timeout seconds, closes the
+    capture; the next read reopens it after reconnect_delay * 2 ** failures
+    seconds (at most max_reconnect_delay, less up to half as jitter),
+    where failures counts attempts since the last frame was read.
+    log(message) and on_status(connected) report connection changes.
+    retrieve() may be called from another thread to convert the frame
+    last grabbed with decode=False. frame_time() places the last frame on
+    the time.monotonic() clock by its timestamp, so frames of two streams
+    of one camera can be paired; the offset between a stream's timestamps
+    and that clock is the smallest arrival delay of its last offset_window
+    frames.
+    """
+
+    def __init__(self, url, name='', transport='tcp', buffer_size=1, hw_acceleration=False,
+                 open_timeout=10.0, read_timeout=5.0, stall_timeout=10.0,
+                 reconnect_delay=1.0, max_reconnect_delay=30.0, offset_window=50, log=None, on_status=None):
+        self.url = url
+        self.name = name or url
+        self.transport = transport
+        self.buffer_size = buffer_size
+        self.hw_acceleration = hw_acceleration
+        self.open_timeout = open_timeout
+        self.read_timeout = read_timeout
+        self.stall_timeout = stall_timeout
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.log = log
+        self.on_status = on_status
+
+        self.cap = None
+        # Guards the capture between the reading thread and retrieve()
+        self.lock = threading.Lock()
+        self.last_frame_at = None
+        self.failures = 0
+        self.retry_at = 0.0
+        self.connected_at = None
+        self.started_at = time.monotonic()
+        self.uptime = 0.0
+        self.connect_count = 0
+        self.reconnect_count = 0
+        self.stall_count = 0
+        self.last_error = None
+        self.last_timestamp = None
+        self.last_progress = 0.0
+        self.frame_timestamp = None
+        self.arrival_offsets = collections.deque(maxlen=offset_window)
+        self.frame_count = 0
+        self.grab_only_count = 0
+        self._rate_started = time.monotonic()
+        self._rate_frames = 0
+        self.decode_fps = 0.0
+
+    def read(self, pool, is_running, decode=True):
+        """Next frame as (ret, buffer), reconnecting first if needed
+
+        With decode=False the frame is only grabbed, which skips the
+        conversion to BGR pixels, and buffer is None. ret is False after
+        a failed read or while stopping.
+        """
+        if self.cap is None and not self._connect(is_running):
+            return False, None
+
+        with self.lock:
+            if decode:
+                ret, buffer = pool.read(self.cap)
+                if not ret:
+                    buffer.release()
+                    buffer = None
+            else:
+                ret, buffer = self.cap.grab(), None
+            now = time.monotonic()
+            self.last_frame_at = now if ret else None
+        if not ret:
+            self._disconnect("read failed")
+            return False, None
+
+        self._check_progress(now)
+        if self.cap is None:
+            if buffer:
+                buffer.release()
+            return False, None
+
+        self.failures = 0
+        self.frame_count += 1
+        self.grab_only_count += not decode
+        self._rate_frames += 1
+        if now - self._rate_started >= 2.0:
+            self.decode_fps = self._rate_frames / (now - self._rate_started)
+            self._rate_started = now
+            self._rate_frames = 0
+        return True, buffer
+
+    def retrieve(self, pool):
+        """The last grabbed frame as (buffer, grabbed_at), or (None, None)"""
+        with self.lock:
+            if self.cap is None or self.last_frame_at is None:
+                return None, None
+            ret, buffer = pool.retrieve(self.cap)
+            if not ret:
+                buffer.release()
+                return None, None
+            return buffer, self.last_frame_at
+
+    def frame_time(self):
+        """When the last frame was shot, on the time.monotonic() clock
+
+        Its timestamp plus the smallest recent arrival delay, which leaves
+        out network and decoder jitter; the time it was read for sources
+        without timestamps.
+        """
+        if self.frame_timestamp is None or not self.arrival_offsets:
+            return self.last_frame_at
+        return self.frame_timestamp / 1000.0 + min(self.arrival_offsets)
+
+    def release(self):
+        if self.cap is not None:
+            self._disconnect(None)
+
+    def stats(self):
+        now = time.monotonic()
+        uptime = self.uptime + (now - self.connected_at if self.connected_at else 0.0)
+        return {
+            'connected': self.cap is not None,
+            'uptime': uptime,
+            'uptime_ratio': uptime / max(now - self.started_at, 1e-9),
+            'reconnects': self.reconnect_count,
+            'stalls': self.stall_count,
+            'decode_fps': self.decode_fps,
+            'frames': self.frame_count,
+            'grab_only': self.grab_only_count,
+            'last_error': self.last_error
+        }
+
+    def _connect(self, is_running):
+        while is_running():
+            delay = self.retry_at - time.monotonic()
+            if delay > 0:
+                time.sleep(min(delay, 0.5))
+                continue
+
+            cap = self._open()
+            if cap is not None and cap.isOpened():
+                self.cap = cap
+                self.connected_at = time.monotonic()
+                self.last_progress = self.connected_at
+                self.last_timestamp = None
+                # Timestamps restart with the stream
+                self.frame_timestamp = None
+                self.arrival_offsets.clear()
+                if self.connect_count:
+                    self.reconnect_count += 1
+                self.connect_count += 1
+                self._log(f"Connected to {self.name} stream")
+                if self.on_status:
+                    self.on_status(True)
+                return True
+
+            if cap is not None:
+                cap.release()
+            self.last_error = "open failed"
+            self._schedule_retry()
+            self._log(f"Failed to open {self.name} stream, retrying in {self.retry_at - time.monotonic():.1f}s")
+        return False
+
+    def _open(self):
+        params = [
+            cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, int(self.open_timeout * 1000),
+            cv2.CAP_PROP_READ_TIMEOUT_MSEC, int(self.read_timeout * 1000)
+        ]
+        if self.hw_acceleration:
+            params += [cv2.CAP_PROP_HW_ACCELERATION, cv2.VIDEO_ACCELERATION_ANY]
+        options = f"rtsp_transport;{self.transport}" if self.transport and self.url.startswith('rtsp') else None
+        try:
+            with capture_options.use(options):
+                cap = cv2.VideoCapture(self.url, cv2.CAP_FFMPEG, params)
+        except cv2.error as e:
+            self.last_error = str(e)
+            return None
+        if self.buffer_size:
+            cap.set(cv2.CAP_PROP_BUFFERSIZE, self.buffer_size)
+        return cap
+
+    def _check_progress(self, now):
+        # Some sources report no timestamps; only judge those that do
+        timestamp = self.cap.get(cv2.CAP_PROP_POS_MSEC)
+        self.frame_timestamp = timestamp if timestamp > 0 else None
+        if self.frame_timestamp is not None:
+            self.arrival_offsets.append(now - timestamp / 1000.0)
+        if timestamp > 0 and timestamp != self.last_timestamp:
+            self.last_timestamp = timestamp
+            self.last_progress = now
+        elif self.last_timestamp is None:
+            self.last_progress = now
+        elif now - self.last_progress > self.stall_timeout:
+            self.stall_count += 1
+            self._disconnect(f"stalled for {now - self.last_progress:.0f}s")
+
+    def _disconnect(self, reason):
+        with self.lock:
+            self.cap.release()
+            self.cap = None
+            self.last_frame_at = None
+        if self.connected_at is not None:
+            self.uptime += time.monotonic() - self.connected_at
+            self.connected_at = None
+        if self.on_status:
+            self.on_status(False)
+        if reason is None:
+            self._log(f"Disconnected from {self.name} stream")
+            return
+        self.last_error = reason
+        self._schedule_retry()
+        self._log(f"Lost {self.name} stream ({reason}), reconnecting in {self.retry_at - time.monotonic():.1f}s")
+
+    def _schedule_retry(self):
+        delay = min(self.max_reconnect_delay, self.reconnect_delay * 2 ** self.failures)
+        self.failures += 1
+        self.retry_at = time.monotonic() + random.uniform(delay / 2, delay)
+
+    def _log(self, message):
+        if self.log:
+            self.log(message)
+
+
+class MainFrameRequest:
+    """Claim on the main-stream frame shot closest to a sub-stream frame
+
+    Calling it returns that frame's pixels, converting them on the first
+    call, or None when the main stream had no frame within max_skew.
+    release() gives up the claim and the converted buffer; the grabber
+    holds its position at the frame until the claim is served, i.e. the
+    frame was converted or the claim released.
+    """
+
+    __slots__ = ('grabber', 'time', 'ready', 'served', 'skew', 'buffer', 'resolved')
+
+    def __init__(self, grabber, frame_time):
+        self.grabber = grabber
+        self.time = frame_time
+        self.ready = False
+        self.served = False
+        self.skew = None
+        self.buffer = None
+        self.resolved = False
+
+    def __call__(self):
+        if not self.resolved:
+            self.resolved = True
+            self.buffer = self.grabber.claim(self)
+        return self.buffer.array if self.buffer is not None else None
+
+    def release(self):
+        self.grabber.serve(self)
+        if self.buffer is not None:
+            self.buffer.release()
+            self.buffer = None
+
+
+class MainStreamGrabber:
+    """Full-resolution companion of a camera whose detection runs on its sub stream
+
+    While woken, a thread grabs the main stream without converting its
+    frames. request(frame_time) registers a MainFrameRequest for a
+    submitted sub-stream frame; the thread then stops at the main frame
+    whose frame_time() is closest to it and waits there (at most
+    hold_timeout seconds) until the request is called, which converts
+    that frame, or released. Pairs more than max_skew seconds apart are
+    refused, so a crop always shows the instant its box was detected in.
+    Frames are only converted for requests that are called, i.e. when a
+    crop is actually read. With no wake() for idle_timeout seconds the
+    main stream is closed, so a camera without vehicles to read decodes
+    only its sub stream.
+    """
+
+    def __init__(self, url, name='', pool_size=4, max_skew=0.05, hold_timeout=1.0, idle_timeout=10.0, log=None,
+                 **ingest_options):
+        self.ingest = StreamIngest(url, name=f"{name} main".strip(), log=log, **ingest_options)
+        self.pool = FramePool(pool_size)
+        self.max_skew = max_skew
+        self.hold_timeout = hold_timeout
+        self.idle_timeout = idle_timeout
+        self.woken_at = float('-inf')
+        self.condition = threading.Condition()
+        self.pending = collections.deque()
+        self.frame_interval = 0.04
+        self.running = False
+        self.thread = None
+        self.retrieved_count = 0
+        self.missed_count = 0
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout=2.0):
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        if self.thread:
+            self.thread.join(timeout)
+            self.thread = None
+
+    def wake(self):
+        """Keep (or start) grabbing the main stream for another idle_timeout seconds"""
+        self.woken_at = time.monotonic()
+
+    def request(self, frame_time):
+        """MainFrameRequest for a sub-stream frame shot at frame_time, None while the main stream is closed"""
+        if not self.running or self.ingest.cap is None or frame_time is None:
+            return None
+        request = MainFrameRequest(self, frame_time)
+        with self.condition:
+            self.pending.append(request)
+            self.condition.notify_all()
+        return request
+
+    def claim(self, request):
+        """Converted buffer of the main frame matching a request, or None"""
+        buffer = None
+        with self.condition:
+            # Requests are served in order, earlier ones will not be called any more
+            for earlier in self.pending:
+                if earlier is request:
+                    break
+                earlier.served = True
+            self.condition.notify_all()
+            self.condition.wait_for(lambda: request.ready or request.served or not self.running, self.hold_timeout)
+            if request.ready and not request.served and abs(request.skew) <= self.max_skew:
+                buffer, _ = self.ingest.retrieve(self.pool)
+            request.served = True
+            self.condition.notify_all()
+        if buffer is None:
+            self.missed_count += 1
+        else:
+            self.retrieved_count += 1
+        return buffer
+
+    def serve(self, request):
+        with self.condition:
+            request.served = True
+            self.condition.notify_all()
+
+    def stats(self):
+        stats = self.ingest.stats()
+        stats['retrieved'] = self.retrieved_count
+        stats['missed'] = self.missed_count
+        stats['pending'] = len(self.pending)
+        return stats
+
+    def _wanted(self):
+        return self.running and time.monotonic() - self.woken_at < self.idle_timeout
+
+    def _drop_pending(self):
+        with self.condition:
+            for request in self.pending:
+                request.served = True
+            self.pending.clear()
+            self.condition.notify_all()
+
+    def _next_request(self):
+        with self.condition:
+            while self.pending and self.pending[0].served:
+                self.pending.popleft()
+            return self.pending[0] if self.pending else None
+
+    def _grab(self):
+        previous = self.ingest.frame_time() if self.ingest.cap is not None else None
+        ret, _ = self.ingest.read(self.pool, self._wanted, decode=False)
+        if not ret:
+            # Reconnecting, the requests waiting for this stream will not be met
+            self._drop_pending()
+            return
+        current = self.ingest.frame_time()
+        if previous is not None and current is not None and 0 < current - previous < 1.0:
+            self.frame_interval = current - previous
+
+    def _run(self):
+        while self.running:
+            if not self._wanted():
+                self._drop_pending()
+                self.ingest.release()
+                time.sleep(0.05)
+                continue
+
+            request = self._next_request()
+            current = self.ingest.frame_time() if self.ingest.cap is not None else None
+            if request is None or current is None or current + self.frame_interval / 2 < request.time:
+                self._grab()
+                continue
+
+            # The closest frame to the request: hold it until the request is served
+            with self.condition:
+                request.skew = current - request.time
+                request.ready = True
+                self.condition.notify_all()
+                self.condition.wait_for(lambda: request.served or not self.running, self.hold_timeout)
+                request.served = True
+        self._drop_pending()
+        self.ingest.release()
@@ -0,0 +1,114 @@
+"""
+Bounded application log
+A fixed-capacity ring of log records that any thread can append to cheaply,
+read by the UI at a fixed rate and exportable to disk
+"""
+
+import collections
+import threading
+import time
+
+LEVELS = ('debug', 'info', 'warning', 'error')
+
+LogRecord = collections.namedtuple('LogRecord', ['seq', 'created', 'level', 'message'])
+
+
+def level_rank(level):
+    """Position of a level in LEVELS, unknown levels rank as info"""
+    try:
+        return LEVELS.index(level)
+    except ValueError:
+        return 1
+
+
+def format_record(record):
+    """'[HH:MM:SS] message', with the level in front of warnings and errors"""
+    timestamp = time.strftime('%H:%M:%S', time.localtime(record.created))
+    if level_rank(record.level) >= level_rank('warning'):
+        return f"[{timestamp}] {record.level.upper()}: {record.message}"
+    return f"[{timestamp}] {record.message}"
+
+
+class LogBuffer:
+    """Thread-safe ring of the last capacity log records
+
+    append() only takes a lock and pushes onto a deque, so capture,
+    inference and delivery threads can log every read. Readers compare
+    last_seq with the sequence they last rendered and call records() only
+    when it moved; the UI does that on a timer, so its cost follows the
+    timer rate rather than the message rate. The oldest records are
+    evicted once capacity is reached and counted in evicted.
+
+    With history_path, every record is also appended to that file so
+    nothing is lost to eviction; records are kept in a pending list and
+    written in one go by write_history(), which the owner calls
+    periodically (pending is flushed inline past history_batch records).
+    """
+
+    def __init__(self, capacity=500, history_path=None, history_batch=1000):
+        self.capacity = capacity
+        self.history_path = history_path
+        self.history_batch = history_batch
+        self.lock = threading.Lock()
+        self.history_lock = threading.Lock()
+        self.buffer = collections.deque(maxlen=capacity)
+        self.pending = []
+        self.last_seq = 0
+        self.evicted = 0
+
+    def append(self, message, level='info'):
+        with self.lock:
+            self.last_seq += 1
+            record = LogRecord(self.last_seq, time.time(), level, message)
+            if len(self.buffer) == self.capacity:
+                self.evicted += 1
+            self.buffer.append(record)
+            if self.history_path is None:
+                return record
+            self.pending.append(record)
+            overflow = len(self.pending) >= self.history_batch
+        if overflow:
+            self.write_history()
+        return record
+
+    def records(self, min_level='debug'):
+        """Buffered records at min_level or above, oldest first"""
+        rank = level_rank(min_level)
+        with self.lock:
+            records = list(self.buffer)
+        if rank == 0:
+            return records
+        return [record for record in records if level_rank(record.level) >= rank]
+
+    def write_history(self):
+        """Append pending records to history_path; returns how many were written"""
+        with self.history_lock:
+            with self.lock:
+                pending, self.pending = self.pending, []
+            if not pending or self.history_path is None:
+                return 0
+            with open(self.history_path, 'a', encoding='utf-8') as f:
+                f.writelines(format_record(record) + '\n' for record in pending)
+            return len(pending)
+
+    def export(self, path, min_level='debug'):
+        """Write the buffered records to path; returns how many were written
+
+        Pending history is written first, so with history_path set the
+        history file holds everything logged so far.
+        """
+        self.write_history()
+        records = self.records(min_level)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.writelines(format_record(record) + '\n' for record in records)
+        return len(records)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'buffered': len(self.buffer),
+                'capacity': self.capacity,
+                'logged': self.last_seq,
+                'evicted': self.evicted,
+                'pending_history': len(self.pending)
+            }
@@ -13,156 +13,34 @@ from kivy.clock import Clock
 from kivy.utils import platform
 from kivy.uix.scrollview import ScrollView
 from kivy.uix.gridlayout import GridLayout
+from kivy.uix.recycleview import RecycleView
+from kivy.uix.recycleboxlayout import RecycleBoxLayout
+from kivy.uix.spinner import Spinner
 import threading
 import time
-import requests
-import cv2
-import numpy as np
-from ultralytics import YOLO
-from paddleocr import PaddleOCR
 import os
+import queue
+from pipeline import BoundedQueue, StageCounters, DROP_OLDEST, BLOCK
+from inference import InferenceService
+from delivery import EventDelivery
+from spool import EventSpool
+from detector import LicensePlateDetector
+from cameras import CameraRegistry
+from streams import StreamState, run_capture
+from workers import WorkerPool
+from metrics import MetricsServer, pipeline_metrics
+from logbuffer import LogBuffer, format_record
+from watchlist import PlateIndex, VerdictCache
+from sessions import SessionCorrelator
+
+# Detection log filter choices and the lowest level each one shows
+LOG_FILTERS = {'All': 'debug', 'Info': 'info', 'Warnings': 'warning', 'Errors': 'error'}
+LOG_COLORS = {'debug': (0.7, 0.7, 0.7, 1), 'warning': (1, 0.8, 0.2, 1), 'error': (1, 0.35, 0.35, 1)}
 
 # For Android permissions
 if platform == 'android':
     from android.permissions import request_permissions, Permission
 
-class PlateTracker:
-    def __init__(self, max_disappeared=30, max_distance=50):
-        self.next_object_id = 0
-        self.objects = {}
-        self.disappeared = {}
-        self.max_disappeared = max_disappeared
-        self.max_distance = max_distance
-        self.text_history = {}
-        self.stable_text = {}
-        
-    def register(self, centroid, text=""):
-        self.objects[self.next_object_id] = centroid
-        self.disappeared[self.next_object_id] = 0
-        self.text_history[self.next_object_id] = [text] if text else []
-        self.stable_text[self.next_object_id] = text
-        self.next_object_id += 1
-        
-    def deregister(self, object_id):
-        del self.objects[object_id]
-        del self.disappeared[object_id]
-        if object_id in self.text_history:
-            del self.text_history[object_id]
-        if object_id in self.stable_text:
-            del self.stable_text[object_id]
-            
-    def update(self, rects, texts):
-        if len(rects) == 0:
-            for object_id in list(self.disappeared.keys()):
-                self.disappeared[object_id] += 1
-                if self.disappeared[object_id] > self.max_disappeared:
-                    self.deregister(object_id)
-            return self.objects.copy()
-            
-        input_centroids = np.array([self._get_centroid(rect) for rect in rects])
-        
-        if len(self.objects) == 0:
-            for i in range(len(input_centroids)):
-                self.register(input_centroids[i], texts[i] if i < len(texts) else "")
-        else:
-            object_ids = list(self.objects.keys())
-            object_centroids = list(self.objects.values())
-            
-            distances = self._calculate_distances(object_centroids, input_centroids)
-            rows = distances.min(axis=1).argsort()
-            cols = distances.argmin(axis=1)[rows]
-            
-            used_rows = set()
-            used_cols = set()
-            
-            for (row, col) in zip(rows, cols):
-                if row in used_rows or col in used_cols:
-                    continue
-                    
-                if distances[row, col] > self.max_distance:
-                    continue
-                    
-                object_id = object_ids[row]
-                self.objects[object_id] = input_centroids[col]
-                self.disappeared[object_id] = 0
-                
-                if col < len(texts) and texts[col]:
-                    self.text_history[object_id].append(texts[col])
-                    if len(self.text_history[object_id]) > 5:
-                        self.text_history[object_id].pop(0)
-                    self.stable_text[object_id] = self._get_most_common(self.text_history[object_id])
-                
-                used_rows.add(row)
-                used_cols.add(col)
-                
-            unused_rows = set(range(len(object_centroids))).difference(used_rows)
-            unused_cols = set(range(len(input_centroids))).difference(used_cols)
-            
-            if len(object_centroids) >= len(input_centroids):
-                for row in unused_rows:
-                    object_id = object_ids[row]
-                    self.disappeared[object_id] += 1
-                    if self.disappeared[object_id] > self.max_disappeared:
-                        self.deregister(object_id)
-            else:
-                for col in unused_cols:
-                    self.register(input_centroids[col], texts[col] if col < len(texts) else "")
-                    
-        return self.objects.copy()
-    
-    def _get_centroid(self, rect):
-        x, y, w, h = rect
-        return (int(x + w // 2), int(y + h // 2))
-    
-    def _calculate_distances(self, centroids1, centroids2):
-        distances = np.zeros((len(centroids1), len(centroids2)))
-        for i, c1 in enumerate(centroids1):
-            for j, c2 in enumerate(centroids2):
-                distances[i, j] = np.sqrt((c1[0] - c2[0])**2 + (c1[1] - c2[1])**2)
-        return distances
-    
-    def _get_most_common(self, text_list):
-        if not text_list:
-            return ""
-        from collections import Counter
-        return Counter(text_list).most_common(1)[0][0]
-
-class LicensePlateDetector:
-    def __init__(self, model_path="license_plate_detector.pt"):
-        self.model = YOLO(model_path)
-        self.ocr = PaddleOCR(use_angle_cls=True, lang='en')
-        self.tracker = PlateTracker()
-        
-    def detect_and_recognize(self, frame):
-        results = self.model(frame)
-        plates = []
-        
-        for result in results:
-            boxes = result.boxes
-            if boxes is not None:
-                for box in boxes:
-                    x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
-                    x1, y1, x2, y2 = int(x1), int(y1), int(x2), int(y2)
-                    
-                    # Crop the license plate
-                    plate_img = frame[y1:y2, x1:x2]
-                    if plate_img.size == 0:
-                        continue
-                        
-                    # OCR on the cropped plate
-                    ocr_result = self.ocr.ocr(plate_img, cls=True)
-                    if ocr_result and ocr_result[0]:
-                        text = ocr_result[0][0][1][0]
-                        confidence = ocr_result[0][0][1][1]
-                        if confidence > 0.5:  # Filter low confidence results
-                            plates.append({
-                                'bbox': (x1, y1, x2-x1, y2-y1),
-                                'text': text,
-                                'confidence': confidence
-                            })
-        
-        return plates
-
 class FullANPRApp(BoxLayout):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
@@ -177,52 +55,246 @@ class FullANPRApp(BoxLayout):
         
         # API configuration
         self.api_url = "https://www.corezoid.com/api/2/json/public/1714853/0a04e6b3904e3b837ae4c6ba4d8c70a9311a90e7"
+        self.api_batch_size = 20
+        self.api_flush_interval = 1.0
+        self.api_replay_rate = 50.0
+        self.delivery = None
+        self.spool = None
+        
+        # Local plate decisions: watchlist_file in the app data directory is a
+        # CSV of plate,list[,other columns] with list 'allow' or 'deny', matched
+        # exactly or within one OCR error. Verdicts the API returns as
+        # {"verdicts": {"<plate>": <verdict>}} are cached for verdict_ttl seconds.
+        # Plates decided locally are only sent upstream with upstream_known_plates
+        self.watchlist_file = 'watchlist.csv'
+        self.watchlist = None
+        self.verdict_cache = VerdictCache(capacity=10000, ttl=300.0)
+        self.upstream_known_plates = False
+        
+        # Pipeline configuration: inference keeps only the newest frames,
+        # detections wait for the sink instead of being dropped
+        self.inference_batch_size = 4
+        self.inference_max_wait_ms = 20
+        self.frame_queue_size = 8
+        self.frame_queue_policy = DROP_OLDEST
+        self.event_queue_size = 100
+        self.event_queue_policy = BLOCK
+        self.event_queue = None
+        self.stage_counters = {}
+        
+        # Tracked-event mode reports each vehicle once instead of every read
+        self.tracked_events = True
+        self.ocr_reread_interval = 5
+        self.streams = {}
+        
+        # Detection area per stream, e.g. {'in': {'rect': [400, 300, 1100, 700]}} or
+        # {'out': {'polygon': [[200, 900], [900, 350], [1500, 350], [1800, 900]]}};
+        # streams without an entry are detected on the whole frame
+        self.detection_regions = {}
+        self.detection_size = 640
+        self.frame_pool_size = 16
+        
+        # Stream ingest defaults, see ingest.StreamIngest; cameras can override
+        # them with an "ingest" entry in cameras.json
+        self.ingest_options = {
+            'transport': 'tcp',
+            'buffer_size': 1,
+            'stall_timeout': 10.0,
+            'max_reconnect_delay': 30.0
+        }
+        
+        # Entry/exit sessions: reads of 'in' cameras are paired with later reads
+        # of the same plate (within one OCR error) by 'out' cameras and sent as
+        # one session event with the dwell time. Open sessions are saved every
+        # session_snapshot_interval seconds and reopened on the next start.
+        # Only vehicle events are paired, so sessions need tracked_events
+        self.correlate_sessions = True
+        self.session_max_dwell = 24 * 3600.0
+        self.session_snapshot_interval = 30.0
+        self.sessions = None
+        self.sessions_event = None
+        
+        # Cameras come from cameras.json in the app data directory when it
+        # exists, otherwise from rtsp_urls and detection_regions above
+        self.cameras = self.load_cameras()
+        
+        # 'threads' runs every camera in this process with one shared model;
+        # 'processes' shards cameras over worker_count processes with their own models
+        self.execution_mode = 'threads'
+        self.worker_count = max(1, (os.cpu_count() or 2) - 1)
+        self.worker_pool = None
+        self.stopping = None
+        
+        # Inference backends, see backends.py; e.g. 'onnx' with
+        # {'model_path': 'license_plate_detector.onnx', 'intra_op_threads': 4}
+        self.detector_backend = 'ultralytics'
+        self.detector_options = {}
+        self.recognizer_backend = 'paddle'
+        self.recognizer_options = {}
+        # INT8 models from export_models.py --quantize, 'onnx' backends only
+        self.quantized_models = False
+        # Off (None) by default, every crop is OCR'd. With CropQualityGate options,
+        # e.g. {'min_sharpness': 50.0, 'deskew': True} ({} for the defaults), crops
+        # too small, skewed or blurred to read are skipped and past top_k reads a
+        # vehicle is only read on sharper crops. Tune min_sharpness on the camera's
+        # own footage with benchmark.py quality before turning it on
+        self.crop_quality = None
+        
+        # Per-stage latency histograms, queue depths and drop counts are served
+        # at http://127.0.0.1:<metrics_port>/metrics (None disables it) and
+        # summarized in the log every metrics_summary_interval seconds
+        self.metrics_port = 9108
+        self.metrics_summary_interval = 60.0
+        self.metrics_server = None
+        self.metrics_event = None
+        
+        # Detection log: the newest log_capacity messages are kept in memory and
+        # the view is refreshed at most log_refresh_rate times per second;
+        # log_history_file (in the app data directory) keeps every message,
+        # written off the UI thread every log_history_interval seconds
+        self.log_capacity = 500
+        self.log_refresh_rate = 4
+        self.log_view_level = 'debug'
+        self.log_history_file = None
+        self.log_history_interval = 5.0
+        self.log = LogBuffer(
+            self.log_capacity,
+            history_path=self.data_path(self.log_history_file) if self.log_history_file else None
+        )
+        self.log_view_seq = -1
+        self.log_view_rows = None
         
-        # Initialize ML components
+        # ML components load in the background while the UI shows a loading state
+        self.models_ready = False
         self.detector = None
-        self.init_ml_components()
+        self.inference = None
         
         # Setup UI
         self.setup_ui()
+        self.init_ml_components()
+        threading.Thread(target=self.load_watchlist, daemon=True).start()
         
         # Request permissions on Android
         if platform == 'android':
             self.request_android_permissions()
         
     def init_ml_components(self):
-        """Initialize ML components"""
+        """Start loading ML components without blocking the UI"""
+        if self.execution_mode == 'processes':
+            # Every worker process loads its own models
+            self.on_ml_components_loaded(None)
+            return
+        self.status_label.text = 'Loading models...'
+        self.start_button.disabled = True
+        threading.Thread(target=self.load_ml_components, daemon=True).start()
+    
+    def load_ml_components(self):
+        """Load and warm up the models (background thread)"""
+        error = None
         try:
-            self.detector = LicensePlateDetector()
-            self.log_message("ML components initialized successfully")
+            start = time.perf_counter()
+            detector = LicensePlateDetector(**self.detector_config())
+            loaded = time.perf_counter()
+            detector.warm_up()
+            warmed = time.perf_counter()
+            self.detector = detector
+            self.inference = InferenceService(self.detector, **self.inference_config())
+            self.log_message(f"ML components initialized successfully "
+                             f"(load {loaded - start:.1f}s, warm-up {warmed - loaded:.1f}s)")
         except Exception as e:
-            self.log_message(f"Error initializing ML components: {str(e)}")
+            error = e
+            self.log_message(f"Error initializing ML components: {str(e)}", 'error')
+        Clock.schedule_once(lambda dt: self.on_ml_components_loaded(error), 0)
+    
+    def load_watchlist(self):
+        """Load and index the plate watchlist (background thread)"""
+        path = self.data_path(self.watchlist_file) if self.watchlist_file else None
+        if not path or not os.path.exists(path):
+            return
+        try:
+            start = time.perf_counter()
+            self.watchlist = PlateIndex.load(path)
+            self.log_message(f"Watchlist loaded: {len(self.watchlist)} plates "
+                             f"in {time.perf_counter() - start:.1f}s")
+        except (OSError, ValueError) as e:
+            self.log_message(f"Could not load watchlist: {str(e)}", 'warning')
+    
+    def detector_config(self):
+        """LicensePlateDetector arguments, also sent to worker processes"""
+        return {
+            'inference_size': self.detection_size,
+            'detector_backend': self.detector_backend,
+            'recognizer_backend': self.recognizer_backend,
+            'detector_options': self.detector_options,
+            'recognizer_options': self.recognizer_options,
+            'quantized': self.quantized_models,
+            'cache_dir': self.data_path('model_cache'),
+            'crop_quality': self.crop_quality
+        }
+    
+    def inference_config(self):
+        """InferenceService arguments, also sent to worker processes"""
+        return {
+            'max_batch_size': self.inference_batch_size,
+            'max_wait_ms': self.inference_max_wait_ms,
+            'queue_size': self.frame_queue_size,
+            'queue_policy': self.frame_queue_policy
+        }
+    
+    def stream_config(self):
+        """StreamState arguments, also sent to worker processes"""
+        return {
+            'tracked': self.tracked_events,
+            'ocr_reread_interval': self.ocr_reread_interval,
+            'frame_pool_size': self.frame_pool_size,
+            'ingest_options': self.ingest_options
+        }
+    
+    def load_cameras(self):
+        """Camera registry from cameras.json, or the built-in IN/OUT pair"""
+        path = self.data_path('cameras.json')
+        if os.path.exists(path):
+            return CameraRegistry.load(path)
+        return CameraRegistry.from_urls(self.rtsp_urls, self.detection_regions)
+    
+    def on_ml_components_loaded(self, error):
+        """Leave the loading state once the models are ready"""
+        self.models_ready = error is None
+        self.start_button.disabled = False
+        if not self.is_processing:
+            self.status_label.text = 'Ready to start' if self.models_ready else 'Model loading failed'
         
     def setup_ui(self):
         """Setup the user interface"""
         # Title
         title_label = Label(text='ANPR Camera App (Full ML Version)', size_hint_y=0.1, font_size='20sp')
         
-        # Status labels
+        # Status label
         self.status_label = Label(text='Ready to start', size_hint_y=0.05)
-        self.in_status_label = Label(text='IN Stream: Disconnected', size_hint_y=0.05)
-        self.out_status_label = Label(text='OUT Stream: Disconnected', size_hint_y=0.05)
         
-        # RTSP URL inputs
-        url_layout = BoxLayout(orientation='vertical', size_hint_y=0.2)
-        url_layout.add_widget(Label(text='RTSP URLs:', size_hint_y=0.3))
-        
-        self.in_url_input = TextInput(
-            text=self.rtsp_urls['in'],
-            hint_text='IN Stream URL',
-            size_hint_y=0.35
-        )
-        self.out_url_input = TextInput(
-            text=self.rtsp_urls['out'],
-            hint_text='OUT Stream URL',
-            size_hint_y=0.35
-        )
-        url_layout.add_widget(self.in_url_input)
-        url_layout.add_widget(self.out_url_input)
+        # Status and RTSP URL input per camera
+        url_layout = BoxLayout(orientation='vertical', size_hint_y=0.35)
+        url_layout.add_widget(Label(text='RTSP URLs:', size_hint_y=None, height=30))
+        stream_scroll = ScrollView()
+        stream_layout = GridLayout(cols=1, size_hint_y=None)
+        stream_layout.bind(minimum_height=stream_layout.setter('height'))
+        self.stream_status_labels = {}
+        self.url_inputs = {}
+        for camera in self.cameras:
+            label = Label(text=f'{camera.camera_id.upper()} Stream: Disconnected', size_hint_y=None, height=30)
+            url_input = TextInput(
+                text=camera.url,
+                hint_text=f'{camera.camera_id.upper()} Stream URL',
+                size_hint_y=None,
+                height=40,
+                multiline=False
+            )
+            self.stream_status_labels[camera.camera_id] = label
+            self.url_inputs[camera.camera_id] = url_input
+            stream_layout.add_widget(label)
+            stream_layout.add_widget(url_input)
+        stream_scroll.add_widget(stream_layout)
+        url_layout.add_widget(stream_scroll)
         
         # Control buttons
         button_layout = BoxLayout(orientation='horizontal', size_hint_y=0.1)
@@ -233,22 +305,40 @@ class FullANPRApp(BoxLayout):
         button_layout.add_widget(self.start_button)
         button_layout.add_widget(self.stop_button)
         
-        # Detection log
-        self.log_label = Label(text='Detection Log:', size_hint_y=0.05)
-        self.log_scroll = ScrollView(size_hint_y=0.4)
-        self.log_layout = GridLayout(cols=1, size_hint_y=None)
-        self.log_layout.bind(minimum_height=self.log_layout.setter('height'))
-        self.log_scroll.add_widget(self.log_layout)
+        # Detection log header with level filter and export
+        log_header = BoxLayout(orientation='horizontal', size_hint_y=0.05)
+        self.log_label = Label(text='Detection Log:')
+        self.log_filter = Spinner(text='All', values=list(LOG_FILTERS), size_hint_x=0.3)
+        self.log_filter.bind(text=self.on_log_filter)
+        export_button = Button(text='Export', size_hint_x=0.2)
+        export_button.bind(on_press=self.export_log)
+        log_header.add_widget(self.log_label)
+        log_header.add_widget(self.log_filter)
+        log_header.add_widget(export_button)
+        
+        # Detection log rows: only the visible ones exist as widgets and are
+        # refilled from the log buffer on a timer, not per message
+        self.log_view = RecycleView(size_hint_y=0.35)
+        self.log_view.viewclass = 'Label'
+        self.log_rows = RecycleBoxLayout(
+            orientation='vertical',
+            size_hint_y=None,
+            default_size=(None, 30),
+            default_size_hint=(1, None)
+        )
+        self.log_rows.bind(minimum_height=self.log_rows.setter('height'))
+        self.log_view.add_widget(self.log_rows)
+        Clock.schedule_interval(self.refresh_log_view, 1.0 / self.log_refresh_rate)
+        if self.log.history_path:
+            Clock.schedule_interval(self.schedule_log_history, self.log_history_interval)
         
         # Add widgets
         self.add_widget(title_label)
         self.add_widget(self.status_label)
-        self.add_widget(self.in_status_label)
-        self.add_widget(self.out_status_label)
         self.add_widget(url_layout)
         self.add_widget(button_layout)
-        self.add_widget(self.log_label)
-        self.add_widget(self.log_scroll)
+        self.add_widget(log_header)
+        self.add_widget(self.log_view)
         
     def request_android_permissions(self):
         """Request necessary permissions on Android"""
@@ -262,19 +352,56 @@ class FullANPRApp(BoxLayout):
             ]
             request_permissions(permissions)
     
-    def log_message(self, message):
-        """Add message to log"""
-        timestamp = time.strftime("%H:%M:%S")
-        log_text = f"[{timestamp}] {message}"
-        
-        def update_log():
-            label = Label(text=log_text, size_hint_y=None, height=30)
-            self.log_layout.add_widget(label)
-            # Keep only last 50 messages
-            if len(self.log_layout.children) > 50:
-                self.log_layout.remove_widget(self.log_layout.children[-1])
-        
-        Clock.schedule_once(lambda dt: update_log(), 0)
+    def log_message(self, message, level='info'):
+        """Add message to log (any thread); shown on the next view refresh"""
+        self.log.append(message, level)
+    
+    def refresh_log_view(self, dt=None):
+        """Show new log messages, at most log_refresh_rate times per second"""
+        if self.log.last_seq == self.log_view_seq:
+            return
+        self.log_view_seq = self.log.last_seq
+        records = self.log.records(self.log_view_level)
+        # Messages below the filter level leave the rows as they are
+        rows = (len(records), records[0].seq, records[-1].seq) if records else ()
+        if rows == self.log_view_rows:
+            return
+        self.log_view_rows = rows
+        # Keep following the newest message unless scrolled up
+        follow = self.log_view.scroll_y <= 0.01 or self.log_rows.height <= self.log_view.height
+        self.log_view.data = [
+            {'text': format_record(record), 'color': LOG_COLORS.get(record.level, (1, 1, 1, 1))}
+            for record in records
+        ]
+        if follow:
+            self.log_view.scroll_y = 0
+    
+    def on_log_filter(self, spinner, text):
+        """Show only log messages at the chosen level or above"""
+        self.log_view_level = LOG_FILTERS[text]
+        self.log_view_seq = -1
+        self.log_view_rows = None
+        self.refresh_log_view()
+    
+    def schedule_log_history(self, dt=None):
+        """Append the messages logged since the last call to the history file, off the UI thread"""
+        threading.Thread(target=self.write_log_history, daemon=True).start()
+    
+    def write_log_history(self):
+        try:
+            self.log.write_history()
+        except OSError as e:
+            self.log_message(f"Could not write log history: {str(e)}", 'warning')
+    
+    def export_log(self, instance=None):
+        """Write the buffered log to a timestamped file in the app data directory"""
+        path = self.data_path(time.strftime('detection_log_%Y%m%d_%H%M%S.txt'))
+        try:
+            count = self.log.export(path)
+        except OSError as e:
+            self.log_message(f"Could not export log: {str(e)}", 'error')
+            return
+        self.log_message(f"Exported {count} log messages to {path}")
     
     def toggle_detection(self, instance):
         """Toggle detection on/off"""
@@ -285,102 +412,389 @@ class FullANPRApp(BoxLayout):
     
     def start_detection(self):
         """Start license plate detection"""
-        if self.is_processing:
+        if self.is_processing or self.stopping is not None:
             return
             
         self.is_processing = True
         self.status_label.text = 'Detection running...'
         self.start_button.text = 'Stop Detection'
         
-        # Update RTSP URLs
-        self.rtsp_urls['in'] = self.in_url_input.text
-        self.rtsp_urls['out'] = self.out_url_input.text
-        
-        # Start processing threads
-        self.in_thread = threading.Thread(target=self.process_stream, args=('in',))
-        self.out_thread = threading.Thread(target=self.process_stream, args=('out',))
-        
-        self.in_thread.daemon = True
-        self.out_thread.daemon = True
+        # Update RTSP URLs and keep them for the next launch
+        for camera_id, url_input in self.url_inputs.items():
+            self.cameras.get(camera_id).url = url_input.text
+        try:
+            self.cameras.save(self.data_path('cameras.json'))
+        except OSError as e:
+            self.log_message(f"Could not save camera config: {str(e)}", 'warning')
+        
+        # Capture threads -> shared inference service -> sink, joined by bounded queues
+        self.event_queue = BoundedQueue(self.event_queue_size, self.event_queue_policy, name='events')
+        pipeline_metrics.gauge('event_queue_depth', self.event_queue.__len__)
+        self.start_metrics()
+        self.start_sessions()
+        self.stage_counters = {
+            'capture': StageCounters('capture'),
+            'sink': StageCounters('sink')
+        }
+        if self.spool is None:
+            self.spool = EventSpool(self.spool_path())
+        previous_delivery = self.delivery
+        self.delivery = EventDelivery(
+            self.api_url,
+            batch_size=self.api_batch_size,
+            flush_interval=self.api_flush_interval,
+            spool=self.spool,
+            replay_rate=self.api_replay_rate,
+            on_result=self.on_api_result,
+            on_response=self.on_api_response
+        )
+        # The previous session's delivery may still be draining the same spool
+        delivery = self.delivery
+        
+        def start_delivery():
+            if previous_delivery:
+                previous_delivery.stop(timeout=None)
+            # Unless detection was stopped again in the meantime
+            if self.is_processing and self.delivery is delivery:
+                delivery.start()
+        
+        threading.Thread(target=start_delivery, daemon=True).start()
+        
+        # Start processing threads, or worker processes that feed the sink
+        self.threads = []
+        if self.execution_mode == 'processes':
+            self.worker_pool = WorkerPool(
+                self.cameras,
+                self.worker_count,
+                {
+                    'detector': self.detector_config(),
+                    'inference': self.inference_config(),
+                    'stream': self.stream_config()
+                },
+                on_event=self.on_worker_event,
+                on_log=self.log_message,
+                on_status=self.set_stream_status
+            )
+            self.worker_pool.start()
+        else:
+            self.streams = {
+                camera.camera_id: StreamState(camera, self.inference, **self.stream_config())
+                for camera in self.cameras.enabled()
+            }
+            if self.inference:
+                self.inference.start()
+            for state in self.streams.values():
+                self.threads.append(threading.Thread(target=self.process_stream, args=(state,)))
+        self.threads.append(threading.Thread(target=self.run_sink))
         
-        self.in_thread.start()
-        self.out_thread.start()
+        for thread in self.threads:
+            thread.daemon = True
+            thread.start()
         
         self.log_message("Started license plate detection")
     
     def stop_detection(self, instance=None):
-        """Stop license plate detection"""
+        """Stop license plate detection; the pipeline is torn down off the UI thread"""
+        if not self.is_processing or self.stopping is not None:
+            return
+        self.stop_metrics()
+        if self.sessions_event is not None:
+            self.sessions_event.cancel()
+            self.sessions_event = None
+        self.status_label.text = 'Stopping detection...'
+        self.start_button.disabled = True
+        self.stopping = threading.Thread(target=self.stop_pipeline, daemon=True)
+        self.stopping.start()
+    
+    def stop_pipeline(self):
+        """Stop workers, inference and delivery, then update the UI (background thread)"""
+        if self.worker_pool:
+            # Workers flush their trackers to the still-running sink
+            self.worker_pool.stop()
+            self.worker_pool = None
         self.is_processing = False
+        if self.inference:
+            self.inference.stop()
+        # Report vehicles still in view before delivery shuts down
+        for stream_type, state in self.streams.items():
+            for event in state.flush():
+                self.handle_detection(stream_type, event)
+        self.streams = {}
+        self.stop_sessions()
+        if self.delivery:
+            # Flushes the outbound queue; the next start waits for it
+            threading.Thread(target=self.delivery.stop, kwargs={'timeout': None}, daemon=True).start()
+        self.log_message("Stopped license plate detection")
+        Clock.schedule_once(lambda dt: self.on_detection_stopped(), 0)
+    
+    def on_detection_stopped(self):
+        """Leave the stopping state once the pipeline is down"""
+        self.stopping = None
         self.status_label.text = 'Detection stopped'
         self.start_button.text = 'Start Detection'
-        self.in_status_label.text = 'IN Stream: Disconnected'
-        self.out_status_label.text = 'OUT Stream: Disconnected'
-        self.log_message("Stopped license plate detection")
+        self.start_button.disabled = False
+        for camera_id, label in self.stream_status_labels.items():
+            label.text = f'{camera_id.upper()} Stream: Disconnected'
     
-    def process_stream(self, stream_type):
-        """Process RTSP stream for license plate detection"""
-        url = self.rtsp_urls[stream_type]
-        cap = cv2.VideoCapture(url)
-        
-        if not cap.isOpened():
-            self.log_message(f"Failed to open {stream_type.upper()} stream")
+    def shutdown(self):
+        """Stop detection, wait for delivery to finish and close the spool (app exit)"""
+        self.stop_detection()
+        if self.stopping is not None:
+            self.stopping.join()
+        if self.delivery:
+            self.delivery.stop(timeout=None)
+        if self.spool is not None:
+            self.spool.close()
+            self.spool = None
+        self.log.write_history()
+    
+    def start_metrics(self):
+        """Serve the metrics endpoint and schedule the summary line"""
+        if self.metrics_port is not None and self.metrics_server is None:
+            server = MetricsServer(port=self.metrics_port)
+            try:
+                server.start()
+                self.metrics_server = server
+            except OSError as e:
+                self.log_message(f"Metrics endpoint unavailable: {str(e)}", 'warning')
+        if self.metrics_summary_interval and self.metrics_event is None:
+            self.metrics_event = Clock.schedule_interval(self.log_metrics_summary, self.metrics_summary_interval)
+    
+    def stop_metrics(self):
+        """Stop the metrics endpoint and summary line"""
+        if self.metrics_event is not None:
+            self.metrics_event.cancel()
+            self.metrics_event = None
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
+            self.metrics_server = None
+    
+    def log_metrics_summary(self, dt=None):
+        """Log p50/p99 per stage, counters and queue depths"""
+        self.log_message(f"Metrics: {pipeline_metrics.summary_line()}")
+    
+    def start_sessions(self):
+        """Open the session correlator, with the sessions of the last snapshot"""
+        if not self.correlate_sessions or not any(camera.direction for camera in self.cameras.enabled()):
+            return
+        if not self.tracked_events:
+            # Untracked reads repeat every few frames and each would open or close a session
+            self.log_message("Entry/exit sessions need tracked events, not pairing reads", 'warning')
+            return
+        if self.sessions is None:
+            self.sessions = SessionCorrelator(max_dwell=self.session_max_dwell)
+            path = self.sessions_path()
+            if os.path.exists(path):
+                try:
+                    restored = self.sessions.restore(path)
+                    self.log_message(f"Restored {restored} open entry sessions")
+                except (OSError, ValueError, TypeError, KeyError) as e:
+                    self.log_message(f"Could not restore entry sessions: {str(e)}", 'warning')
+        if self.sessions_event is None:
+            self.sessions_event = Clock.schedule_interval(self.schedule_session_save, self.session_snapshot_interval)
+    
+    def stop_sessions(self):
+        """Save the open sessions once snapshots have stopped"""
+        if self.sessions is not None:
+            self.save_sessions()
+    
+    def schedule_session_save(self, dt=None):
+        """Save sessions off the UI thread"""
+        threading.Thread(target=self.save_sessions, daemon=True).start()
+    
+    def save_sessions(self):
+        """Close timed-out sessions and snapshot the open ones"""
+        for event in self.sessions.expire():
+            self.report_session(event)
+        try:
+            self.sessions.snapshot(self.sessions_path())
+        except OSError as e:
+            self.log_message(f"Could not save entry sessions: {str(e)}", 'warning')
+    
+    def set_stream_status(self, stream_type, connected):
+        """Show a camera's connection state (any thread)"""
+        label = self.stream_status_labels.get(stream_type)
+        if label is None:
+            return
+        text = f"{stream_type.upper()} Stream: {'Connected' if connected else 'Disconnected'}"
+        Clock.schedule_once(lambda dt: setattr(label, 'text', text), 0)
+    
+    def data_path(self, name):
+        """Location of a file kept between launches"""
+        app = App.get_running_app()
+        data_dir = app.user_data_dir if app else os.getcwd()
+        return os.path.join(data_dir, name)
+    
+    def sessions_path(self):
+        """Location of the open entry sessions snapshot"""
+        return self.data_path('sessions.json')
+    
+    def spool_path(self):
+        """Location of the undelivered detections database"""
+        return self.data_path('detection_spool.db')
+    
+    def pipeline_stats(self):
+        """Snapshot of per-stage counters and queue depths"""
+        stats = {name: counters.stats() for name, counters in self.stage_counters.items()}
+        if self.inference:
+            stats['inference'] = self.inference.stats()
+        if self.detector and self.detector.crop_quality:
+            stats['crop_quality'] = self.detector.crop_quality.stats()
+        if self.event_queue:
+            stats['events'] = self.event_queue.stats()
+        if self.delivery:
+            stats['delivery'] = self.delivery.stats()
+        stats['streams'] = {stream_type: state.stats() for stream_type, state in self.streams.items()}
+        if self.worker_pool:
+            stats['workers'] = self.worker_pool.stats()
+        if self.watchlist:
+            stats['watchlist'] = self.watchlist.stats()
+        if self.sessions:
+            stats['sessions'] = self.sessions.stats()
+        stats['verdicts'] = self.verdict_cache.stats()
+        stats['metrics'] = pipeline_metrics.snapshot()
+        stats['log'] = self.log.stats()
+        return stats
+    
+    def process_stream(self, state):
+        """Capture stage: read RTSP frames and hand the newest ones to inference"""
+        # Runs and reports only while its StreamState belongs to the current session
+        def on_detections(stream_type, plates, captured_at, error=None):
+            self.on_detections(stream_type, plates, captured_at, error, state)
+        
+        run_capture(state, self.inference, on_detections,
+                    lambda: self.is_processing and self.streams.get(state.camera.camera_id) is state,
+                    self.stage_counters['capture'], self.log_message, self.set_stream_status)
+    
+    def on_detections(self, stream_type, plates, captured_at, error=None, state=None):
+        """Inference callback: queue a stream's detections for the sink"""
+        if state is None or self.streams.get(stream_type) is not state:
+            # Submitted before a stop, the stream has been flushed or replaced since
+            return
+        if error is not None:
+            self.log_message(f"Error processing {stream_type.upper()} frame: {str(error)}", 'error')
             return
         
-        self.log_message(f"Connected to {stream_type.upper()} stream")
+        # Tracked streams were already associated by the inference service
+        for plate in state.events(plates):
+            self.event_queue.put((stream_type, plate, captured_at), timeout=1.0)
+    
+    def on_worker_event(self, stream_type, plate, captured_at):
+        """Worker pool callback: queue an event from a worker process for the sink"""
+        self.event_queue.put((stream_type, plate, captured_at), timeout=1.0)
+    
+    def run_sink(self):
+        """Sink stage: log detections and send them to the API"""
+        counters = self.stage_counters['sink']
+        while self.is_processing or len(self.event_queue):
+            try:
+                stream_type, plate, captured_at = self.event_queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            
+            self.handle_detection(stream_type, plate)
+            latency = time.monotonic() - captured_at
+            counters.record(latency)
+            pipeline_metrics.observe('event', latency, stream_type)
+            pipeline_metrics.count('events', stream_type)
+    
+    def handle_detection(self, stream_type, plate):
+        """Log a plate read or vehicle event and queue it for the API"""
+        text = plate['text']
+        confidence = plate['confidence']
+        
+        # Vehicle events also carry when the track was first and last seen
+        details = {key: plate[key] for key in ('first_seen', 'last_seen') if key in plate}
         
-        # Update status
-        if stream_type == 'in':
-            self.in_status_label.text = 'IN Stream: Connected'
+        decision = self.local_decision(text)
+        if decision is None:
+            self.log_message(f"{stream_type.upper()}: {text} (conf: {confidence:.2f})")
         else:
-            self.out_status_label.text = 'OUT Stream: Connected'
-        
-        frame_count = 0
-        while self.is_processing:
-            ret, frame = cap.read()
-            if not ret:
-                self.log_message(f"Failed to read frame from {stream_type.upper()} stream")
-                break
-            
-            frame_count += 1
-            # Process every 10th frame to reduce CPU usage
-            if frame_count % 10 == 0 and self.detector:
-                try:
-                    plates = self.detector.detect_and_recognize(frame)
-                    for plate in plates:
-                        text = plate['text']
-                        confidence = plate['confidence']
-                        self.log_message(f"{stream_type.upper()}: {text} (conf: {confidence:.2f})")
-                        
-                        # Send to API
-                        self.send_to_api(text, stream_type)
-                        
-                except Exception as e:
-                    self.log_message(f"Error processing {stream_type.upper()} frame: {str(e)}")
-        
-        cap.release()
-        self.log_message(f"Disconnected from {stream_type.upper()} stream")
-    
-    def send_to_api(self, plate_text, stream_type):
-        """Send detected plate to API"""
-        try:
-            data = {
-                "plate_number": plate_text,
-                "stream_type": stream_type,
-                "timestamp": time.time()
+            details.update(decision)
+            self.log_message(f"{stream_type.upper()}: {text} (conf: {confidence:.2f}) "
+                             f"-> {decision['verdict']} ({decision['verdict_source']})",
+                             'warning' if decision['verdict'] == 'deny' else 'info')
+        
+        # Queue unknown plates for background delivery to the API
+        if decision is None or self.upstream_known_plates:
+            self.send_to_api(text, stream_type, confidence, **details)
+        
+        if self.sessions is not None:
+            self.correlate(stream_type, plate)
+    
+    def correlate(self, stream_type, plate):
+        """Pair entries with exits and report completed sessions"""
+        camera = self.cameras.get(stream_type)
+        direction = camera.direction if camera else None
+        if direction not in ('in', 'out'):
+            return
+        # A vehicle enters when first seen at the entry and leaves when last seen at the exit
+        timestamp = plate.get('first_seen' if direction == 'in' else 'last_seen') or time.time()
+        for event in self.sessions.observe(direction, plate['text'], stream_type, timestamp, plate['confidence']):
+            self.report_session(event)
+    
+    def report_session(self, event):
+        """Log a session event and queue it for the API"""
+        if event['event_type'] == 'session':
+            minutes, seconds = divmod(int(event['dwell']), 60)
+            self.log_message(f"Session: {event['plate_number']} {event['entry_camera'].upper()} -> "
+                             f"{event['exit_camera'].upper()}, dwell {minutes // 60}h{minutes % 60:02d}m{seconds:02d}s")
+        else:
+            self.log_message(f"Session: {event['plate_number']} {event['event_type'].replace('_', ' ')}"
+                             f"{' (' + event['reason'] + ')' if 'reason' in event else ''}", 'debug')
+        if self.delivery:
+            self.delivery.enqueue(dict(event, timestamp=time.time()))
+    
+    def local_decision(self, text):
+        """Verdict for a read from the watchlist or a cached API verdict, None if unknown"""
+        watchlist = self.watchlist
+        match = watchlist.lookup(text) if watchlist else None
+        if match is not None:
+            return {
+                'verdict': match.list,
+                'verdict_source': 'watchlist',
+                'watchlist_plate': match.plate,
+                'watchlist_match': match.kind,
+                'watchlist_info': match.info
             }
-            
-            response = requests.post(self.api_url, json=data, timeout=5)
-            if response.status_code == 200:
-                self.log_message(f"API: Successfully sent {plate_text}")
-            else:
-                self.log_message(f"API: Failed to send {plate_text} (status: {response.status_code})")
-                
-        except Exception as e:
-            self.log_message(f"API: Error sending {plate_text}: {str(e)}")
+        verdict = self.verdict_cache.get(text)
+        if verdict is not None:
+            return {'verdict': verdict, 'verdict_source': 'cache'}
+        return None
+    
+    def send_to_api(self, plate_text, stream_type, confidence=None, **details):
+        """Queue detected plate for delivery to the API"""
+        event = {
+            "plate_number": plate_text,
+            "stream_type": stream_type,
+            "confidence": confidence,
+            "timestamp": time.time()
+        }
+        event.update(details)
+        self.delivery.enqueue(event)
+    
+    def on_api_result(self, events, ok, detail):
+        """Delivery callback: log the outcome of a posted batch"""
+        plates = ', '.join(event['plate_number'] for event in events)
+        if ok:
+            self.log_message(f"API: Successfully sent {plates}", 'debug')
+        else:
+            self.log_message(f"API: Failed to send {plates} ({detail})", 'warning')
+    
+    def on_api_response(self, events, body):
+        """Delivery callback: cache the verdicts returned for posted plates"""
+        verdicts = body.get('verdicts') if isinstance(body, dict) else None
+        if not isinstance(verdicts, dict):
+            return
+        for plate_text, verdict in verdicts.items():
+            self.verdict_cache.put(plate_text, verdict)
 
 class ANPRApp(App):
     def build(self):
         return FullANPRApp()
+    
+    def on_stop(self):
+        self.root.shutdown()
 
 if __name__ == '__main__':
     ANPRApp().run()
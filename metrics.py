@@ -0,0 +1,336 @@
+"""
+Pipeline instrumentation
+Latency histograms, counters and queue-depth gauges for every stage, served
+by a local HTTP endpoint and summarized in a periodic log line
+"""
+
+import http.server
+import json
+import threading
+import time
+
+# Stages in pipeline order: reading a camera frame, wait in the inference
+# queue, plate detection, tracking, crop selection, OCR, time from read to
+# inference result, one API post and time from read to the event sink.
+# Offline runs time decode, wait (for decoded frames) and write instead
+STAGES = ('capture', 'decode', 'wait', 'queue', 'detect', 'track', 'crop', 'ocr', 'inference', 'deliver', 'event',
+          'write')
+
+PERCENTILES = (50, 90, 99)
+
+
+class LatencyHistogram:
+    """Log-linear histogram of durations, in the style of HdrHistogram
+
+    Durations are counted in microseconds. Every power-of-two range is
+    split into 2 ** sub_bucket_bits linear buckets, so percentiles are
+    within 1 / 2 ** sub_bucket_bits (about 3% by default) of the true
+    value while recording stays an index computation and an increment.
+    Durations above max_seconds are counted as max_seconds.
+    """
+
+    def __init__(self, sub_bucket_bits=5, max_seconds=3600.0):
+        self.sub_bucket_bits = sub_bucket_bits
+        self.sub_bucket_count = 1 << sub_bucket_bits
+        self.max_value = int(max_seconds * 1e6)
+        self.counts = [0] * (self._index(self.max_value) + 1)
+        self.lock = threading.Lock()
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds):
+        value = min(max(int(seconds * 1e6), 0), self.max_value)
+        index = self._index(value)
+        with self.lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.total += seconds
+            if seconds > self.max:
+                self.max = seconds
+
+    def percentile(self, percent):
+        """Duration in seconds below which percent of the recorded ones fall"""
+        with self.lock:
+            if not self.count:
+                return 0.0
+            target = max(1, int(round(self.count * percent / 100.0)))
+            seen = 0
+            for index, count in enumerate(self.counts):
+                seen += count
+                if seen >= target:
+                    return min(self._midpoint(index) / 1e6, self.max)
+        return self.max
+
+    def merge(self, exported):
+        """Add the counts of another histogram's export()"""
+        with self.lock:
+            for index, count in exported['counts'].items():
+                self.counts[index] += count
+            self.count += exported['count']
+            self.total += exported['total']
+            self.max = max(self.max, exported['max'])
+
+    def export(self):
+        """Picklable counts, for merging histograms of other processes"""
+        with self.lock:
+            return {
+                'counts': {index: count for index, count in enumerate(self.counts) if count},
+                'count': self.count,
+                'total': self.total,
+                'max': self.max
+            }
+
+    def summary(self):
+        summary = {
+            'count': self.count,
+            'mean': self.total / self.count if self.count else 0.0,
+            'max': self.max
+        }
+        for percent in PERCENTILES:
+            summary[f'p{percent}'] = self.percentile(percent)
+        return summary
+
+    def _index(self, value):
+        if value < self.sub_bucket_count:
+            return value
+        shift = value.bit_length() - self.sub_bucket_bits - 1
+        return ((shift + 1) << self.sub_bucket_bits) + (value >> shift) - self.sub_bucket_count
+
+    def _midpoint(self, index):
+        if index < 2 * self.sub_bucket_count:
+            return index
+        shift = (index >> self.sub_bucket_bits) - 1
+        lower = ((index & (self.sub_bucket_count - 1)) | self.sub_bucket_count) << shift
+        return lower + (1 << shift) / 2
+
+
+class PipelineMetrics:
+    """Per-stage latency histograms, counters and gauges of one process
+
+    observe(stage, seconds, stream) records a duration in the histogram of
+    that stage and stream; stages timed per inference batch use the
+    stream ''. count(name, stream) adds to a counter such as frames or
+    dropped_frames. gauge(name, fn) registers a value such as a queue
+    depth that is only read when metrics are collected, so it costs
+    nothing in between. Worker processes send export() with their
+    heartbeat and the parent absorb()s it under the worker's name. With
+    enabled=False, observe() and count() return straight away.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+        self.remote = {}
+        self.started_at = time.monotonic()
+
+    def observe(self, stage, seconds, stream=''):
+        if not self.enabled:
+            return
+        histogram = self.histograms.get((stage, stream))
+        if histogram is None:
+            with self.lock:
+                histogram = self.histograms.setdefault((stage, stream), LatencyHistogram())
+        histogram.record(seconds)
+
+    def count(self, name, stream='', amount=1):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[(name, stream)] = self.counters.get((name, stream), 0) + amount
+
+    def gauge(self, name, fn):
+        """Report fn() as name when metrics are collected; fn=None removes it"""
+        with self.lock:
+            if fn is None:
+                self.gauges.pop(name, None)
+            else:
+                self.gauges[name] = fn
+
+    def export(self):
+        with self.lock:
+            histograms = list(self.histograms.items())
+            counters = dict(self.counters)
+            gauges = list(self.gauges.items())
+        return {
+            'histograms': {key: histogram.export() for key, histogram in histograms},
+            'counters': counters,
+            'gauges': {name: _read_gauge(fn) for name, fn in gauges}
+        }
+
+    def absorb(self, source, exported):
+        """Keep the latest export() of another process, replacing its previous one"""
+        with self.lock:
+            self.remote[source] = exported
+
+    def reset(self):
+        with self.lock:
+            self.histograms = {}
+            self.counters = {}
+            self.remote = {}
+            self.started_at = time.monotonic()
+
+    def collect(self):
+        """Histograms and counters of this process and absorbed ones, merged by key
+
+        Returns (histograms, counters, gauges); gauges are keyed by
+        (name, source) with source '' for this process.
+        """
+        local = self.export()
+        with self.lock:
+            remote = list(self.remote.items())
+
+        histograms = {}
+        counters = {}
+        gauges = {}
+        for source, exported in [('', local)] + remote:
+            for key, counts in exported['histograms'].items():
+                histograms.setdefault(key, LatencyHistogram()).merge(counts)
+            for key, value in exported['counters'].items():
+                counters[key] = counters.get(key, 0) + value
+            for name, value in exported['gauges'].items():
+                gauges[(name, source)] = value
+        return histograms, counters, gauges
+
+    def snapshot(self):
+        """Summaries as nested dicts, for JSON"""
+        histograms, counters, gauges = self.collect()
+        snapshot = {'uptime': time.monotonic() - self.started_at, 'stages': {}, 'counters': {}, 'gauges': {}}
+        for (stage, stream), histogram in sorted(histograms.items(), key=_stage_order):
+            snapshot['stages'].setdefault(stage, {})[stream] = histogram.summary()
+        for (name, stream), value in sorted(counters.items()):
+            snapshot['counters'].setdefault(name, {})[stream] = value
+        for (name, source), value in sorted(gauges.items()):
+            snapshot['gauges'].setdefault(name, {})[source] = value
+        return snapshot
+
+    def summary_line(self):
+        """One line with p50/p99 per stage over all streams, counters and gauges"""
+        histograms, counters, gauges = self.collect()
+        stages = {}
+        for (stage, _), histogram in histograms.items():
+            stages.setdefault(stage, LatencyHistogram()).merge(histogram.export())
+
+        parts = []
+        for stage, histogram in sorted(stages.items(), key=_stage_order):
+            parts.append(f"{stage} p50 {histogram.percentile(50) * 1000:.1f}ms "
+                         f"p99 {histogram.percentile(99) * 1000:.1f}ms")
+        totals = {}
+        for (name, _), value in counters.items():
+            totals[name] = totals.get(name, 0) + value
+        if totals:
+            parts.append(' '.join(f"{name} {value}" for name, value in sorted(totals.items())))
+        depths = {}
+        for (name, _), value in gauges.items():
+            depths[name] = depths.get(name, 0) + (value or 0)
+        if depths:
+            parts.append(' '.join(f"{name} {value:g}" for name, value in sorted(depths.items())))
+        return ' | '.join(parts) if parts else 'no metrics yet'
+
+    def prometheus(self, prefix='anpr'):
+        """Metrics in the Prometheus text exposition format"""
+        histograms, counters, gauges = self.collect()
+        lines = [
+            f"# HELP {prefix}_stage_latency_seconds Time spent per pipeline stage",
+            f"# TYPE {prefix}_stage_latency_seconds summary"
+        ]
+        for (stage, stream), histogram in sorted(histograms.items(), key=_stage_order):
+            labels = f'stage="{_escape(stage)}",stream="{_escape(stream)}"'
+            for percent in PERCENTILES:
+                lines.append(f'{prefix}_stage_latency_seconds{{{labels},quantile="{percent / 100}"}} '
+                             f'{histogram.percentile(percent):.6f}')
+            lines.append(f'{prefix}_stage_latency_seconds_sum{{{labels}}} {histogram.total:.6f}')
+            lines.append(f'{prefix}_stage_latency_seconds_count{{{labels}}} {histogram.count}')
+
+        for name in sorted({name for name, _ in counters}):
+            lines.append(f"# TYPE {prefix}_{name}_total counter")
+            for (counter, stream), value in sorted(counters.items()):
+                if counter == name:
+                    lines.append(f'{prefix}_{name}_total{{stream="{_escape(stream)}"}} {value}')
+
+        for name in sorted({name for name, _ in gauges}):
+            lines.append(f"# TYPE {prefix}_{name} gauge")
+            for (gauge, source), value in sorted(gauges.items()):
+                if gauge == name and value is not None:
+                    lines.append(f'{prefix}_{name}{{source="{_escape(source)}"}} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+def _read_gauge(fn):
+    try:
+        return fn()
+    except Exception:
+        return None
+
+
+def _stage_order(item):
+    key = item[0]
+    stage, label = key if isinstance(key, tuple) else (key, '')
+    return (STAGES.index(stage) if stage in STAGES else len(STAGES), stage, label)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+# Shared by every stage of this process
+pipeline_metrics = PipelineMetrics()
+
+
+class MetricsServer:
+    """Local HTTP endpoint for scraping pipeline metrics
+
+    GET /metrics returns the Prometheus text format and /metrics.json the
+    snapshot() as JSON. Binds to localhost by default; port=0 picks a
+    free port, available as .port once started.
+    """
+
+    def __init__(self, metrics=None, host='127.0.0.1', port=9108):
+        self.metrics = metrics or pipeline_metrics
+        self.host = host
+        self.port = port
+        self.server = None
+        self.thread = None
+
+    def start(self):
+        if self.server:
+            return
+        metrics = self.metrics
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = self.path.split('?', 1)[0]
+                if path == '/metrics':
+                    body, content_type = metrics.prometheus(), 'text/plain; version=0.0.4'
+                elif path == '/metrics.json':
+                    body, content_type = json.dumps(metrics.snapshot()), 'application/json'
+                else:
+                    self.send_error(404)
+                    return
+                data = body.encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = http.server.ThreadingHTTPServer((self.host, self.port), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if not self.server:
+            return
+        self.server.shutdown()
+        self.server.server_close()
+        self.server = None
+        self.thread.join(1.0)
+        self.thread = None
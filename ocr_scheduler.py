@@ -0,0 +1,341 @@
+"""
+Track-aware OCR scheduling
+Decides which tracked plate crops are worth sending to OCR on each frame,
+rejects crops too small, skewed or blurred to read and keeps the sharpest
+crop of every track until it is read
+"""
+
+import base64
+import heapq
+
+import cv2
+import numpy as np
+
+# Crops are scored at this height so sharpness is comparable across sizes
+SHARPNESS_HEIGHT = 32
+
+
+def sharpness(crop):
+    """Variance of the Laplacian of a crop, higher is sharper"""
+    gray = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY) if crop.ndim == 3 else crop
+    h, w = gray.shape[:2]
+    if h != SHARPNESS_HEIGHT:
+        width = max(1, int(round(w * SHARPNESS_HEIGHT / h)))
+        gray = cv2.resize(gray, (width, SHARPNESS_HEIGHT), interpolation=cv2.INTER_AREA)
+    return float(cv2.Laplacian(gray, cv2.CV_32F).var())
+
+
+def crop_plate(frame, bbox, crop_frame=None):
+    """Crop a box found in frame, from crop_frame instead when given
+
+    crop_frame is the same picture at a higher resolution, such as a
+    camera's main stream when detection ran on its sub stream; the box is
+    scaled to it.
+    """
+    x, y, w, h = bbox
+    if crop_frame is None or crop_frame.shape[:2] == frame.shape[:2]:
+        return (crop_frame if crop_frame is not None else frame)[y:y+h, x:x+w]
+    sx = crop_frame.shape[1] / frame.shape[1]
+    sy = crop_frame.shape[0] / frame.shape[0]
+    x1, y1 = int(x * sx), int(y * sy)
+    x2, y2 = int(round((x + w) * sx)), int(round((y + h) * sy))
+    return crop_frame[y1:y2, x1:x2]
+
+
+def _order_corners(points):
+    """Four points as top-left, top-right, bottom-right, bottom-left"""
+    sums = points.sum(axis=1)
+    diffs = points[:, 1] - points[:, 0]
+    return np.array([points[sums.argmin()], points[diffs.argmin()], points[sums.argmax()], points[diffs.argmax()]],
+                    dtype=np.float32)
+
+
+def deskew_plate(crop, max_angle=30.0):
+    """The crop with its plate straightened, or the crop itself when no plate outline is found
+
+    The outline is the largest bright region of an Otsu threshold and must
+    cover a third of the crop. When it simplifies to four corners the crop
+    is warped so they form a rectangle (perspective); otherwise it is
+    rotated by the angle of the outline's minimum-area rectangle, if that
+    is within max_angle degrees.
+    """
+    gray = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY) if crop.ndim == 3 else crop
+    _, mask = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if not contours:
+        return crop
+    contour = max(contours, key=cv2.contourArea)
+    h, w = gray.shape[:2]
+    if cv2.contourArea(contour) < h * w / 3:
+        return crop
+
+    quad = cv2.approxPolyDP(contour, 0.04 * cv2.arcLength(contour, True), True)
+    if len(quad) == 4:
+        corners = _order_corners(quad.reshape(4, 2).astype(np.float32))
+        top_left, top_right, bottom_right, bottom_left = corners
+        width = int(round(max(np.linalg.norm(top_right - top_left), np.linalg.norm(bottom_right - bottom_left))))
+        height = int(round(max(np.linalg.norm(bottom_left - top_left), np.linalg.norm(bottom_right - top_right))))
+        if width < 2 or height < 2:
+            return crop
+        target = np.array([[0, 0], [width - 1, 0], [width - 1, height - 1], [0, height - 1]], dtype=np.float32)
+        return cv2.warpPerspective(crop, cv2.getPerspectiveTransform(corners, target), (width, height),
+                                   borderMode=cv2.BORDER_REPLICATE)
+
+    _, (rect_w, rect_h), angle = cv2.minAreaRect(contour)
+    if rect_w < rect_h:
+        angle -= 90
+    angle = (angle + 45) % 90 - 45
+    if abs(angle) < 1 or abs(angle) > max_angle:
+        return crop
+    rotation = cv2.getRotationMatrix2D((w / 2, h / 2), angle, 1.0)
+    return cv2.warpAffine(crop, rotation, (w, h), borderMode=cv2.BORDER_REPLICATE)
+
+
+class CropQualityGate:
+    """Cheap checks that keep unreadable crops away from OCR
+
+    check() rejects a crop as 'small' when it is narrower than min_width
+    or lower than min_height pixels, as 'aspect' when its width / height
+    is outside min_aspect to max_aspect (tilted plates get squarer boxes)
+    and as 'blur' when its sharpness() is below min_sharpness. Once a
+    track was read top_k times, OcrScheduler rejects its crops as 'top_k'
+    unless they are sharper than the least sharp of its top_k sharpest
+    reads; such a crop takes that read's place, so a track whose reads
+    have not settled its text keeps being read as better crops come. With
+    deskew, crops are straightened with deskew_plate() before OCR.
+    rejected counts crops per reason.
+    """
+
+    REASONS = ('small', 'aspect', 'blur', 'top_k')
+
+    def __init__(self, min_width=36, min_height=12, min_aspect=1.0, max_aspect=8.0, min_sharpness=30.0, top_k=3,
+                 deskew=False):
+        self.min_width = min_width
+        self.min_height = min_height
+        self.min_aspect = min_aspect
+        self.max_aspect = max_aspect
+        self.min_sharpness = min_sharpness
+        self.top_k = top_k
+        self.deskew = deskew
+        self.rejected = dict.fromkeys(self.REASONS, 0)
+        self.passed_count = 0
+
+    def check(self, crop):
+        """(reason, sharpness) of a crop, reason is None when it is worth reading
+
+        sharpness is None when the crop was rejected before it was scored.
+        """
+        h, w = crop.shape[:2]
+        if w < self.min_width or h < self.min_height:
+            return self.reject('small'), None
+        if not self.min_aspect <= w / h <= self.max_aspect:
+            return self.reject('aspect'), None
+        crop_sharpness = sharpness(crop)
+        if crop_sharpness < self.min_sharpness:
+            return self.reject('blur'), crop_sharpness
+        self.passed_count += 1
+        return None, crop_sharpness
+
+    def reject(self, reason):
+        self.rejected[reason] += 1
+        return reason
+
+    @property
+    def rejected_count(self):
+        return sum(self.rejected.values())
+
+    def stats(self):
+        return dict(self.rejected, passed=self.passed_count)
+
+
+class TrackOcrState:
+    __slots__ = ('last_read_frame', 'read_count', 'read_area', 'read_sharpness', 'read_sharpnesses', 'best_crop',
+                 'best_sharpness')
+
+    def __init__(self):
+        self.last_read_frame = -1
+        self.read_count = 0
+        self.read_area = 0
+        self.read_sharpness = 0.0
+        # Min-heap of the sharpness of every read, trimmed to the top_k sharpest
+        self.read_sharpnesses = []
+        self.best_crop = None
+        self.best_sharpness = -1.0
+
+
+class OcrScheduler:
+    """Chooses which crops of one stream's tracks to OCR
+
+    New tracks are read immediately. Established tracks are read again
+    every reread_interval frames, or straight away when a crop is larger
+    or sharper than the last one read by more than improvement. Until a
+    track is due, the sharpest crop seen since its last read is cached
+    and that crop is read instead of whatever the current frame holds.
+    Finalized tracks are never read again. With a CropQualityGate passed
+    to select(), crops it rejects are neither read nor cached, and past
+    its top_k reads a track is only read on crops sharper than those.
+
+    With require_crop_frame (a camera detected on its sub stream), crops
+    are only ever read from a crop_frame; a frame without one, or whose
+    callable returns None, reads nothing and leaves its tracks pending.
+    on_wants_reads is called after every select() that leaves a track
+    needing reads, so the main stream can be opened right away.
+    """
+
+    def __init__(self, tracker, reread_interval=5, improvement=0.25, require_crop_frame=False, on_wants_reads=None):
+        self.tracker = tracker
+        self.reread_interval = reread_interval
+        self.improvement = improvement
+        self.require_crop_frame = require_crop_frame
+        self.on_wants_reads = on_wants_reads
+        self.frame_index = 0
+        self.states = {}
+        self.scheduled_count = 0
+        self.skipped_count = 0
+        self.rejected_count = 0
+        self.unpaired_count = 0
+        self.wants_reads = False
+
+    def select(self, frame, boxes, track_ids, crop_frame=None, quality=None):
+        """(track_id, bbox, crop) triples to OCR for this frame
+
+        Crops are picked on frame. crop_frame is the same moment at a
+        higher resolution (see crop_plate), or a callable returning it or
+        None that is only called once a crop is picked to be read or kept
+        as a track's best; the picked crops are then cut from it and only
+        those go through the quality gate. Areas are compared in frame
+        coordinates. quality is an optional CropQualityGate.
+        """
+        self.frame_index += 1
+        self._prune()
+        selected = []
+        resolved = []
+
+        def readable(bbox, crop):
+            # The crop that would be read, None when the gate rejects it
+            if crop_frame is None and not self.require_crop_frame:
+                return crop
+            if not resolved:
+                resolved.append(crop_frame() if callable(crop_frame) else crop_frame)
+            if resolved[0] is None:
+                # No main frame for this moment, the sub-stream crop is not worth a vote
+                self.unpaired_count += 1
+                return None
+            crop = crop_plate(frame, bbox, resolved[0])
+            if crop.size == 0:
+                return None
+            if quality is not None and quality.check(crop)[0] is not None:
+                self.rejected_count += 1
+                return None
+            return crop
+
+        for bbox, track_id in zip(boxes, track_ids):
+            if not self.tracker.needs_ocr(track_id):
+                self.states.pop(track_id, None)
+                self.skipped_count += 1
+                continue
+
+            crop = crop_plate(frame, bbox)
+            if crop.size == 0:
+                continue
+            state = self.states.get(track_id)
+            if quality is not None and crop_frame is None and not self.require_crop_frame:
+                reason, crop_sharpness = quality.check(crop)
+                if reason is not None:
+                    self.rejected_count += 1
+                    continue
+            else:
+                crop_sharpness = sharpness(crop)
+            # Counted on the kept sharpnesses, a state restored without them reads top_k more
+            capped = (quality is not None and quality.top_k and state is not None
+                      and len(state.read_sharpnesses) >= quality.top_k)
+            if capped:
+                while len(state.read_sharpnesses) > quality.top_k:
+                    heapq.heappop(state.read_sharpnesses)
+                if crop_sharpness <= state.read_sharpnesses[0]:
+                    quality.reject('top_k')
+                    self.rejected_count += 1
+                    continue
+            area = bbox[2] * bbox[3]
+
+            if state is None or (area > state.read_area * (1 + self.improvement)
+                                 or crop_sharpness > state.read_sharpness * (1 + self.improvement)):
+                crop = readable(bbox, crop)
+                if crop is None:
+                    continue
+                if state is None:
+                    state = self.states[track_id] = TrackOcrState()
+                self._mark_read(state, area, crop_sharpness)
+                selected.append((track_id, bbox, crop))
+                continue
+
+            if crop_sharpness > state.best_sharpness:
+                crop = readable(bbox, crop)
+                if crop is not None:
+                    # Copy, the frame buffer is reused once this frame is done
+                    state.best_crop = crop.copy()
+                    state.best_sharpness = crop_sharpness
+            if self.frame_index - state.last_read_frame >= self.reread_interval and state.best_crop is not None:
+                selected.append((track_id, bbox, state.best_crop))
+                self._mark_read(state, area, state.best_sharpness)
+            else:
+                self.skipped_count += 1
+
+        # Read by the capture thread to keep the main stream of a sub-stream camera open
+        self.wants_reads = any(self.tracker.needs_ocr(track_id) for track_id in self.tracker.store.slots)
+        if self.wants_reads and self.on_wants_reads is not None:
+            self.on_wants_reads()
+        self.scheduled_count += len(selected)
+        return selected
+
+    def state(self):
+        """Tracker and per-track read state as plain JSON types, cached crops as PNG"""
+        states = {}
+        for track_id, state in self.states.items():
+            entry = {'last_read_frame': state.last_read_frame, 'read_count': state.read_count,
+                     'read_area': int(state.read_area), 'read_sharpness': float(state.read_sharpness),
+                     'read_sharpnesses': [float(value) for value in state.read_sharpnesses],
+                     'best_sharpness': float(state.best_sharpness)}
+            if state.best_crop is not None:
+                entry['best_crop'] = base64.b64encode(cv2.imencode('.png', state.best_crop)[1]).decode('ascii')
+            states[str(track_id)] = entry
+        return {'frame_index': self.frame_index, 'tracker': self.tracker.state(), 'states': states}
+
+    def restore(self, state):
+        """Continue from a state(), reads are scheduled as if nothing had stopped
+
+        Fields missing from an older state keep their TrackOcrState defaults.
+        """
+        self.frame_index = state['frame_index']
+        self.tracker.restore(state['tracker'])
+        self.states = {}
+        for track_id, entry in state['states'].items():
+            track = self.states[int(track_id)] = TrackOcrState()
+            for name, value in entry.items():
+                if name == 'best_crop':
+                    value = cv2.imdecode(np.frombuffer(base64.b64decode(value), dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+                setattr(track, name, value)
+        self.wants_reads = any(self.tracker.needs_ocr(track_id) for track_id in self.tracker.store.slots)
+
+    def stats(self):
+        return {
+            'tracks': len(self.states),
+            'scheduled': self.scheduled_count,
+            'skipped': self.skipped_count,
+            'rejected': self.rejected_count,
+            'unpaired': self.unpaired_count
+        }
+
+    def _mark_read(self, state, area, crop_sharpness):
+        state.last_read_frame = self.frame_index
+        state.read_count += 1
+        state.read_area = max(state.read_area, area)
+        state.read_sharpness = max(state.read_sharpness, crop_sharpness)
+        heapq.heappush(state.read_sharpnesses, crop_sharpness)
+        state.best_crop = None
+        state.best_sharpness = -1.0
+
+    def _prune(self):
+        live = self.tracker.store.slots
+        for track_id in [track_id for track_id in self.states if track_id not in live]:
+            del self.states[track_id]
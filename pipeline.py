@@ -0,0 +1,132 @@
+"""
+Staged processing pipeline primitives
+Bounded queues with selectable overflow policies and per-stage counters,
+used to decouple capture, inference and delivery threads
+"""
+
+import collections
+import queue
+import threading
+import time
+
+# Overflow policies
+DROP_OLDEST = 'drop_oldest'
+DROP_NEWEST = 'drop_newest'
+BLOCK = 'block'
+
+POLICIES = (DROP_OLDEST, DROP_NEWEST, BLOCK)
+
+
+class BoundedQueue:
+    """Thread-safe FIFO with a fixed capacity and an overflow policy
+
+    drop_oldest evicts the head to make room, drop_newest rejects the new
+    item and block waits (up to timeout) for a consumer to free a slot.
+    on_drop(item) is called for every evicted or rejected item.
+    """
+
+    def __init__(self, maxsize, policy=DROP_OLDEST, name='', on_drop=None):
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown overflow policy: {policy}")
+        self.maxsize = maxsize
+        self.policy = policy
+        self.name = name
+        self.on_drop = on_drop
+        self._items = collections.deque()
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+        self.put_count = 0
+        self.get_count = 0
+        self.dropped_count = 0
+
+    def put(self, item, timeout=None):
+        """Add an item, returns False if the new item was rejected"""
+        dropped = None
+        accepted = True
+        with self._lock:
+            if len(self._items) >= self.maxsize:
+                if self.policy == DROP_NEWEST:
+                    dropped, accepted = item, False
+                elif self.policy == DROP_OLDEST:
+                    dropped = self._items.popleft()
+                else:
+                    deadline = None if timeout is None else time.monotonic() + timeout
+                    while len(self._items) >= self.maxsize:
+                        remaining = None if deadline is None else deadline - time.monotonic()
+                        if remaining is not None and remaining <= 0:
+                            dropped, accepted = item, False
+                            break
+                        self._not_full.wait(remaining)
+            if dropped is not None:
+                self.dropped_count += 1
+            if accepted:
+                self._items.append(item)
+                self.put_count += 1
+                self._not_empty.notify()
+        if dropped is not None and self.on_drop:
+            self.on_drop(dropped)
+        return accepted
+
+    def get(self, timeout=None):
+        """Remove and return the oldest item, raises queue.Empty on timeout"""
+        with self._lock:
+            deadline = None if timeout is None else time.monotonic() + timeout
+            while not self._items:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise queue.Empty
+                self._not_empty.wait(remaining)
+            item = self._items.popleft()
+            self.get_count += 1
+            self._not_full.notify()
+            return item
+
+    def __len__(self):
+        with self._lock:
+            return len(self._items)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'depth': len(self._items),
+                'maxsize': self.maxsize,
+                'policy': self.policy,
+                'put': self.put_count,
+                'got': self.get_count,
+                'dropped': self.dropped_count
+            }
+
+
+class StageCounters:
+    """Processed/error counts and frame age seen by one pipeline stage"""
+
+    def __init__(self, name=''):
+        self.name = name
+        self._lock = threading.Lock()
+        self.processed = 0
+        self.errors = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    def record(self, latency=0.0):
+        with self._lock:
+            self.processed += 1
+            self.total_latency += latency
+            if latency > self.max_latency:
+                self.max_latency = latency
+
+    def error(self):
+        with self._lock:
+            self.errors += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'processed': self.processed,
+                'errors': self.errors,
+                'avg_latency': self.total_latency / self.processed if self.processed else 0.0,
+                'max_latency': self.max_latency
+            }
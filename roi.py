@@ -0,0 +1,79 @@
+"""
+Detection regions of interest
+Restricts plate detection to a lane area and runs it on a downscaled copy,
+mapping the boxes back to full-resolution frame coordinates
+"""
+
+import cv2
+import numpy as np
+
+
+class DetectionRegion:
+    """Rectangle or polygon of a frame that the detector should look at
+
+    rect is (x, y, w, h) and polygon a list of (x, y) points, both in
+    full-resolution pixels; with neither the whole frame is used. The
+    region's bounding box is cropped and scaled so its longer side is at
+    most inference_size, and pixels outside a polygon are blanked.
+    """
+
+    def __init__(self, rect=None, polygon=None):
+        if rect is not None and polygon is not None:
+            raise ValueError("Give either rect or polygon, not both")
+        self.polygon = None if polygon is None else np.asarray(polygon, dtype=np.int32).reshape(-1, 2)
+        if self.polygon is not None:
+            rect = cv2.boundingRect(self.polygon)
+        self.rect = None if rect is None else tuple(int(v) for v in rect)
+        self._mask = None
+        self._mask_key = None
+
+    @classmethod
+    def from_config(cls, config):
+        """Build from {'rect': [x, y, w, h]} or {'polygon': [[x, y], ...]}"""
+        if not config:
+            return cls()
+        return cls(rect=config.get('rect'), polygon=config.get('polygon'))
+
+    def prepare(self, frame, inference_size):
+        """Detector input for this frame and the (x, y, scale) to map it back"""
+        height, width = frame.shape[:2]
+        x, y, w, h = self.rect if self.rect else (0, 0, width, height)
+        x, y = max(0, x), max(0, y)
+        w, h = min(w, width - x), min(h, height - y)
+        image = frame[y:y+h, x:x+w]
+
+        scale = min(1.0, inference_size / max(w, h))
+        if scale < 1.0:
+            size = (max(1, int(round(w * scale))), max(1, int(round(h * scale))))
+            image = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+
+        if self.polygon is not None:
+            image = cv2.bitwise_and(image, image, mask=self._polygon_mask(image.shape[:2], (x, y), scale))
+        return image, (x, y, scale)
+
+    def map_boxes(self, boxes, transform, frame_shape):
+        """Detector (x1, y1, x2, y2) boxes as full-resolution (x, y, w, h)"""
+        x, y, scale = transform
+        height, width = frame_shape[:2]
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4) / scale + (x, y, x, y)
+        boxes[:, 0::2] = boxes[:, 0::2].clip(0, width)
+        boxes[:, 1::2] = boxes[:, 1::2].clip(0, height)
+        boxes = boxes.astype(np.int64)
+
+        mapped = []
+        for x1, y1, x2, y2 in boxes:
+            if self.polygon is not None:
+                center = (float(x1 + x2) / 2, float(y1 + y2) / 2)
+                if cv2.pointPolygonTest(self.polygon, center, False) < 0:
+                    continue
+            mapped.append((int(x1), int(y1), int(x2 - x1), int(y2 - y1)))
+        return mapped
+
+    def _polygon_mask(self, shape, offset, scale):
+        key = (shape, offset, scale)
+        if self._mask_key != key:
+            points = np.round((self.polygon - offset) * scale).astype(np.int32)
+            self._mask = np.zeros(shape, dtype=np.uint8)
+            cv2.fillPoly(self._mask, [points], 255)
+            self._mask_key = key
+        return self._mask
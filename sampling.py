@@ -0,0 +1,126 @@
+"""
+Adaptive frame sampling
+Chooses which decoded frames are sent to inference, based on scene motion,
+live tracks and how far behind the inference queue is
+"""
+
+import time
+
+import cv2
+import numpy as np
+
+
+class AdaptiveSampler:
+    """Per-stream decision of which frames to process
+
+    Every motion_interval frames a small grayscale thumbnail is diffed
+    against the previous one; a frame counts as moving when more than
+    motion_fraction of its pixels changed by more than motion_threshold.
+    While there was motion in the last motion_hold seconds, or
+    active_tracks() reports live tracks, every active_interval-th frame is
+    processed; otherwise only every idle_interval-th frame (keep-alive).
+    The interval is multiplied by a backoff factor that doubles each time
+    a frame comes due while queue_load() (0..1) is above lag_threshold, up
+    to max_backoff, and halves again once the queue has drained. active
+    tells whether the last frame fell in an active period.
+    """
+
+    def __init__(self, active_interval=2, idle_interval=25, motion_interval=3,
+                 motion_threshold=12, motion_fraction=0.01, motion_hold=2.0,
+                 lag_threshold=0.5, max_backoff=8, thumbnail_size=(64, 36),
+                 active_tracks=None, queue_load=None):
+        self.active_interval = active_interval
+        self.idle_interval = idle_interval
+        self.motion_interval = motion_interval
+        self.motion_threshold = motion_threshold
+        self.motion_fraction = motion_fraction
+        self.motion_hold = motion_hold
+        self.lag_threshold = lag_threshold
+        self.max_backoff = max_backoff
+        self.thumbnail_size = thumbnail_size
+        self.active_tracks = active_tracks
+        self.queue_load = queue_load
+
+        self.frame_count = 0
+        self.frames_since_sample = 0
+        self.previous_thumbnail = None
+        self.last_motion = float('-inf')
+        self.backoff = 1
+        self.interval = idle_interval
+        self.active = False
+        self.sampled_count = 0
+        self._rate_started = time.monotonic()
+        self._rate_samples = 0
+        self.effective_rate = 0.0
+
+    def wants_frame(self):
+        """Whether the next should_process() call will look at the pixels
+
+        Frames it will not look at can be grabbed without being converted
+        and passed as None.
+        """
+        return ((self.frame_count + 1) % self.motion_interval == 0
+                or self.frames_since_sample + 1 >= self.interval)
+
+    def should_process(self, frame):
+        """Whether this frame should be sent to inference"""
+        now = time.monotonic()
+        self.frame_count += 1
+        self.frames_since_sample += 1
+
+        if self.frame_count % self.motion_interval == 0 and frame is not None and self._detect_motion(frame):
+            self.last_motion = now
+
+        active = now - self.last_motion <= self.motion_hold
+        if not active and self.active_tracks:
+            active = self.active_tracks()
+        self.active = active
+        base_interval = self.active_interval if active else self.idle_interval
+
+        self.interval = base_interval * self.backoff
+        self._update_rate(now)
+        # A frame that came due without pixels waits for the next one
+        if frame is None or self.frames_since_sample < self.interval:
+            return False
+
+        # Re-evaluate the backoff only when a frame is due
+        if self.queue_load:
+            if self.queue_load() > self.lag_threshold:
+                if self.backoff < self.max_backoff:
+                    self.backoff = min(self.backoff * 2, self.max_backoff)
+                    self.interval = base_interval * self.backoff
+                    return False
+            elif self.backoff > 1:
+                self.backoff //= 2
+
+        self.frames_since_sample = 0
+        self.sampled_count += 1
+        self._rate_samples += 1
+        return True
+
+    def stats(self):
+        return {
+            'interval': self.interval,
+            'backoff': self.backoff,
+            'effective_rate': self.effective_rate,
+            'frames': self.frame_count,
+            'sampled': self.sampled_count
+        }
+
+    def _detect_motion(self, frame):
+        thumbnail = cv2.resize(frame, self.thumbnail_size, interpolation=cv2.INTER_AREA)
+        if thumbnail.ndim == 3:
+            thumbnail = cv2.cvtColor(thumbnail, cv2.COLOR_BGR2GRAY)
+        previous = self.previous_thumbnail
+        self.previous_thumbnail = thumbnail
+        if previous is None:
+            return True
+        changed = np.count_nonzero(cv2.absdiff(thumbnail, previous) > self.motion_threshold)
+        return changed > self.motion_fraction * thumbnail.size
+
+    def _update_rate(self, now, window=2.0):
+        elapsed = now - self._rate_started
+        if elapsed >= window:
+            self.effective_rate = self._rate_samples / elapsed
+            self._rate_started = now
+            self._rate_samples = 0
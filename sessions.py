@@ -0,0 +1,230 @@
+"""
+Entry/exit correlation
+Pairs plates read by 'in' cameras with later reads by 'out' cameras into one
+session event with the dwell time, in a bounded, time-windowed store
+"""
+
+import collections
+import json
+import os
+import tempfile
+import threading
+import time
+
+from tracker import normalize_plate
+from watchlist import deletion_variants, fold_plate, within_one_edit
+
+OpenSession = collections.namedtuple('OpenSession', ['key', 'plate', 'camera_id', 'entered_at', 'confidence'])
+
+
+class SessionCorrelator:
+    """Open entry sessions keyed by normalized plate
+
+    observe() takes every read of an 'in' or 'out' camera and returns the
+    events it completes:
+
+    - 'session' when an exit matches an open entry, with entry and exit
+      time, dwell and how the plates matched ('exact', 'confusion' or
+      'fuzzy', see watchlist.PlateIndex);
+    - 'session_expired' when an entry is closed without an exit, because
+      it stayed open longer than max_dwell ('timeout'), was pushed out by
+      max_sessions ('evicted') or the plate entered again ('reentered');
+    - 'exit_unmatched' for an exit without an open entry.
+
+    An entry read again within reentry_window seconds is the same visit
+    and keeps its first entry time. Exits are matched by dictionary
+    lookups on the plate, its folded form and its single-character
+    deletions, so the cost does not depend on how many sessions are open;
+    when several entries match equally well the oldest wins. Sessions are
+    kept in entry order, so expiry only looks at the oldest ones.
+    Timestamps are wall-clock seconds, which keeps snapshot() files
+    valid across restarts.
+    """
+
+    def __init__(self, max_dwell=24 * 3600.0, max_sessions=20000, reentry_window=120.0, min_fuzzy_length=5):
+        self.max_dwell = max_dwell
+        self.max_sessions = max_sessions
+        self.reentry_window = reentry_window
+        self.min_fuzzy_length = min_fuzzy_length
+        self.lock = threading.Lock()
+        self.snapshot_lock = threading.Lock()
+        self.sessions = collections.OrderedDict()
+        self.by_folded = {}
+        self.by_variant = {}
+        self.matched_count = 0
+        self.expired_count = 0
+        self.evicted_count = 0
+        self.unmatched_count = 0
+
+    def observe(self, direction, text, camera_id, timestamp=None, confidence=None):
+        """Events completed by one read; reads of cameras without a direction are ignored"""
+        key = normalize_plate(text)
+        if not key or direction not in ('in', 'out'):
+            return []
+        timestamp = time.time() if timestamp is None else timestamp
+        with self.lock:
+            events = self._expire(timestamp)
+            if direction == 'in':
+                events.extend(self._enter(OpenSession(key, text, camera_id, timestamp, confidence)))
+            else:
+                events.append(self._exit(key, text, camera_id, timestamp))
+        return events
+
+    def expire(self, now=None):
+        """Close sessions open longer than max_dwell, returns their events"""
+        with self.lock:
+            return self._expire(time.time() if now is None else now)
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'open': len(self.sessions),
+                'matched': self.matched_count,
+                'expired': self.expired_count,
+                'evicted': self.evicted_count,
+                'unmatched_exits': self.unmatched_count
+            }
+
+    def snapshot(self, path):
+        """Write the open sessions to path, replacing it atomically
+
+        Safe to call from several threads: snapshots are taken and written
+        one at a time, each through its own temporary file, so a newer one
+        is never replaced by an older one.
+        """
+        with self.snapshot_lock:
+            with self.lock:
+                sessions = [session._asdict() for session in self.sessions.values()]
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    json.dump({'saved_at': time.time(), 'sessions': sessions}, f)
+                os.replace(temp_path, path)
+            except BaseException:
+                os.remove(temp_path)
+                raise
+        return len(sessions)
+
+    def restore(self, path):
+        """Reopen the sessions of a snapshot() that have not expired since; returns how many"""
+        with open(path) as f:
+            sessions = json.load(f).get('sessions', [])
+        now = time.time()
+        restored = 0
+        with self.lock:
+            for entry in sorted(sessions, key=lambda entry: entry['entered_at']):
+                session = OpenSession(**entry)
+                if now - session.entered_at <= self.max_dwell and session.key not in self.sessions:
+                    self._add(session)
+                    restored += 1
+            while len(self.sessions) > self.max_sessions:
+                self._remove(next(iter(self.sessions.values())))
+        return restored
+
+    def _enter(self, session):
+        events = []
+        previous = self.sessions.get(session.key)
+        if previous is not None:
+            if session.entered_at - previous.entered_at <= self.reentry_window:
+                return events
+            self._remove(previous)
+            events.append(self._closed(previous, 'reentered'))
+        self._add(session)
+        if len(self.sessions) > self.max_sessions:
+            oldest = next(iter(self.sessions.values()))
+            self._remove(oldest)
+            self.evicted_count += 1
+            events.append(self._closed(oldest, 'evicted'))
+        return events
+
+    def _exit(self, key, text, camera_id, timestamp):
+        session, kind = self._match(key)
+        if session is None:
+            self.unmatched_count += 1
+            return {
+                'event_type': 'exit_unmatched',
+                'plate_number': text,
+                'exit_camera': camera_id,
+                'exit_time': timestamp
+            }
+        self._remove(session)
+        self.matched_count += 1
+        return {
+            'event_type': 'session',
+            'plate_number': session.plate,
+            'exit_plate_number': text,
+            'entry_camera': session.camera_id,
+            'exit_camera': camera_id,
+            'entry_time': session.entered_at,
+            'exit_time': timestamp,
+            'dwell': max(0.0, timestamp - session.entered_at),
+            'match': kind
+        }
+
+    def _match(self, key):
+        session = self.sessions.get(key)
+        if session is not None:
+            return session, 'exact'
+        folded = fold_plate(key)
+        keys = self.by_folded.get(folded)
+        if keys:
+            return self._oldest(keys), 'confusion'
+        if len(folded) < self.min_fuzzy_length:
+            return None, None
+        keys = set()
+        for variant in deletion_variants(folded):
+            keys.update(self.by_variant.get(variant, ()))
+        keys = [other for other in keys if within_one_edit(folded, fold_plate(other))]
+        if not keys:
+            return None, None
+        return self._oldest(keys), 'fuzzy'
+
+    def _oldest(self, keys):
+        return min((self.sessions[key] for key in keys), key=lambda session: session.entered_at)
+
+    def _expire(self, now):
+        events = []
+        while self.sessions:
+            oldest = next(iter(self.sessions.values()))
+            if now - oldest.entered_at <= self.max_dwell:
+                break
+            self._remove(oldest)
+            events.append(self._closed(oldest, 'timeout'))
+        return events
+
+    def _closed(self, session, reason):
+        self.expired_count += 1
+        return {
+            'event_type': 'session_expired',
+            'plate_number': session.plate,
+            'entry_camera': session.camera_id,
+            'entry_time': session.entered_at,
+            'reason': reason
+        }
+
+    def _add(self, session):
+        self.sessions[session.key] = session
+        folded = fold_plate(session.key)
+        self.by_folded.setdefault(folded, set()).add(session.key)
+        if len(folded) >= self.min_fuzzy_length:
+            for variant in deletion_variants(folded):
+                self.by_variant.setdefault(variant, set()).add(session.key)
+
+    def _remove(self, session):
+        del self.sessions[session.key]
+        folded = fold_plate(session.key)
+        self._discard(self.by_folded, folded, session.key)
+        if len(folded) >= self.min_fuzzy_length:
+            for variant in deletion_variants(folded):
+                self._discard(self.by_variant, variant, session.key)
+
+    @staticmethod
+    def _discard(index, name, key):
+        keys = index.get(name)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del index[name]
@@ -0,0 +1,141 @@
+"""
+Persistent on-disk spool for detection events
+Events are appended to a SQLite database in WAL mode before delivery and
+only removed after the delivery worker commits past them, so a dropped
+uplink or a killed process does not lose detections
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+class EventSpool:
+    """Append-only event log with a committed delivery offset
+
+    Appends are grouped into one transaction and made durable every
+    fsync_batch events or fsync_interval seconds, whichever comes first;
+    a timer commits the transaction fsync_interval seconds after it was
+    opened even if nothing else touches the spool, so at most that window
+    is lost if the process is killed, whatever delivery is doing. compact()
+    drops delivered rows, undelivered rows older than max_age seconds and
+    the oldest undelivered rows beyond max_events.
+    """
+
+    def __init__(self, path, fsync_batch=50, fsync_interval=1.0, max_events=100000, max_age=7 * 24 * 3600):
+        self.path = path
+        self.fsync_batch = fsync_batch
+        self.fsync_interval = fsync_interval
+        self.max_events = max_events
+        self.max_age = max_age
+        self.expired_count = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS events ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, created REAL NOT NULL, payload TEXT NOT NULL)"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        self._conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('committed', 0)")
+        self.committed = self._conn.execute("SELECT value FROM meta WHERE key = 'committed'").fetchone()[0]
+
+        self._in_transaction = False
+        self._uncommitted = 0
+        self._last_sync = time.monotonic()
+        self._timer = None
+        self._closed = False
+
+    def append(self, event):
+        """Store an event, returns its offset"""
+        with self._lock:
+            if not self._in_transaction:
+                self._conn.execute("BEGIN")
+                self._in_transaction = True
+                # Appends are not followed by a flush while the uplink is down
+                self._timer = threading.Timer(self.fsync_interval, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+            cursor = self._conn.execute(
+                "INSERT INTO events (created, payload) VALUES (?, ?)",
+                (time.time(), json.dumps(event))
+            )
+            self._uncommitted += 1
+            if self._uncommitted >= self.fsync_batch or time.monotonic() - self._last_sync >= self.fsync_interval:
+                self._sync()
+            return cursor.lastrowid
+
+    def flush(self):
+        """Make all appended events durable"""
+        with self._lock:
+            if not self._closed:
+                self._sync()
+
+    def read(self, limit):
+        """Oldest undelivered events as (offset, created, event) tuples"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, created, payload FROM events WHERE id > ? ORDER BY id LIMIT ?",
+                (self.committed, limit)
+            ).fetchall()
+        return [(offset, created, json.loads(payload)) for offset, created, payload in rows]
+
+    def commit(self, offset):
+        """Mark every event up to and including offset as delivered"""
+        with self._lock:
+            if offset <= self.committed:
+                return
+            self._sync()
+            self._conn.execute("UPDATE meta SET value = ? WHERE key = 'committed'", (offset,))
+            self.committed = offset
+
+    def pending(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM events WHERE id > ?", (self.committed,)).fetchone()[0]
+
+    def compact(self):
+        """Remove delivered and expired rows and give the space back"""
+        with self._lock:
+            self._sync()
+            self._conn.execute("BEGIN")
+            expired = self._conn.execute(
+                "DELETE FROM events WHERE id > ? AND created < ?",
+                (self.committed, time.time() - self.max_age)
+            ).rowcount
+            overflow = self._conn.execute(
+                "SELECT id FROM events WHERE id > ? ORDER BY id DESC LIMIT 1 OFFSET ?",
+                (self.committed, self.max_events)
+            ).fetchone()
+            if overflow:
+                expired += self._conn.execute(
+                    "DELETE FROM events WHERE id > ? AND id <= ?", (self.committed, overflow[0])
+                ).rowcount
+            self._conn.execute("DELETE FROM events WHERE id <= ?", (self.committed,))
+            self._conn.execute("COMMIT")
+            self.expired_count += expired
+            self._conn.execute("PRAGMA incremental_vacuum")
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            return expired
+
+    def close(self):
+        with self._lock:
+            self._sync()
+            self._conn.close()
+            self._closed = True
+
+    def _sync(self):
+        if self._in_transaction:
+            self._conn.execute("COMMIT")
+            self._in_transaction = False
+            self._timer.cancel()
+        self._uncommitted = 0
+        self._last_sync = time.monotonic()
@@ -0,0 +1,130 @@
+"""
+Per-camera stream processing
+State and capture loop of one camera, shared by the in-process thread mode
+and the worker processes
+"""
+
+import time
+
+from buffers import FramePool
+from ingest import MainStreamGrabber, StreamIngest
+from metrics import pipeline_metrics
+from ocr_scheduler import OcrScheduler
+from roi import DetectionRegion
+from sampling import AdaptiveSampler
+from tracker import PlateTracker
+
+
+class StreamState:
+    """Tracker, OCR scheduler, sampler, frame pool and region of one camera
+
+    With tracked=False every confident read is reported as it comes and
+    no tracker is kept. The sampler speeds up with motion or live tracks
+    and backs off while the inference queue lags. ingest_options are
+    StreamIngest defaults, overridden by the camera's own ingest config.
+    main is the MainStreamGrabber of a camera with a sub stream.
+    """
+
+    def __init__(self, camera, inference=None, tracked=True, ocr_reread_interval=5, frame_pool_size=16,
+                 ingest_options=None):
+        self.camera = camera
+        self.ingest_options = dict(ingest_options or {}, **camera.ingest)
+        self.ingest = None
+        self.main = None
+        self.tracker = PlateTracker() if tracked else None
+        self.scheduler = OcrScheduler(self.tracker, reread_interval=ocr_reread_interval,
+                                      require_crop_frame=bool(camera.sub_url)) if tracked else None
+        self.pool = FramePool(frame_pool_size)
+        self.region = DetectionRegion.from_config(camera.region) if camera.region else None
+
+        tracker = self.tracker
+        request_queue = inference.requests if inference else None
+        self.sampler = AdaptiveSampler(
+            active_tracks=(lambda: len(tracker.store.slots) > 0) if tracker else None,
+            queue_load=(lambda: len(request_queue) / request_queue.maxsize) if request_queue else None
+        )
+
+    def events(self, plates):
+        """What to report for one inference result: finished vehicles when tracked"""
+        return self.tracker.pop_events() if self.tracker else plates
+
+    def flush(self):
+        """Events of vehicles still in view, for shutdown"""
+        if not self.tracker:
+            return []
+        self.tracker.flush()
+        return self.tracker.pop_events()
+
+    def stats(self):
+        stats = {
+            'frame_pool': self.pool.stats(),
+            'sampling': self.sampler.stats()
+        }
+        if self.ingest:
+            stats['ingest'] = self.ingest.stats()
+        if self.main:
+            stats['main'] = self.main.stats()
+        if self.scheduler:
+            stats['ocr'] = self.scheduler.stats()
+        return stats
+
+
+def run_capture(state, inference, on_detections, is_running, counters, log, on_status=None):
+    """Capture stage: read a camera's frames and hand the sampled ones to inference
+
+    Runs until is_running() turns false, reconnecting whenever the stream
+    drops. Frames the sampler will not look at are only grabbed. A camera
+    with a sub_url is detected on its sub stream; its main stream is kept
+    open only while tracks still need reads (any activity when untracked),
+    and each submitted sub frame carries a request for the main frame shot
+    at the same time, converted only if one of its crops is read. Tracks
+    are never read from the sub stream: without a main frame they wait.
+    """
+    camera = state.camera
+    name = camera.camera_id.upper()
+    state.ingest = ingest = StreamIngest(
+        camera.sub_url or camera.url,
+        name=name,
+        log=log,
+        on_status=(lambda connected: on_status(camera.camera_id, connected)) if on_status else None,
+        **state.ingest_options
+    )
+    if camera.sub_url and inference:
+        state.main = main = MainStreamGrabber(camera.url, name, log=log, **state.ingest_options)
+        main.start()
+        if state.scheduler:
+            # Open the main stream as soon as a track needs reads, they wait for it
+            state.scheduler.on_wants_reads = main.wake
+    else:
+        main = None
+
+    while is_running():
+        started = time.monotonic()
+        ret, buffer = ingest.read(state.pool, is_running, decode=state.sampler.wants_frame())
+        if not ret:
+            if is_running():
+                counters.error()
+                pipeline_metrics.count('read_errors', camera.camera_id)
+            continue
+
+        counters.record()
+        read_at = time.monotonic()
+        # Includes waiting for the camera to deliver the frame
+        pipeline_metrics.observe('capture', read_at - started, camera.camera_id)
+        pipeline_metrics.count('frames', camera.camera_id)
+        # The sampler skips frames of static scenes and backs off while the
+        # inference queue lags; the queue itself drops stale frames
+        if inference and state.sampler.should_process(buffer.array if buffer else None):
+            crop_source = main.request(ingest.frame_time()) if main else None
+            # The inference service releases the buffers once it is done with them
+            inference.submit(camera.camera_id, buffer.array, on_detections, read_at,
+                             scheduler=state.scheduler, region=state.region, buffer=buffer,
+                             crop_source=crop_source)
+        elif buffer:
+            buffer.release()
+        if main and (state.scheduler.wants_reads if state.scheduler else state.sampler.active):
+            main.wake()
+
+    if main:
+        main.stop()
+    ingest.release()
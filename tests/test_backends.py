@@ -0,0 +1,120 @@
+import os
+
+import numpy as np
+import pytest
+
+from backends import OnnxDetector, OnnxRecognizer, STUB_LEVEL_STEP, STUB_PLATE_LEVEL, create_detector, \
+    create_recognizer, letterbox
+from benchmark import synthetic_frames
+from detector import LicensePlateDetector
+
+
+def plate_boxes(frame):
+    """(x, y, w, h, k) of the synthetic plates drawn into a frame"""
+    boxes = []
+    for k in range(3):
+        ys, xs = np.nonzero(frame[..., 0] == STUB_PLATE_LEVEL + STUB_LEVEL_STEP * k)
+        if len(xs):
+            boxes.append((xs.min(), ys.min(), xs.max() + 1 - xs.min(), ys.max() + 1 - ys.min(), k))
+    return boxes
+
+
+def test_stub_backends_read_synthetic_plates():
+    frames = synthetic_frames(6)
+    detector = LicensePlateDetector(detector_backend='stub', recognizer_backend='stub')
+    results = detector.detect_and_recognize_batch(frames)
+
+    for frame, plates in zip(frames, results):
+        expected = plate_boxes(frame)
+        assert len(plates) == len(expected)
+        for x, y, w, h, k in expected:
+            plate = next(plate for plate in plates if plate['text'] == f"STUB{k}")
+            # Letterboxing to 640 and back costs a few pixels at most
+            assert np.allclose(plate['bbox'], (x, y, w, h), atol=4)
+
+
+def test_onnx_postprocess_maps_boxes_back_to_the_frame():
+    detector = OnnxDetector.__new__(OnnxDetector)
+    detector.conf_threshold = 0.25
+    detector.iou_threshold = 0.7
+    frame = np.zeros((720, 1280, 3), dtype=np.uint8)
+    _, scale, pad = letterbox(frame, 640)
+
+    # Two overlapping candidates for one plate, a weak one to filter out and
+    # one past the left edge of the frame, which is clipped to it
+    expected = np.array([[400.0, 300.0, 560.0, 350.0], [0.0, 150.0, 30.0, 170.0]])
+    offset = (pad[0], pad[1], pad[0], pad[1])
+    x1, y1, x2, y2 = expected[0] * scale + offset
+    edge_x1, edge_y1, edge_x2, edge_y2 = np.array([-10.0, 150.0, 30.0, 170.0]) * scale + offset
+    candidates = [
+        ((x1 + x2) / 2, (y1 + y2) / 2, x2 - x1, y2 - y1, 0.9),
+        ((x1 + x2) / 2 + 1, (y1 + y2) / 2, x2 - x1, y2 - y1, 0.8),
+        (100.0, 100.0, 40.0, 10.0, 0.1),
+        ((edge_x1 + edge_x2) / 2, (edge_y1 + edge_y2) / 2, edge_x2 - edge_x1, edge_y2 - edge_y1, 0.7)
+    ]
+    output = np.array(candidates, dtype=np.float32).T
+
+    boxes = detector._postprocess(output, scale, pad, frame.shape)
+    assert boxes.shape == (2, 4)
+    assert np.allclose(boxes, expected, atol=1.0)
+
+
+def test_onnx_ctc_decoding_collapses_repeats_and_blanks():
+    recognizer = OnnxRecognizer.__new__(OnnxRecognizer)
+    recognizer.characters = ['', 'A', 'B', '1']
+    steps = [1, 1, 0, 1, 2, 2, 0, 3]
+    sequence = np.full((len(steps), 4), 0.01, dtype=np.float32)
+    sequence[np.arange(len(steps)), steps] = 0.9
+
+    text, confidence = recognizer._decode(sequence)
+    assert text == 'AAB1'
+    assert confidence == pytest.approx(0.9)
+
+
+def test_onnx_preprocess_matches_paddle_normalization():
+    recognizer = OnnxRecognizer.__new__(OnnxRecognizer)
+    recognizer.image_height = 48
+    recognizer.min_width = 320
+    crops = [np.full((24, 96, 3), 255, dtype=np.uint8), np.zeros((30, 60, 3), dtype=np.uint8)]
+
+    batch = recognizer.preprocess(crops)
+    assert batch.shape == (2, 3, 48, 320)
+    # Pixels map to [-1, 1], the right padding stays 0
+    assert np.allclose(batch[0, :, :, :192], 1.0)
+    assert np.allclose(batch[0, :, :, 192:], 0.0)
+    assert np.allclose(batch[1, :, :, :96], -1.0)
+
+
+def reference_models(*paths):
+    missing = [path for path in paths if not os.path.exists(path)]
+    if missing:
+        pytest.skip(f"model files not available: {', '.join(missing)}")
+
+
+def test_onnx_detector_matches_ultralytics():
+    pytest.importorskip('onnxruntime')
+    pytest.importorskip('ultralytics')
+    reference_models('license_plate_detector.pt', 'license_plate_detector.onnx')
+    frames = synthetic_frames(4)
+    reference = create_detector('ultralytics').detect(frames, 640)
+    candidate = create_detector('onnx').detect(frames, 640)
+
+    for expected, boxes in zip(reference, candidate):
+        assert len(boxes) == len(expected)
+        if len(expected):
+            order = np.lexsort(expected.T[::-1])
+            assert np.allclose(boxes[np.lexsort(boxes.T[::-1])], expected[order], atol=2.0)
+
+
+def test_onnx_recognizer_matches_paddle():
+    pytest.importorskip('onnxruntime')
+    pytest.importorskip('paddleocr')
+    reference_models('plate_recognizer.onnx', 'plate_recognizer_dict.txt')
+    rng = np.random.default_rng(0)
+    crops = [rng.integers(0, 255, (48, width, 3), dtype=np.uint8) for width in (120, 160, 240)]
+    reference = create_recognizer('paddle').recognize(crops)
+    candidate = create_recognizer('onnx').recognize(crops)
+
+    for (expected_text, expected_confidence), (text, confidence) in zip(reference, candidate):
+        assert text == expected_text
+        assert confidence == pytest.approx(expected_confidence, abs=0.02)
@@ -0,0 +1,64 @@
+import json
+import os
+import subprocess
+import sys
+import time
+
+import cv2
+import pytest
+
+from benchmark import synthetic_frames
+
+BATCH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'batch.py')
+
+
+@pytest.fixture(scope='module')
+def video(tmp_path_factory):
+    """Stub-readable plates crossing a 640x360 scene for 160 frames"""
+    path = str(tmp_path_factory.mktemp('videos') / 'plates.avi')
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), 25.0, (640, 360))
+    for frame in synthetic_frames(160, 640, 360):
+        writer.write(frame)
+    writer.release()
+    return path
+
+
+def batch_command(video, output):
+    return [sys.executable, BATCH, video, '--output', output, '--detector-backend', 'stub',
+            '--recognizer-backend', 'stub', '--imgsz', '320', '--decoders', '1', '--batch-size', '4',
+            '--checkpoint-interval', '0']
+
+
+def read_rows(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_killed_run_resumes_with_its_open_tracks(video, tmp_path):
+    expected_path = str(tmp_path / 'expected.jsonl')
+    subprocess.run(batch_command(video, expected_path), check=True, capture_output=True)
+    expected = read_rows(expected_path)
+    assert expected
+
+    output = str(tmp_path / 'resumed.jsonl')
+    progress_path = output + '.progress.json'
+    process = subprocess.Popen(batch_command(video, output), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    checkpoint = None
+    deadline = time.monotonic() + 60
+    try:
+        # Kill mid-video, at a checkpoint with vehicles in view
+        while time.monotonic() < deadline and process.poll() is None:
+            if os.path.exists(progress_path):
+                with open(progress_path) as f:
+                    checkpoint = json.load(f)
+                tracks = checkpoint['tracks'].get(video)
+                if checkpoint['sources'][video]['next_frame'] >= 40 and tracks and tracks['tracker']['store']['tracks']:
+                    break
+            time.sleep(0.005)
+    finally:
+        process.kill()
+        process.wait()
+    assert checkpoint is not None and not checkpoint['sources'][video]['done'], "finished before it was killed"
+
+    subprocess.run(batch_command(video, output), check=True, capture_output=True)
+    assert read_rows(output) == expected
@@ -0,0 +1,289 @@
+import collections
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from delivery import EventDelivery
+from spool import EventSpool
+
+
+class ApiServer:
+    """Local stand-in for the detections API on an ephemeral port
+
+    Answers each POST with the next status of statuses (200 once they run
+    out) and records the posted batches and when they arrived.
+    """
+
+    def __init__(self, statuses=()):
+        self.statuses = collections.deque(statuses)
+        self.batches = []
+        self.arrivals = []
+        self.lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                with server.lock:
+                    server.batches.append(body['events'])
+                    server.arrivals.append(time.monotonic())
+                    status = server.statuses.popleft() if server.statuses else 200
+                payload = json.dumps({'verdicts': {}}).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}/events"
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+    def events(self):
+        with self.lock:
+            return [event for batch in self.batches for event in batch]
+
+    def wait_for(self, count, timeout=5.0):
+        deadline = time.monotonic() + timeout
+        while len(self.events()) < count and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return self.events()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def server():
+    server = ApiServer()
+    yield server
+    server.close()
+
+
+def unused_url():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    return f"http://127.0.0.1:{port}/events"
+
+
+def events(count, start=0):
+    return [{'plate_number': f"AB{index:03d}", 'stream_type': 'in'} for index in range(start, start + count)]
+
+
+def delivery(url, **options):
+    options.setdefault('backoff_base', 0.01)
+    options.setdefault('backoff_max', 0.05)
+    options.setdefault('timeout', 2)
+    return EventDelivery(url, **options)
+
+
+def test_posts_one_batch_per_batch_size(server):
+    sender = delivery(server.url, batch_size=20, flush_interval=0.3)
+    for event in events(45):
+        sender.enqueue(event)
+    sender.start()
+    assert len(server.wait_for(45)) == 45
+    sender.stop()
+
+    assert [len(batch) for batch in server.batches] == [20, 20, 5]
+    assert server.events() == events(45)
+    assert sender.stats()['sent'] == 45
+
+
+def test_partial_batch_waits_for_flush_interval(server):
+    sender = delivery(server.url, batch_size=20, flush_interval=0.4)
+    sender.start()
+    started = time.monotonic()
+    for event in events(3):
+        sender.enqueue(event)
+    server.wait_for(3)
+    sender.stop()
+
+    assert [len(batch) for batch in server.batches] == [3]
+    assert 0.35 <= server.arrivals[0] - started < 1.0
+
+
+def test_retries_server_errors_with_backoff():
+    server = ApiServer(statuses=[503, 500])
+    results = []
+    sender = delivery(server.url, batch_size=5, flush_interval=0.05, max_retries=3,
+                      on_result=lambda batch, ok, detail: results.append((len(batch), ok)))
+    try:
+        sender.start()
+        for event in events(5):
+            sender.enqueue(event)
+        server.wait_for(15)
+        deadline = time.monotonic() + 5.0
+        while not results and time.monotonic() < deadline:
+            time.sleep(0.01)
+        sender.stop()
+    finally:
+        server.close()
+
+    assert len(server.batches) == 3
+    assert results == [(5, True)]
+    stats = sender.stats()
+    assert (stats['sent'], stats['failed'], stats['retries']) == (5, 0, 2)
+
+
+def test_retries_connection_errors_until_max_retries():
+    results = []
+    sender = delivery(unused_url(), batch_size=2, flush_interval=0.05, max_retries=2,
+                      on_result=lambda batch, ok, detail: results.append((len(batch), ok)))
+    sender.start()
+    for event in events(2):
+        sender.enqueue(event)
+    deadline = time.monotonic() + 5.0
+    while not results and time.monotonic() < deadline:
+        time.sleep(0.01)
+    sender.stop()
+
+    assert results == [(2, False)]
+    stats = sender.stats()
+    assert (stats['sent'], stats['failed'], stats['retries']) == (0, 2, 2)
+
+
+def test_client_errors_are_not_retried():
+    server = ApiServer(statuses=[400])
+    results = []
+    sender = delivery(server.url, batch_size=3, flush_interval=0.05, max_retries=3,
+                      on_result=lambda batch, ok, detail: results.append((len(batch), ok, detail)))
+    try:
+        sender.start()
+        for event in events(3):
+            sender.enqueue(event)
+        deadline = time.monotonic() + 5.0
+        while not results and time.monotonic() < deadline:
+            time.sleep(0.01)
+        time.sleep(0.2)
+        sender.stop()
+    finally:
+        server.close()
+
+    assert len(server.batches) == 1
+    assert results == [(3, False, 'status: 400')]
+    stats = sender.stats()
+    assert (stats['sent'], stats['failed'], stats['retries']) == (0, 3, 0)
+
+
+def test_counters_under_queue_overflow(server):
+    sender = delivery(server.url, batch_size=10, flush_interval=0.05, queue_size=5)
+    # Nothing is sent before start(), so the oldest events are dropped
+    for event in events(12):
+        sender.enqueue(event)
+    assert sender.stats() == {'queued': 12, 'sent': 0, 'failed': 0, 'retries': 0, 'dropped': 7, 'pending': 5}
+
+    sender.start()
+    server.wait_for(5)
+    sender.stop()
+
+    assert server.events() == events(5, start=7)
+    assert sender.stats() == {'queued': 12, 'sent': 5, 'failed': 0, 'retries': 0, 'dropped': 7, 'pending': 0}
+
+
+def test_spooled_events_are_replayed_after_restart(tmp_path):
+    path = str(tmp_path / 'spool.db')
+
+    # First run: the link is down, events stay in the spool
+    spool = EventSpool(path)
+    sender = delivery(unused_url(), batch_size=5, flush_interval=0.05, max_retries=0, spool=spool)
+    sender.start()
+    for event in events(8):
+        sender.enqueue(event)
+    time.sleep(0.3)
+    sender.stop()
+    assert sender.stats()['sent'] == 0
+    spool.close()
+
+    # Second run: the same spool is drained once the API answers
+    server = ApiServer()
+    spool = EventSpool(path)
+    try:
+        assert spool.pending() == 8
+        sender = delivery(server.url, batch_size=5, flush_interval=0.05, spool=spool)
+        sender.start()
+        server.wait_for(8)
+        deadline = time.monotonic() + 5.0
+        while spool.pending() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        sender.stop()
+        stats = sender.stats()
+    finally:
+        server.close()
+        spool.close()
+
+    assert server.events() == events(8)
+    assert (stats['sent'], stats['pending']) == (8, 0)
+
+
+def test_stop_during_backoff_keeps_spooled_batch_unreported(tmp_path):
+    server = ApiServer(statuses=[503] * 6)
+    spool = EventSpool(str(tmp_path / 'spool.db'))
+    results = []
+    sender = EventDelivery(server.url, batch_size=4, flush_interval=0.05, max_retries=5, backoff_base=10.0,
+                           spool=spool, on_result=lambda batch, ok, detail: results.append(ok))
+    try:
+        sender.start()
+        for event in events(4):
+            sender.enqueue(event)
+        server.wait_for(4)
+        # The first attempt failed, the worker is now waiting to retry
+        time.sleep(0.1)
+        sender.stop()
+        stats = sender.stats()
+    finally:
+        server.close()
+        spool.close()
+
+    assert results == []
+    assert (stats['failed'], stats['pending']) == (0, 4)
+
+
+OUTAGE_SCRIPT = '''
+import sys, time
+from delivery import EventDelivery
+from spool import EventSpool
+
+spool = EventSpool(sys.argv[1], fsync_interval=0.2)
+sender = EventDelivery(sys.argv[2], flush_interval=0.05, max_retries=20, backoff_base=0.5, backoff_max=5.0,
+                       timeout=1, spool=spool)
+sender.start()
+sender.enqueue({'plate_number': 'AB000', 'stream_type': 'in'})
+# The first batch is now being retried against the unreachable API
+time.sleep(0.5)
+for index in range(1, 4):
+    sender.enqueue({'plate_number': f'AB{index:03d}', 'stream_type': 'in'})
+time.sleep(1.0)
+print('appended', flush=True)
+time.sleep(60)
+'''
+
+
+def test_events_appended_during_an_outage_survive_a_kill(tmp_path):
+    path = str(tmp_path / 'spool.db')
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    process = subprocess.Popen([sys.executable, '-c', OUTAGE_SCRIPT, path, unused_url()], cwd=root,
+                               stdout=subprocess.PIPE, text=True)
+    try:
+        assert process.stdout.readline().strip() == 'appended'
+    finally:
+        process.kill()
+        process.wait()
+        process.stdout.close()
+
+    spool = EventSpool(path)
+    assert [event['plate_number'] for _, _, event in spool.read(10)] == ['AB000', 'AB001', 'AB002', 'AB003']
+    spool.close()
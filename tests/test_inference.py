@@ -0,0 +1,61 @@
+import threading
+
+import numpy as np
+
+from buffers import FramePool
+from inference import InferenceService
+from pipeline import BLOCK
+
+
+class BlockingDetector:
+    """Holds every batch until released, so requests pile up in the queue"""
+
+    def __init__(self):
+        self.entered = threading.Event()
+        self.proceed = threading.Event()
+
+    def detect_and_recognize_batch(self, frames, **kwargs):
+        self.entered.set()
+        self.proceed.wait(5.0)
+        return [[] for _ in frames]
+
+
+def pooled_frame(pool):
+    buffer = pool.acquire()
+    buffer.array = np.zeros((4, 4, 3), dtype=np.uint8)
+    return buffer
+
+
+def test_stop_releases_queued_buffers():
+    detector = BlockingDetector()
+    service = InferenceService(detector, max_batch_size=1, queue_size=8, queue_policy=BLOCK)
+    pool = FramePool(size=8)
+    service.start()
+    for _ in range(5):
+        buffer = pooled_frame(pool)
+        service.submit('in', buffer.array, lambda *args, **kwargs: None, buffer=buffer)
+    assert detector.entered.wait(2.0)
+
+    detector.proceed.set()
+    service.stop()
+    assert len(service.requests) == 0
+    assert len(pool.free) == 5
+
+
+def test_requests_of_a_stopped_session_are_not_called_back():
+    detector = BlockingDetector()
+    service = InferenceService(detector, max_batch_size=1)
+    pool = FramePool(size=8)
+    calls = []
+    service.start()
+    buffer = pooled_frame(pool)
+    service.submit('in', buffer.array, lambda *args, **kwargs: calls.append(args), buffer=buffer)
+    assert detector.entered.wait(2.0)
+
+    # The in-flight batch outlives stop() and finishes after a restart
+    service.stop(timeout=0.1)
+    service.start()
+    detector.proceed.set()
+    service.stop()
+    assert calls == []
+    assert len(pool.free) == 1
@@ -0,0 +1,211 @@
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+import pytest
+
+import ingest
+from buffers import FramePool
+from ingest import StreamIngest
+
+
+@pytest.fixture
+def video(tmp_path):
+    """Ten-frame local video file"""
+    path = str(tmp_path / 'gate.avi')
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), 25, (160, 120))
+    if not writer.isOpened():
+        pytest.skip("no video writer in this OpenCV build")
+    for index in range(10):
+        writer.write(np.full((120, 160, 3), index * 20, dtype=np.uint8))
+    writer.release()
+    return path
+
+
+def fast_ingest(url, **options):
+    options.setdefault('reconnect_delay', 0.01)
+    options.setdefault('max_reconnect_delay', 0.05)
+    return StreamIngest(url, transport=None, open_timeout=1.0, read_timeout=1.0, **options)
+
+
+def read_frames(stream, pool, count, timeout=10.0):
+    """Successful reads out of the first attempts until count frames or the deadline"""
+    frames = 0
+    deadline = time.monotonic() + timeout
+    while frames < count and time.monotonic() < deadline:
+        ret, buffer = stream.read(pool, lambda: time.monotonic() < deadline)
+        if ret:
+            frames += 1
+            buffer.release()
+    return frames
+
+
+def test_reconnects_at_end_of_file(video):
+    stream = fast_ingest(video)
+    pool = FramePool(4)
+
+    assert read_frames(stream, pool, 25) == 25
+    stats = stream.stats()
+    assert stats['reconnects'] >= 2
+    assert stats['frames'] == 25
+    stream.release()
+
+
+def test_reconnects_when_the_source_comes_back(video):
+    messages = []
+    statuses = []
+    stream = fast_ingest(video, log=messages.append, on_status=statuses.append)
+    pool = FramePool(4)
+    assert read_frames(stream, pool, 10) == 10
+
+    # The source disappears: the read at its end fails and reopening fails
+    # until it is back
+    os.rename(video, video + '.gone')
+    restore = threading.Timer(0.5, os.rename, args=(video + '.gone', video))
+    restore.start()
+    started = time.monotonic()
+    assert read_frames(stream, pool, 1) == 1
+    restore.join()
+
+    assert time.monotonic() - started >= 0.5
+    assert any(message.startswith('Failed to open') for message in messages)
+    assert stream.stats()['reconnects'] >= 1
+    assert statuses[-1] is True and False in statuses
+    stream.release()
+
+
+class FrozenCapture:
+    """Capture that keeps returning frames whose timestamp stops advancing"""
+
+    opened = 0
+
+    def __init__(self, *args):
+        FrozenCapture.opened += 1
+        self.position = 0.0
+
+    def isOpened(self):
+        return True
+
+    def set(self, prop, value):
+        return True
+
+    def read(self, image=None):
+        self.position = min(self.position + 40.0, 120.0)
+        return True, np.zeros((8, 8, 3), dtype=np.uint8) if image is None else image
+
+    def grab(self):
+        return self.read()[0]
+
+    def get(self, prop):
+        return self.position
+
+    def release(self):
+        pass
+
+
+def test_reconnects_after_a_stall(monkeypatch):
+    monkeypatch.setattr(ingest.cv2, 'VideoCapture', FrozenCapture)
+    FrozenCapture.opened = 0
+    stream = fast_ingest('rtsp://camera/stream', stall_timeout=0.1)
+    pool = FramePool(4)
+
+    deadline = time.monotonic() + 5.0
+    while stream.stats()['stalls'] < 2 and time.monotonic() < deadline:
+        ret, buffer = stream.read(pool, lambda: True)
+        if buffer:
+            buffer.release()
+        time.sleep(0.01)
+
+    stats = stream.stats()
+    assert stats['stalls'] >= 2
+    assert stats['reconnects'] >= 1
+    assert FrozenCapture.opened >= 2
+    assert stats['last_error'].startswith('stalled')
+    stream.release()
+
+
+class PacedCapture:
+    """Live camera stand-in: a frame every 40 ms whose pixels hold its number"""
+
+    def __init__(self, *args):
+        self.started = time.monotonic()
+        self.index = -1
+        self.retrieved = []
+
+    def isOpened(self):
+        return True
+
+    def set(self, prop, value):
+        return True
+
+    def grab(self):
+        self.index += 1
+        time.sleep(max(0.0, self.started + self.index * 0.04 - time.monotonic()))
+        return True
+
+    def retrieve(self, image=None):
+        self.retrieved.append(self.index)
+        return True, np.full((4, 4, 3), self.index % 256, dtype=np.uint8)
+
+    def read(self, image=None):
+        self.grab()
+        return self.retrieve(image)
+
+    def get(self, prop):
+        return self.index * 40.0
+
+    def release(self):
+        pass
+
+
+@pytest.fixture
+def grabber(monkeypatch):
+    monkeypatch.setattr(ingest.cv2, 'VideoCapture', PacedCapture)
+    grabber = ingest.MainStreamGrabber('rtsp://camera/main', transport=None, reconnect_delay=0.01)
+    grabber.start()
+    grabber.wake()
+    deadline = time.monotonic() + 5.0
+    while grabber.ingest.frame_count < 5 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    yield grabber
+    grabber.stop()
+
+
+def frame_number(grabber, frame_time):
+    """Number of the frame shot at frame_time, by the grabber's timestamp offset"""
+    return round((frame_time - min(grabber.ingest.arrival_offsets)) / 0.04)
+
+
+def test_main_frame_is_paired_by_timestamp(grabber):
+    wanted = time.monotonic() + 0.1
+    request = grabber.request(wanted)
+    frame = request()
+    expected = frame_number(grabber, wanted)
+    request.release()
+
+    assert frame is not None
+    assert abs(int(frame[0, 0, 0]) - expected % 256) <= 1
+    assert abs(request.skew) <= grabber.max_skew
+    assert grabber.stats()['retrieved'] == 1
+
+
+def test_main_frame_too_far_from_the_sub_frame_is_refused(grabber):
+    request = grabber.request(time.monotonic() - 1.0)
+    assert request() is None
+    request.release()
+    assert grabber.stats()['missed'] == 1
+
+
+def test_main_frame_is_only_converted_when_read(grabber):
+    capture = grabber.ingest.cap
+    requests = [grabber.request(time.monotonic() + 0.04 * index) for index in range(3)]
+    for request in requests:
+        request.release()
+    time.sleep(0.2)
+
+    assert capture.retrieved == []
+    assert grabber.stats()['pending'] == 0
+    # Grabbing went on past the released requests
+    assert capture.index >= frame_number(grabber, requests[-1].time)
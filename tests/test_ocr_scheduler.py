@@ -0,0 +1,135 @@
+import numpy as np
+
+from ocr_scheduler import CropQualityGate, OcrScheduler
+from tracker import PlateTracker
+
+
+def plate_frame(width=320, height=180, box=(100, 80, 60, 20), level=200):
+    """Dark frame with one bright striped plate, and the plate's box"""
+    frame = np.zeros((height, width, 3), dtype=np.uint8)
+    x, y, w, h = box
+    frame[y:y + h, x:x + w] = level
+    frame[y + 5:y + h - 5, x + 5:x + w - 5:6] = 20
+    return frame, box
+
+
+class MainFrame:
+    """Lazy crop source that counts how often it is resolved"""
+
+    def __init__(self, frame):
+        self.frame = frame
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.frame
+
+
+def test_main_frame_is_only_fetched_for_picked_crops():
+    tracker = PlateTracker()
+    scheduler = OcrScheduler(tracker, reread_interval=100)
+    frame, box = plate_frame()
+    main = np.repeat(np.repeat(frame, 3, axis=0), 3, axis=1)
+
+    # A new track is read straight away, from the main frame
+    source = MainFrame(main)
+    track_ids = tracker.update_boxes([box], 0.0)
+    selected = scheduler.select(frame, [box], track_ids, source, CropQualityGate())
+    assert source.calls == 1
+    assert selected[0][2].shape[:2] == (box[3] * 3, box[2] * 3)
+    assert scheduler.wants_reads
+
+    # Once its text is final the main frame is not touched any more
+    for _ in range(3):
+        tracker.add_reading(track_ids[0], 'AB123CD', 0.95)
+    assert not tracker.needs_ocr(track_ids[0])
+    for index in range(3):
+        source = MainFrame(main)
+        track_ids = tracker.update_boxes([box], index + 1.0)
+        assert scheduler.select(frame, [box], track_ids, source, CropQualityGate()) == []
+        assert source.calls == 0
+    assert not scheduler.wants_reads
+
+
+def read_frames(scheduler, tracker, quality, levels, confidence):
+    """Select on one frame per plate level, reading each picked crop at confidence"""
+    reads = 0
+    for index, level in enumerate(levels):
+        frame, box = plate_frame(level=level)
+        track_ids = tracker.update_boxes([box], float(index))
+        for track_id, _, _ in scheduler.select(frame, [box], track_ids, quality=quality):
+            tracker.add_reading(track_id, 'AB123CD', confidence)
+            reads += 1
+    return reads
+
+
+def test_low_confidence_track_is_read_past_top_k_on_sharper_crops():
+    tracker = PlateTracker()
+    scheduler = OcrScheduler(tracker, reread_interval=1)
+    quality = CropQualityGate(top_k=3)
+
+    # Three reads at 0.5 leave the margin at 1.5, short of finalize_margin
+    reads = read_frames(scheduler, tracker, quality, range(100, 260, 20), 0.5)
+    assert reads > 3
+    assert not tracker.needs_ocr(0)
+    assert [event['reason'] for event in tracker.pop_events()] == ['converged']
+
+
+def test_top_k_rejects_crops_no_sharper_than_the_reads():
+    tracker = PlateTracker()
+    scheduler = OcrScheduler(tracker, reread_interval=1)
+    quality = CropQualityGate(top_k=3)
+
+    assert read_frames(scheduler, tracker, quality, [200] * 8, 0.5) == 3
+    assert tracker.needs_ocr(0)
+    assert quality.rejected['top_k'] == 5
+
+
+def test_sub_stream_track_waits_while_the_main_stream_is_closed():
+    tracker = PlateTracker()
+    woken = []
+    scheduler = OcrScheduler(tracker, require_crop_frame=True, on_wants_reads=lambda: woken.append(True))
+    frame, box = plate_frame()
+    main = np.repeat(np.repeat(frame, 3, axis=0), 3, axis=1)
+
+    # No main frame: nothing is read from the sub stream, the main stream is woken
+    for index in range(3):
+        track_ids = tracker.update_boxes([box], float(index))
+        assert scheduler.select(frame, [box], track_ids, None, CropQualityGate()) == []
+    assert woken and scheduler.wants_reads
+    assert tracker.needs_ocr(track_ids[0]) and track_ids[0] not in scheduler.states
+
+    # The first main frame gets the first read
+    track_ids = tracker.update_boxes([box], 3.0)
+    selected = scheduler.select(frame, [box], track_ids, MainFrame(main), CropQualityGate())
+    assert selected[0][2].shape[:2] == (box[3] * 3, box[2] * 3)
+
+
+def test_refused_main_frame_request_reads_nothing():
+    tracker = PlateTracker()
+    scheduler = OcrScheduler(tracker, require_crop_frame=True)
+    frame, box = plate_frame()
+
+    # A request refused for skew or hold_timeout resolves to None
+    for index in range(3):
+        track_ids = tracker.update_boxes([box], float(index))
+        assert scheduler.select(frame, [box], track_ids, lambda: None) == []
+    assert track_ids[0] not in scheduler.states
+    assert tracker.needs_ocr(track_ids[0])
+    assert scheduler.stats()['unpaired'] == 3
+
+
+def test_restore_from_a_state_without_read_sharpnesses():
+    tracker = PlateTracker()
+    scheduler = OcrScheduler(tracker, reread_interval=1)
+    quality = CropQualityGate(top_k=3)
+    read_frames(scheduler, tracker, quality, [200] * 4, 0.2)
+
+    # Checkpoints written before read_sharpnesses was saved
+    state = scheduler.state()
+    for entry in state['states'].values():
+        del entry['read_sharpnesses']
+    resumed = OcrScheduler(PlateTracker(), reread_interval=1)
+    resumed.restore(state)
+    # top_k more reads rebuild the lost sharpnesses, then the cap applies again
+    assert read_frames(resumed, resumed.tracker, quality, [200] * 5, 0.2) == 3
@@ -0,0 +1,31 @@
+import os
+import threading
+
+from sessions import SessionCorrelator
+
+
+def test_concurrent_snapshots_leave_one_complete_file(tmp_path):
+    sessions = SessionCorrelator()
+    for index in range(200):
+        sessions.observe('in', f"AB{index:03d}CD", 'in', timestamp=1000.0 + index)
+    path = str(tmp_path / 'sessions.json')
+
+    errors = []
+
+    def save():
+        try:
+            for _ in range(20):
+                sessions.snapshot(path)
+        except OSError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=save) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert os.listdir(tmp_path) == ['sessions.json']
+    restored = SessionCorrelator(max_dwell=float('inf'))
+    assert restored.restore(path) == 200
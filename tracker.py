@@ -0,0 +1,458 @@
+"""
+License plate tracking across frames
+Associates per-frame detections with persistent track IDs, keeps a text
+history per track and emits one event per vehicle
+"""
+
+import numpy as np
+
+# Cost assigned to pairs that fail the distance/IoU gate
+GATED = 1e9
+
+# Characters that take part in per-position text voting
+PLATE_ALPHABET = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+_ALPHABET_CHARS = np.array(list(PLATE_ALPHABET))
+_CHAR_INDEX = np.full(256, -1, dtype=np.int64)
+for _index, _char in enumerate(PLATE_ALPHABET):
+    _CHAR_INDEX[ord(_char)] = _index
+    _CHAR_INDEX[ord(_char.lower())] = _index
+
+
+def normalize_plate(text):
+    """Uppercase alphanumerics of an OCR read, separators and noise dropped"""
+    return ''.join(_ALPHABET_CHARS[plate_char_indices(text)])
+
+
+def plate_char_indices(text):
+    """PLATE_ALPHABET index of every plate character in text"""
+    indices = _CHAR_INDEX[np.frombuffer(text.encode('ascii', 'ignore'), dtype=np.uint8)]
+    return indices[indices >= 0]
+
+
+def centroid_distances(centroids1, centroids2):
+    """Pairwise Euclidean distances between two (N, 2) centroid arrays"""
+    a = np.asarray(centroids1, dtype=np.float64).reshape(-1, 2)
+    b = np.asarray(centroids2, dtype=np.float64).reshape(-1, 2)
+    diff = a[:, None, :] - b[None, :, :]
+    return np.sqrt((diff * diff).sum(axis=2))
+
+
+def iou_matrix(rects1, rects2):
+    """Pairwise IoU between two (N, 4) arrays of (x, y, w, h) boxes"""
+    a = np.asarray(rects1, dtype=np.float64).reshape(-1, 4)
+    b = np.asarray(rects2, dtype=np.float64).reshape(-1, 4)
+    ax2 = a[:, 0] + a[:, 2]
+    ay2 = a[:, 1] + a[:, 3]
+    bx2 = b[:, 0] + b[:, 2]
+    by2 = b[:, 1] + b[:, 3]
+    w = np.minimum(ax2[:, None], bx2[None, :]) - np.maximum(a[:, 0][:, None], b[:, 0][None, :])
+    h = np.minimum(ay2[:, None], by2[None, :]) - np.maximum(a[:, 1][:, None], b[:, 1][None, :])
+    inter = np.clip(w, 0, None) * np.clip(h, 0, None)
+    union = (a[:, 2] * a[:, 3])[:, None] + (b[:, 2] * b[:, 3])[None, :] - inter
+    return np.where(union > 0, inter / np.maximum(union, 1e-9), 0.0)
+
+
+def greedy_assignment(costs):
+    """Match each row to its cheapest free column, cheapest rows first"""
+    rows = costs.min(axis=1).argsort()
+    cols = costs.argmin(axis=1)[rows]
+    used_cols = np.zeros(costs.shape[1], dtype=bool)
+    matches = []
+    for row, col in zip(rows, cols):
+        if used_cols[col]:
+            continue
+        used_cols[col] = True
+        matches.append((int(row), int(col)))
+    return matches
+
+
+def optimal_assignment(costs):
+    """Minimum-cost row/column matching (Hungarian method, O(n^2 m))
+
+    Equivalent to scipy.optimize.linear_sum_assignment for rectangular
+    matrices, without requiring SciPy at runtime. Returns (row, col) pairs.
+    """
+    costs = np.asarray(costs, dtype=np.float64)
+    transposed = costs.shape[0] > costs.shape[1]
+    if transposed:
+        costs = costs.T
+    n, m = costs.shape
+    if n == 0:
+        return []
+
+    # Shortest augmenting path with row/column potentials; index 0 is a sentinel
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    owner = np.zeros(m + 1, dtype=np.int64)
+    way = np.zeros(m + 1, dtype=np.int64)
+    for row in range(1, n + 1):
+        owner[0] = row
+        col0 = 0
+        min_slack = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+        while True:
+            used[col0] = True
+            row0 = owner[col0]
+            free = ~used[1:]
+            slack = costs[row0 - 1] - u[row0] - v[1:]
+            improved = free & (slack < min_slack[1:])
+            min_slack[1:][improved] = slack[improved]
+            way[1:][improved] = col0
+            candidates = np.where(free, min_slack[1:], np.inf)
+            col1 = int(candidates.argmin()) + 1
+            delta = candidates[col1 - 1]
+            u[owner[used]] += delta
+            v[used] -= delta
+            min_slack[1:][free] -= delta
+            col0 = col1
+            if owner[col0] == 0:
+                break
+        while col0:
+            col1 = way[col0]
+            owner[col0] = owner[col1]
+            col0 = col1
+
+    matches = [(int(owner[col]) - 1, col - 1) for col in range(1, m + 1) if owner[col]]
+    if transposed:
+        matches = [(col, row) for row, col in matches]
+    return sorted(matches)
+
+
+class TrackSnapshot:
+    """Read-only views over a TrackStore, valid until the next update
+
+    Rows are store slots; only rows where active is True hold a track.
+    """
+
+    __slots__ = ('active', 'ids', 'centroids', 'bboxes', 'missed', 'stable_text')
+
+    def __init__(self, store):
+        for name in self.__slots__:
+            view = getattr(store, name).view()
+            view.flags.writeable = False
+            setattr(self, name, view)
+
+    def __len__(self):
+        return int(self.active.sum())
+
+    def items(self):
+        """(track_id, centroid) pairs of the active tracks"""
+        for slot in np.flatnonzero(self.active):
+            yield int(self.ids[slot]), self.centroids[slot]
+
+
+class TrackStore:
+    """Preallocated struct-of-arrays storage for track state
+
+    Slots are handed out from a free list and returned on release, so a
+    long session reuses the same arrays; they only grow (by doubling)
+    when more tracks are alive at once than ever before. Each slot keeps
+    its last history_size texts in a fixed-width ring, plus confidence
+    weighted votes per character position and per text length.
+    """
+
+    TEXT_DTYPE = 'U16'
+
+    # name, per-slot shape, dtype, fill value of a free slot
+    FIELDS = (
+        ('active', (), bool, False),
+        ('ids', (), np.int64, -1),
+        ('centroids', (2,), np.int64, 0),
+        ('bboxes', (4,), np.float64, 0.0),
+        ('age', (), np.int64, 0),
+        ('missed', (), np.int64, 0),
+        ('first_seen', (), np.float64, np.nan),
+        ('last_seen', (), np.float64, np.nan),
+        ('best_confidence', (), np.float64, 0.0),
+        ('emitted', (), bool, False),
+        ('stable_text', (), TEXT_DTYPE, ''),
+        ('history', ('history_size',), TEXT_DTYPE, ''),
+        ('history_len', (), np.int64, 0),
+        ('history_pos', (), np.int64, 0),
+        ('votes', ('max_text_length', 'alphabet_size'), np.float32, 0.0),
+        ('length_votes', ('length_slots',), np.float32, 0.0),
+        ('finalized', (), bool, False)
+    )
+
+    def __init__(self, capacity=32, history_size=5, max_text_length=12):
+        self.capacity = 0
+        self.history_size = history_size
+        self.max_text_length = max_text_length
+        self.length_slots = max_text_length + 1
+        self.alphabet_size = len(PLATE_ALPHABET)
+        self.free = []
+        self.slots = {}
+        self._allocate_arrays(capacity)
+
+    def _allocate_arrays(self, capacity):
+        old = self.capacity
+        for name, shape, dtype, fill in self.FIELDS:
+            shape = tuple(getattr(self, dim) if isinstance(dim, str) else dim for dim in shape)
+            array = np.full((capacity,) + shape, fill, dtype=dtype)
+            if old:
+                array[:old] = getattr(self, name)
+            setattr(self, name, array)
+        # Lower slots are popped first
+        self.free.extend(range(capacity - 1, old - 1, -1))
+        self.capacity = capacity
+
+    def allocate(self, track_id):
+        if not self.free:
+            self._allocate_arrays(self.capacity * 2)
+        slot = self.free.pop()
+        self.slots[track_id] = slot
+        self.active[slot] = True
+        self.ids[slot] = track_id
+        self.age[slot] = 0
+        self.missed[slot] = 0
+        self.best_confidence[slot] = 0.0
+        self.emitted[slot] = False
+        self.stable_text[slot] = ''
+        self.history_len[slot] = 0
+        self.history_pos[slot] = 0
+        self.votes[slot] = 0.0
+        self.length_votes[slot] = 0.0
+        self.finalized[slot] = False
+        return slot
+
+    def release(self, slot):
+        del self.slots[int(self.ids[slot])]
+        self.active[slot] = False
+        self.ids[slot] = -1
+        self.free.append(slot)
+
+    def push_text(self, slot, text):
+        self.history[slot, self.history_pos[slot]] = text
+        self.history_pos[slot] = (self.history_pos[slot] + 1) % self.history_size
+        self.history_len[slot] = min(self.history_len[slot] + 1, self.history_size)
+
+    def texts(self, slot):
+        """History of a slot, oldest first"""
+        length = self.history_len[slot]
+        if length < self.history_size:
+            return list(self.history[slot, :length])
+        pos = self.history_pos[slot]
+        return list(self.history[slot, pos:]) + list(self.history[slot, :pos])
+
+    def active_slots(self):
+        return np.flatnonzero(self.active)
+
+    def state(self):
+        """The live slots and free list as plain JSON types"""
+        tracks = []
+        for slot in self.active_slots():
+            track = {name: getattr(self, name)[slot].tolist() for name, _, _, _ in self.FIELDS}
+            track['slot'] = int(slot)
+            tracks.append(track)
+        return {'capacity': self.capacity, 'free': list(self.free), 'tracks': tracks}
+
+    def restore(self, state):
+        """Put back the slots of a state(), each at the same position"""
+        if state['capacity'] > self.capacity:
+            self._allocate_arrays(state['capacity'])
+        for name, _, _, fill in self.FIELDS:
+            getattr(self, name)[:] = fill
+        self.slots = {}
+        for track in state['tracks']:
+            slot = track['slot']
+            for name, _, _, _ in self.FIELDS:
+                getattr(self, name)[slot] = track[name]
+            self.slots[track['ids']] = slot
+        self.free = list(state['free'])
+
+
+class PlateTracker:
+    """Centroid/IoU tracker for plate boxes with per-track text consensus
+
+    matching is 'greedy' (cheapest pairs first) or 'optimal' (globally
+    minimum total cost); cost is 'centroid' (pixel distance, gated by
+    max_distance) or 'iou' (1 - IoU, gated by min_iou). Track state lives
+    in a TrackStore and update() returns a read-only TrackSnapshot.
+
+    Each OCR read votes for its length and for every character at its
+    position, weighted by confidence. A track is finalized once it has
+    min_reads reads and every position (and the length) leads its runner
+    up by finalize_margin; its text is then fixed and needs_ocr() is False.
+    """
+
+    def __init__(self, max_disappeared=30, max_distance=50, finalize_margin=2.0, min_reads=2,
+                 matching='greedy', cost='centroid', min_iou=0.1, capacity=32):
+        if matching not in ('greedy', 'optimal'):
+            raise ValueError(f"Unknown matching: {matching}")
+        if cost not in ('centroid', 'iou'):
+            raise ValueError(f"Unknown cost: {cost}")
+        self.next_object_id = 0
+        self.store = TrackStore(capacity)
+        self.max_disappeared = max_disappeared
+        self.max_distance = max_distance
+        self.finalize_margin = finalize_margin
+        self.min_reads = min_reads
+        self.matching = matching
+        self.cost = cost
+        self.min_iou = min_iou
+        self.events = []
+
+    @property
+    def objects(self):
+        """Track ID to centroid mapping of the live tracks"""
+        return dict(self.snapshot().items())
+
+    def snapshot(self):
+        return TrackSnapshot(self.store)
+
+    def register(self, rect, timestamp=None):
+        store = self.store
+        slot = store.allocate(self.next_object_id)
+        store.bboxes[slot] = rect
+        store.centroids[slot] = self._get_centroid(rect)
+        store.first_seen[slot] = store.last_seen[slot] = np.nan if timestamp is None else timestamp
+        self.next_object_id += 1
+        return slot
+
+    def deregister(self, object_id):
+        slot = self.store.slots[object_id]
+        # A vehicle that left before its text was finalized is still reported once
+        if not self.store.emitted[slot] and self.store.stable_text[slot]:
+            self._emit(slot, 'lost')
+        self.store.release(slot)
+
+    def flush(self):
+        """Deregister every track, emitting events for unreported vehicles"""
+        for slot in self.store.active_slots():
+            self.deregister(int(self.store.ids[slot]))
+
+    def pop_events(self):
+        """Return and clear the vehicle events emitted since the last call"""
+        events = self.events
+        self.events = []
+        return events
+
+    def state(self):
+        """The live tracks as plain JSON types, events not yet popped excluded"""
+        return {'next_object_id': self.next_object_id, 'store': self.store.state()}
+
+    def restore(self, state):
+        """Continue the tracks of a state() as if they had never stopped"""
+        self.next_object_id = state['next_object_id']
+        self.store.restore(state['store'])
+
+    def needs_ocr(self, object_id):
+        """Whether reading this track again can still change its text"""
+        return not self.store.finalized[self.store.slots[object_id]]
+
+    def stable_text(self, object_id):
+        return str(self.store.stable_text[self.store.slots[object_id]])
+
+    def update(self, rects, texts, confidences=None, timestamp=None):
+        """Associate detections with tracks and record their OCR reads"""
+        if confidences is None:
+            confidences = [0.0] * len(texts)
+        track_ids = self.update_boxes(rects, timestamp)
+        for col, object_id in enumerate(track_ids):
+            if col < len(texts) and texts[col]:
+                self.add_reading(object_id, texts[col], confidences[col] if col < len(confidences) else 0.0)
+        return self.snapshot()
+
+    def update_boxes(self, rects, timestamp=None):
+        """Associate detections with tracks, returns the track ID of each rect"""
+        store = self.store
+        if timestamp is None:
+            timestamp = np.nan
+
+        slots = store.active_slots()
+        store.age[slots] += 1
+        if len(rects) == 0:
+            self._mark_missed(slots)
+            return []
+
+        input_rects = np.asarray(rects, dtype=np.float64).reshape(-1, 4)
+        input_centroids = (input_rects[:, :2] + input_rects[:, 2:] // 2).astype(np.int64)
+
+        matches = self._match(slots, input_rects, input_centroids) if len(slots) else []
+
+        track_ids = [None] * len(input_rects)
+        matched_rows = np.zeros(len(slots), dtype=bool)
+        for row, col in matches:
+            slot = slots[row]
+            store.centroids[slot] = input_centroids[col]
+            store.bboxes[slot] = input_rects[col]
+            store.missed[slot] = 0
+            store.last_seen[slot] = timestamp
+            track_ids[col] = int(store.ids[slot])
+            matched_rows[row] = True
+
+        self._mark_missed(slots[~matched_rows])
+        for col, object_id in enumerate(track_ids):
+            if object_id is None:
+                slot = self.register(input_rects[col], timestamp)
+                track_ids[col] = int(store.ids[slot])
+
+        return track_ids
+
+    def add_reading(self, object_id, text, confidence):
+        """Vote an OCR read into a track's text consensus"""
+        store = self.store
+        slot = store.slots[object_id]
+        if store.finalized[slot]:
+            return
+        indices = plate_char_indices(text)[:store.max_text_length]
+        if not len(indices):
+            return
+
+        store.push_text(slot, text)
+        store.best_confidence[slot] = max(store.best_confidence[slot], confidence)
+        weight = max(float(confidence), 1e-3)
+        store.votes[slot, np.arange(len(indices)), indices] += weight
+        store.length_votes[slot, len(indices)] += weight
+
+        length = int(store.length_votes[slot].argmax())
+        votes = store.votes[slot, :length]
+        store.stable_text[slot] = ''.join(_ALPHABET_CHARS[votes.argmax(axis=1)])
+
+        if store.history_len[slot] >= self.min_reads:
+            top_two = np.partition(votes, -2, axis=1)[:, -2:]
+            length_top_two = np.partition(store.length_votes[slot], -2)[-2:]
+            margin = min((top_two[:, 1] - top_two[:, 0]).min(), length_top_two[1] - length_top_two[0])
+            if margin >= self.finalize_margin:
+                store.finalized[slot] = True
+                self._emit(slot, 'converged')
+
+    def _get_centroid(self, rect):
+        x, y, w, h = rect
+        return (int(x + w // 2), int(y + h // 2))
+
+    def _match(self, slots, input_rects, input_centroids):
+        """(track row, detection column) pairs that pass the gate"""
+        if self.cost == 'iou':
+            ious = iou_matrix(self.store.bboxes[slots], input_rects)
+            costs = np.where(ious >= self.min_iou, 1.0 - ious, GATED)
+        else:
+            distances = centroid_distances(self.store.centroids[slots], input_centroids)
+            costs = np.where(distances <= self.max_distance, distances, GATED)
+
+        if self.matching == 'optimal':
+            matches = optimal_assignment(costs)
+        else:
+            matches = greedy_assignment(costs)
+        return [(row, col) for row, col in matches if costs[row, col] < GATED]
+
+    def _mark_missed(self, slots):
+        store = self.store
+        store.missed[slots] += 1
+        for slot in slots[store.missed[slots] > self.max_disappeared]:
+            self.deregister(int(store.ids[slot]))
+
+    def _emit(self, slot, reason):
+        store = self.store
+        store.emitted[slot] = True
+        self.events.append({
+            'track_id': int(store.ids[slot]),
+            'text': str(store.stable_text[slot]),
+            'confidence': float(store.best_confidence[slot]),
+            'first_seen': self._timestamp(store.first_seen[slot]),
+            'last_seen': self._timestamp(store.last_seen[slot]),
+            'reason': reason
+        })
+
+    def _timestamp(self, value):
+        return None if np.isnan(value) else float(value)
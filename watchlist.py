@@ -0,0 +1,240 @@
+"""
+Local plate watchlist
+Allow/deny plate index with exact and OCR-tolerant lookup, and a cache of
+recent API verdicts, so known plates are decided without a round trip
+"""
+
+import collections
+import csv
+import threading
+import time
+
+import numpy as np
+
+from tracker import normalize_plate
+
+ALLOW = 'allow'
+DENY = 'deny'
+LISTS = (ALLOW, DENY)
+
+# Characters OCR commonly reads for one another, folded onto one of them
+# before comparing, so a confusion alone does not count as an edit
+CONFUSIONS = {'O': '0', 'Q': '0', 'D': '0', 'I': '1', 'Z': '2', 'S': '5', 'G': '6', 'B': '8'}
+_FOLD = str.maketrans(CONFUSIONS)
+
+# kind is 'exact', 'confusion' (equal once CONFUSIONS are folded) or
+# 'fuzzy' (one insertion, deletion or substitution after folding)
+WatchlistMatch = collections.namedtuple('WatchlistMatch', ['plate', 'list', 'info', 'kind'])
+
+
+def fold_plate(plate):
+    """A normalized plate with confusable characters folded"""
+    return plate.translate(_FOLD)
+
+
+def within_one_edit(a, b):
+    """Whether a and b differ by at most one insertion, deletion or substitution"""
+    if len(a) > len(b):
+        a, b = b, a
+    if len(b) - len(a) > 1:
+        return False
+    prefix = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        prefix += 1
+    if len(a) == len(b):
+        return a[prefix + 1:] == b[prefix + 1:]
+    return a[prefix:] == b[prefix + 1:]
+
+
+def deletion_variants(key):
+    """key and every string one deletion away from it"""
+    variants = {key}
+    variants.update(key[:i] + key[i + 1:] for i in range(len(key)))
+    return variants
+
+
+class PlateIndex:
+    """Allow and deny lists of normalized plates
+
+    Exact and confusion matches are dictionary lookups. Fuzzy lookup
+    uses a deletion index: every folded plate and each of its
+    single-character deletions is hashed into one sorted int64 array, so
+    the candidates for a read are found with one searchsorted over the
+    hashes of the read and its deletions and then checked with
+    within_one_edit. Plates shorter than min_fuzzy_length are only
+    matched exactly or by confusion. When a read matches plates on both
+    lists equally well, the deny entry wins.
+
+    The deletion index is rebuilt on the first fuzzy lookup after add();
+    call build() after loading to take that cost up front.
+    """
+
+    def __init__(self, min_fuzzy_length=5):
+        self.min_fuzzy_length = min_fuzzy_length
+        self.entries = {}
+        self.by_folded = {}
+        self.lock = threading.Lock()
+        # (folded plates, sorted variant hashes, folded plate id per hash)
+        self.fuzzy = ([], np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64))
+        self.built = True
+
+    @classmethod
+    def load(cls, path, default_list=None, **kwargs):
+        """Index from a file
+
+        A .csv file needs a header with a plate column and, unless
+        default_list is given, a list column of allow or deny; other
+        columns are kept as the entry's info. Any other file has one plate
+        per line, all on default_list.
+        """
+        index = cls(**kwargs)
+        with open(path, newline='', encoding='utf-8') as f:
+            if path.lower().endswith('.csv'):
+                for row in csv.DictReader(f):
+                    plate = row.pop('plate', None)
+                    list_name = row.pop('list', None) or default_list
+                    if plate:
+                        index.add(plate, list_name, **{key: value for key, value in row.items() if key})
+            else:
+                if default_list is None:
+                    raise ValueError(f"{path}: plain plate lists need a default_list")
+                for line in f:
+                    if line.strip():
+                        index.add(line.strip(), default_list)
+        index.build()
+        return index
+
+    def add(self, plate, list_name, **info):
+        """Add or replace a plate; returns False for reads without plate characters"""
+        if list_name not in LISTS:
+            raise ValueError(f"Unknown watchlist {list_name!r}, expected one of {', '.join(LISTS)}")
+        key = normalize_plate(plate)
+        if not key:
+            return False
+        with self.lock:
+            if key not in self.entries:
+                self.by_folded.setdefault(fold_plate(key), []).append(key)
+            self.entries[key] = (list_name, info)
+            self.built = False
+        return True
+
+    def __len__(self):
+        return len(self.entries)
+
+    def build(self):
+        """(Re)build the deletion index"""
+        with self.lock:
+            if self.built:
+                return
+            plates = list(self.by_folded)
+            hashes = []
+            ids = []
+            for plate_id, folded in enumerate(plates):
+                if len(folded) < self.min_fuzzy_length:
+                    continue
+                for variant in deletion_variants(folded):
+                    hashes.append(hash(variant))
+                    ids.append(plate_id)
+            hashes = np.array(hashes, dtype=np.int64)
+            order = np.argsort(hashes, kind='stable')
+            self.fuzzy = (plates, hashes[order], np.array(ids, dtype=np.int64)[order])
+            self.built = True
+
+    def lookup(self, text):
+        """Best WatchlistMatch for an OCR read, None when no plate is close enough"""
+        key = normalize_plate(text)
+        if not key:
+            return None
+        entry = self.entries.get(key)
+        if entry is not None:
+            return WatchlistMatch(key, entry[0], entry[1], 'exact')
+
+        folded = fold_plate(key)
+        keys = self.by_folded.get(folded)
+        if keys:
+            return self._best(keys, 'confusion')
+        if len(folded) < self.min_fuzzy_length:
+            return None
+
+        if not self.built:
+            self.build()
+        plates, hashes, ids = self.fuzzy
+        queries = np.array([hash(variant) for variant in deletion_variants(folded)], dtype=np.int64)
+        starts = np.searchsorted(hashes, queries, side='left')
+        ends = np.searchsorted(hashes, queries, side='right')
+        candidates = set()
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            if start != end:
+                candidates.update(ids[start:end].tolist())
+        keys = []
+        for plate_id in candidates:
+            other = plates[plate_id]
+            if within_one_edit(folded, other):
+                keys.extend(self.by_folded[other])
+        return self._best(keys, 'fuzzy') if keys else None
+
+    def _best(self, keys, kind):
+        # Deny before allow, then the first plate in sort order for stable results
+        key = min(keys, key=lambda key: (self.entries[key][0] != DENY, key))
+        list_name, info = self.entries[key]
+        return WatchlistMatch(key, list_name, info, kind)
+
+    def stats(self):
+        counts = collections.Counter(list_name for list_name, _ in self.entries.values())
+        return {
+            'plates': len(self.entries),
+            'allow': counts[ALLOW],
+            'deny': counts[DENY],
+            'fuzzy_keys': len(self.fuzzy[1])
+        }
+
+
+class VerdictCache:
+    """Recent per-plate API verdicts, least recently used first out
+
+    Verdicts older than ttl seconds are treated as missing and dropped
+    when looked up; at most capacity plates are kept. Keys are normalized
+    plates, so separators and case in the read do not matter.
+    """
+
+    def __init__(self, capacity=10000, ttl=300.0):
+        self.capacity = capacity
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.verdicts = collections.OrderedDict()
+        self.hit_count = 0
+        self.miss_count = 0
+
+    def get(self, text):
+        key = normalize_plate(text)
+        now = time.monotonic()
+        with self.lock:
+            item = self.verdicts.get(key)
+            if item is None or now - item[1] > self.ttl:
+                if item is not None:
+                    del self.verdicts[key]
+                self.miss_count += 1
+                return None
+            self.verdicts.move_to_end(key)
+            self.hit_count += 1
+            return item[0]
+
+    def put(self, text, verdict):
+        key = normalize_plate(text)
+        if not key:
+            return
+        with self.lock:
+            self.verdicts[key] = (verdict, time.monotonic())
+            self.verdicts.move_to_end(key)
+            while len(self.verdicts) > self.capacity:
+                self.verdicts.popitem(last=False)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'size': len(self.verdicts),
+                'hits': self.hit_count,
+                'misses': self.miss_count
+            }
@@ -0,0 +1,260 @@
+"""
+Process-pool execution mode
+Shards cameras across worker processes that each own their models, capture
+and inference, with a supervisor that restarts workers that die or hang
+"""
+
+import multiprocessing
+import os
+import queue
+import threading
+import time
+
+from detector import LicensePlateDetector
+from inference import InferenceService
+from metrics import pipeline_metrics
+from pipeline import StageCounters
+from streams import StreamState, run_capture
+
+
+def run_worker(worker_id, cameras, config, results, stop_event):
+    """Worker process: capture and detect a shard of cameras until stop_event is set
+
+    Only events, log lines, stream status and stats are put on results;
+    frames stay in the process that decoded them.
+    """
+    def log(message):
+        results.put(('log', worker_id, message))
+
+    try:
+        detector = LicensePlateDetector(**config.get('detector', {}))
+        detector.warm_up()
+    except Exception as e:
+        log(f"Worker {worker_id} failed to load models: {str(e)}")
+        return
+
+    inference = InferenceService(detector, **config.get('inference', {}))
+    streams = {camera.camera_id: StreamState(camera, inference, **config.get('stream', {})) for camera in cameras}
+    counters = StageCounters('capture')
+
+    def on_detections(stream_id, plates, captured_at, error=None):
+        if error is not None:
+            log(f"Error processing {stream_id.upper()} frame: {str(error)}")
+            return
+        for plate in streams[stream_id].events(plates):
+            results.put(('event', stream_id, plate, captured_at))
+
+    def on_status(stream_id, connected):
+        results.put(('status', stream_id, connected))
+
+    inference.start()
+    threads = [
+        threading.Thread(target=run_capture, daemon=True,
+                         args=(state, inference, on_detections, lambda: not stop_event.is_set(), counters, log, on_status))
+        for state in streams.values()
+    ]
+    for thread in threads:
+        thread.start()
+
+    # Poll rather than wait(): a waiter killed inside Event.wait() would
+    # leave the supervisor's set() blocked forever
+    heartbeat_interval = config.get('heartbeat_interval', 1.0)
+    next_heartbeat = 0.0
+    while not stop_event.is_set():
+        if time.monotonic() >= next_heartbeat:
+            results.put(('stats', worker_id, {
+                'capture': counters.stats(),
+                'inference': inference.stats(),
+                'streams': {stream_id: state.stats() for stream_id, state in streams.items()},
+                'metrics': pipeline_metrics.export()
+            }))
+            next_heartbeat = time.monotonic() + heartbeat_interval
+        time.sleep(0.1)
+
+    for thread in threads:
+        thread.join(2.0)
+    inference.stop()
+    # Report vehicles still in view before the process exits
+    for stream_id, state in streams.items():
+        for event in state.flush():
+            results.put(('event', stream_id, event, time.monotonic()))
+
+
+class WorkerSlot:
+    """Supervisor bookkeeping for one shard of cameras"""
+
+    def __init__(self, worker_id, cameras, restart_delay):
+        self.worker_id = worker_id
+        self.cameras = cameras
+        self.process = None
+        self.stop_event = None
+        self.started_at = 0.0
+        self.last_heartbeat = None
+        self.stats = {}
+        self.restarts = 0
+        self.restart_delay = restart_delay
+        self.restart_at = 0.0
+
+
+class WorkerPool:
+    """Runs the enabled cameras of a CameraRegistry in worker processes
+
+    Cameras are dealt round-robin over num_workers processes. Each worker
+    builds its own LicensePlateDetector from config['detector'] and
+    InferenceService from config['inference'] and runs one capture thread
+    per camera, so pre/post-processing of different shards runs on
+    different cores. Results come back through a single multiprocessing
+    queue and are dispatched by a collector thread to
+    on_event(stream_id, plate, captured_at), on_log(message) and
+    on_status(stream_id, connected). The pipeline metrics that come with
+    each heartbeat are absorbed into this process's pipeline_metrics.
+
+    The supervisor restarts a worker that exited, or that sent no
+    heartbeat for heartbeat_timeout seconds (load_timeout before its
+    first one, to cover model loading). Restarts of the same worker wait
+    restart_delay seconds, doubling up to max_restart_delay while it keeps
+    failing within max_restart_delay of starting.
+    """
+
+    def __init__(self, registry, num_workers, config, on_event, on_log=None, on_status=None,
+                 heartbeat_timeout=30.0, load_timeout=300.0, restart_delay=1.0, max_restart_delay=60.0):
+        self.registry = registry
+        self.num_workers = num_workers
+        self.config = config
+        self.on_event = on_event
+        self.on_log = on_log
+        self.on_status = on_status
+        self.heartbeat_timeout = heartbeat_timeout
+        self.load_timeout = load_timeout
+        self.restart_delay = restart_delay
+        self.max_restart_delay = max_restart_delay
+
+        # Spawned, not forked: the parent runs threads and possibly a UI
+        self.context = multiprocessing.get_context('spawn')
+        self.results = None
+        self.workers = []
+        self.running = False
+        self.threads = []
+
+    def start(self):
+        if self.running:
+            return
+        # Spawned children re-import the main module; keep Kivy from
+        # parsing their multiprocessing command line
+        os.environ.setdefault('KIVY_NO_ARGS', '1')
+        self.results = self.context.Queue()
+        self.workers = [
+            WorkerSlot(worker_id, cameras, self.restart_delay)
+            for worker_id, cameras in enumerate(self.registry.shards(self.num_workers))
+        ]
+        self.running = True
+        for worker in self.workers:
+            self._spawn(worker)
+        self.threads = [
+            threading.Thread(target=self._collect, daemon=True),
+            threading.Thread(target=self._supervise, daemon=True)
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self, timeout=5.0):
+        """Ask workers to flush and exit, terminating those that do not"""
+        if not self.running:
+            return
+        self.running = False
+        for worker in self.workers:
+            if worker.stop_event:
+                worker.stop_event.set()
+        deadline = time.monotonic() + timeout
+        for worker in self.workers:
+            if worker.process:
+                worker.process.join(max(0.0, deadline - time.monotonic()))
+                if worker.process.is_alive():
+                    worker.process.terminate()
+                    worker.process.join(1.0)
+        for thread in self.threads:
+            thread.join(timeout)
+        self.threads = []
+
+    def stats(self):
+        now = time.monotonic()
+        return {
+            worker.worker_id: {
+                'pid': worker.process.pid if worker.process else None,
+                'alive': bool(worker.process and worker.process.is_alive()),
+                'cameras': [camera.camera_id for camera in worker.cameras],
+                'restarts': worker.restarts,
+                'heartbeat_age': now - worker.last_heartbeat if worker.last_heartbeat else None,
+                'stats': worker.stats
+            }
+            for worker in self.workers
+        }
+
+    def _spawn(self, worker):
+        # A fresh event per process, so one that was killed cannot affect the next
+        worker.stop_event = self.context.Event()
+        worker.process = self.context.Process(
+            target=run_worker,
+            args=(worker.worker_id, worker.cameras, self.config, self.results, worker.stop_event),
+            name=f"anpr-worker-{worker.worker_id}",
+            daemon=True
+        )
+        worker.started_at = time.monotonic()
+        worker.last_heartbeat = None
+        worker.process.start()
+
+    def _supervise(self, interval=1.0):
+        while self.running:
+            now = time.monotonic()
+            for worker in self.workers:
+                process = worker.process
+                if process is not None and process.is_alive():
+                    timeout = self.heartbeat_timeout if worker.last_heartbeat else self.load_timeout
+                    if now - (worker.last_heartbeat or worker.started_at) > timeout:
+                        self._log(f"Worker {worker.worker_id} stopped responding, terminating it")
+                        process.terminate()
+                    continue
+
+                if process is not None:
+                    # Back off only while the worker keeps dying soon after starting
+                    if now - worker.started_at > self.max_restart_delay:
+                        worker.restart_delay = self.restart_delay
+                    self._log(f"Worker {worker.worker_id} exited with code {process.exitcode}, "
+                              f"restarting in {worker.restart_delay:.0f}s")
+                    worker.process = None
+                    worker.restart_at = now + worker.restart_delay
+                    worker.restart_delay = min(worker.restart_delay * 2, self.max_restart_delay)
+                elif self.running and now >= worker.restart_at:
+                    worker.restarts += 1
+                    self._spawn(worker)
+            time.sleep(interval)
+
+    def _collect(self):
+        while True:
+            try:
+                message = self.results.get(timeout=0.5)
+            except queue.Empty:
+                if not self.running:
+                    return
+                continue
+
+            kind = message[0]
+            if kind == 'event':
+                _, stream_id, plate, captured_at = message
+                self.on_event(stream_id, plate, captured_at)
+            elif kind == 'stats':
+                _, worker_id, stats = message
+                worker = self.workers[worker_id]
+                worker.last_heartbeat = time.monotonic()
+                if 'metrics' in stats:
+                    pipeline_metrics.absorb(f"worker{worker_id}", stats.pop('metrics'))
+                worker.stats = stats
+            elif kind == 'status':
+                if self.on_status:
+                    self.on_status(message[1], message[2])
+            elif kind == 'log':
+                self._log(message[2])
+
+    def _log(self, message):
+        if self.on_log:
+            self.on_log(message)